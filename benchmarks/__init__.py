@@ -0,0 +1,4 @@
+"""
+Offline benchmarks for KAI
+Run with: python -m benchmarks.run --out results.json
+"""
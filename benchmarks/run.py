@@ -0,0 +1,306 @@
+"""
+KAI benchmark suite - runs offline, writes JSON
+
+    python -m benchmarks.run --out bench.json
+    python -m benchmarks.run --sizes 1000,10000 --skip generation
+    python -m benchmarks.run --compare base.json bench.json
+
+Covers CommandRouter.route overhead, TaskTool / StudyTool operations at
+several store sizes, Memory prompt assembly, and KaiLLM tokens/sec and
+time-to-first-token on a tiny random local model, and assisted decoding
+(acceptance rate, speedup) for KAI_BENCH_TARGET / KAI_BENCH_DRAFT.
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+SUITES = ["router", "tasks", "notes", "memory", "generation", "speculative"]
+
+def timed(fn, repeat=1):
+    """Seconds per call of fn (average over `repeat` calls)"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+def sample(fn, runs=5, repeat=1):
+    """Median seconds per call over several runs (less sensitive to noise)"""
+    return statistics.median(timed(fn, repeat) for _ in range(runs))
+
+def result(name, seconds, n=None, unit="us", per=1):
+    """One benchmark row; `per` divides the time (e.g. per record)"""
+    scale = {"us": 1e6, "ms": 1e3, "s": 1.0}[unit]
+    row = {"name": name, "value": round(seconds * scale / per, 3), "unit": f"{unit}/op"}
+    if n is not None:
+        row["n"] = n
+    return row
+
+class NoopTool:
+    """Tool that does nothing, isolating the router's own cost"""
+    
+    def execute(self, args):
+        return "ok"
+
+def bench_router(workdir, sizes):
+    """Dispatch overhead of CommandRouter.route"""
+    from kai.router import CommandRouter
+    
+    os.chdir(workdir)
+    router = CommandRouter(prefetch=False)
+    router.register("/noop", NoopTool)
+    router.route("/noop")
+    
+    return [
+        result("router.route.noop", sample(lambda: router.route("/noop some args"), repeat=10000)),
+        result("router.route.help", sample(lambda: router.route("/help"), repeat=10000)),
+        result("router.route.unknown", sample(lambda: router.route("/missing x"), repeat=10000)),
+        result("router.route.task_add", sample(lambda: router.route("/task add benchmark"), repeat=1000))
+    ]
+
+def bench_tasks(workdir, sizes):
+    """TaskTool operations against stores of different sizes"""
+    from kai.tools.task_tool import TaskTool
+    
+    rows = []
+    for n in sizes:
+        data_file = os.path.join(workdir, f"tasks_{n}.json")
+        tool = TaskTool(data_file=data_file)
+        
+        def fill():
+            with tool.batch():
+                for i in range(n):
+                    tool.execute(f"add task number {i}")
+        
+        rows.append(result("tasks.add", timed(fill), n, per=n))
+        rows.append(result("tasks.done_one", sample(lambda: tool.execute(f"done {n // 2}"), repeat=100), n))
+        rows.append(result("tasks.done_range_100", sample(lambda: tool.execute("done 1-100"), repeat=10), n, unit="ms"))
+        rows.append(result("tasks.list", sample(lambda: tool.execute("list"), runs=3), n, unit="ms"))
+        
+        def write():
+            tool.execute("done 1")
+            tool.flush()
+        
+        rows.append(result("tasks.flush", sample(write, runs=3), n, unit="ms"))
+        rows.append(result("tasks.load", sample(lambda: TaskTool(data_file=data_file), runs=3), n, unit="ms"))
+    return rows
+
+def bench_notes(workdir, sizes):
+    """StudyTool / NoteStore operations against stores of different sizes"""
+    from kai.tools.study_tool import StudyTool
+    
+    words = ("derivative integral limit cell mitosis enzyme protein market supply demand "
+             "atom molecule energy force velocity history empire treaty poem metaphor").split()
+    rows = []
+    
+    for n in sizes:
+        tool = StudyTool(data_file=os.path.join(workdir, f"notes_{n}.json"))
+        
+        def fill():
+            with tool.batch():
+                for i in range(n):
+                    note = " ".join(words[(i * 7 + k) % len(words)] for k in range(8))
+                    tool.store.add(f"topic{i % 100}", f"{note} {i}")
+        
+        rows.append(result("notes.add_bulk", timed(fill), n, per=n))
+        counter = iter(range(10 ** 9))
+        rows.append(result("notes.save", sample(lambda: tool.execute(f"save extra note {next(counter)}"), repeat=100), n))
+        rows.append(result("notes.show", sample(lambda: tool.execute("show topic7"), repeat=20), n, unit="ms"))
+        rows.append(result("notes.list", sample(lambda: tool.execute("list"), repeat=20), n, unit="ms"))
+        rows.append(result("notes.search", sample(lambda: tool.execute("search enzyme velocity"), repeat=20), n, unit="ms"))
+        tool.store.close()
+    return rows
+
+def bench_memory(workdir, sizes):
+    """Prompt assembly from Memory (with and without a recall index)"""
+    from kai.memory import Memory
+    from kai.vector_index import VectorIndex
+    
+    rows = []
+    for name, index in [("memory.build_messages", None),
+                        ("memory.build_messages.recall", VectorIndex(os.path.join(workdir, "recall")))]:
+        memory = Memory(max_tokens=768, index=index)
+        counter = iter(range(10 ** 9))
+        
+        def turn():
+            i = next(counter)
+            memory.add_message("user", f"question {i} about derivatives and cells and history")
+            memory.add_message("assistant", f"answer {i} with a few more words to fill the window")
+            memory.build_messages("You are KAI, a helpful assistant.", query=f"question {i}")
+        
+        for _ in range(200):
+            turn()
+        rows.append(result(name, sample(turn, repeat=100)))
+    return rows
+
+def bench_generation(workdir, sizes):
+    """Tokens/sec and time-to-first-token on a tiny random local model"""
+    from benchmarks.tiny_model import build_tiny_model
+    from kai.llm import KaiLLM
+    
+    llm = KaiLLM(model=build_tiny_model(os.path.join(workdir, "tiny-model")), greedy=True)
+    prompt = "User: Explain what a derivative is.\nAssistant:"
+    llm._generate_batch([prompt], 4)
+    rows = []
+    
+    for batch_size in (1, 4):
+        tokens = []
+        
+        def run():
+            tokens.append(sum(count for _, count in llm._generate_batch([prompt] * batch_size, 64)))
+        
+        seconds = sample(run, runs=3)
+        rows.append({"name": "generation.tokens_per_sec", "batch": batch_size,
+                     "value": round(statistics.median(tokens) / seconds, 1), "unit": "tokens/s"})
+    
+    ttfts = []
+    for i in range(5):
+        messages = [{"role": "user", "content": f"Tell me something about topic {i}."}]
+        for _ in llm.chat(messages, stream=True, max_new_tokens=32, cache_key=f"bench{i}"):
+            pass
+        ttfts.append(llm.last_timing["ttft"])
+    rows.append(result("generation.ttft", statistics.median(ttfts), unit="ms"))
+    return rows
+
+def bench_speculative(workdir, sizes):
+    """
+    Assisted decoding: draft acceptance rate and speedup over the target alone
+    
+    Uses KAI_BENCH_TARGET / KAI_BENCH_DRAFT when set (e.g. TinyLlama with
+    distilgpt2). The default tiny random models share a tokenizer and only
+    exercise the code path; their acceptance says nothing about real models.
+    """
+    from benchmarks.tiny_model import build_tiny_model
+    from kai.llm import KaiLLM
+    
+    target = os.environ.get("KAI_BENCH_TARGET") or build_tiny_model(
+        os.path.join(workdir, "tiny-target"), n_embd=128, n_layer=4, n_head=4, seed=1)
+    draft = os.environ.get("KAI_BENCH_DRAFT") or build_tiny_model(
+        os.path.join(workdir, "tiny-draft"), seed=2)
+    
+    llm = KaiLLM(model=target, greedy=True, assistant_model=draft)
+    if not llm.use_assistant(True):
+        print("⚠️  Assisted decoding unavailable, skipping", file=sys.stderr)
+        return []
+    
+    prompts = [[{"role": "user", "content": f"Explain topic {i} in a few sentences."}] for i in range(5)]
+    
+    def run_all():
+        for messages in prompts:
+            llm.chat(messages, max_new_tokens=64, cache_key=None)
+    
+    llm.use_assistant(False)
+    base = sample(run_all, runs=3)
+    llm.use_assistant(True)
+    acceptance = []
+    tokens_per_pass = []
+    
+    def run_assisted():
+        for messages in prompts:
+            llm.chat(messages, max_new_tokens=64, cache_key=None)
+            acceptance.append(llm.last_assist.get("acceptance", 0.0))
+            tokens_per_pass.append(llm.last_assist.get("tokens_per_pass", 1.0))
+    
+    assisted = sample(run_assisted, runs=3)
+    return [
+        result("speculative.target_only", base, unit="ms", per=len(prompts)),
+        result("speculative.assisted", assisted, unit="ms", per=len(prompts)),
+        {"name": "speculative.acceptance", "value": round(statistics.mean(acceptance), 3), "unit": "ratio"},
+        {"name": "speculative.tokens_per_pass", "value": round(statistics.mean(tokens_per_pass), 3), "unit": "tokens"},
+        {"name": "speculative.speedup", "value": round(base / assisted, 3), "unit": "x"}
+    ]
+
+def metadata():
+    """Environment the numbers were measured in"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, cwd=os.path.dirname(__file__)).stdout.strip() or None
+    except OSError:
+        commit = None
+    
+    return {
+        "commit": commit,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count()
+    }
+
+def run(suites, sizes):
+    """Run the selected suites in a scratch directory"""
+    cwd = os.getcwd()
+    results = []
+    
+    with tempfile.TemporaryDirectory(prefix="kai-bench-") as workdir:
+        try:
+            for suite in suites:
+                print(f"⏱️  {suite}...", file=sys.stderr)
+                results.extend(globals()[f"bench_{suite}"](workdir, sizes))
+        finally:
+            os.chdir(cwd)
+    
+    return {"meta": metadata(), "results": results}
+
+def row_key(row):
+    """Identity of a result row across runs"""
+    return (row["name"], row.get("n"), row.get("batch"))
+
+def compare(base_file, new_file):
+    """Print the change of every metric between two result files"""
+    with open(base_file) as f:
+        base = {row_key(row): row for row in json.load(f)["results"]}
+    with open(new_file) as f:
+        new = json.load(f)["results"]
+    
+    print(f"{'benchmark':<32} {'n':>7} {'base':>10} {'new':>10} {'change':>8}")
+    for row in new:
+        old = base.get(row_key(row))
+        size = row.get("n", row.get("batch", ""))
+        if old is None or not old["value"]:
+            print(f"{row['name']:<32} {size:>7} {'-':>10} {row['value']:>10}")
+            continue
+        change = (row["value"] - old["value"]) / old["value"] * 100
+        print(f"{row['name']:<32} {size:>7} {old['value']:>10} {row['value']:>10} {change:>+7.1f}%  {row['unit']}")
+
+def main():
+    """Command-line entry point"""
+    parser = argparse.ArgumentParser(description="KAI offline benchmarks")
+    parser.add_argument("--out", help="Write results JSON here (default: stdout)")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="Store sizes for tasks/notes")
+    parser.add_argument("--only", help=f"Comma-separated suites ({', '.join(SUITES)})")
+    parser.add_argument("--skip", default="", help="Comma-separated suites to skip")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"), help="Compare two result files")
+    args = parser.parse_args()
+    
+    if args.compare:
+        compare(*args.compare)
+        return
+    
+    suites = args.only.split(",") if args.only else SUITES
+    suites = [suite for suite in suites if suite not in args.skip.split(",")]
+    sizes = [int(size) for size in args.sizes.split(",")]
+    
+    # Keep stdout for the JSON report; progress and model messages go to stderr
+    out = sys.stdout
+    sys.stdout = sys.stderr
+    try:
+        report = json.dumps(run(suites, sizes), indent=2)
+    finally:
+        sys.stdout = out
+    
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(report + "\n")
+        print(f"✅ Results written to {args.out}", file=sys.stderr)
+    else:
+        print(report)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Storage stress test - several KAI processes writing to one data directory
+
+    python -m benchmarks.stress --procs 1,2,4,8 --ops 200 --out stress.json
+
+Every process adds tasks (completing every fifth one it added) and study
+notes concurrently. Afterwards every write must be present exactly once;
+the run exits non-zero if anything was lost or duplicated.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+def writer(workdir, worker, ops, results):
+    """One KAI process: interleaved task and note writes"""
+    from kai.metrics import metrics
+    from kai.tools.note_store import NoteStore
+    from kai.tools.task_tool import TaskTool
+    
+    # A short write-behind delay so processes flush (and collide) constantly
+    tool = TaskTool(data_file=os.path.join(workdir, "tasks.json"), flush_delay=0.005)
+    store = NoteStore(os.path.join(workdir, "notes.db"))
+    
+    start = time.perf_counter()
+    for i in range(ops):
+        description = f"w{worker}-{i}"
+        if i % 5 == 4:
+            # Like batch mode: the id of a pending add is stable until the group is written
+            with tool.batch():
+                tool.execute(f"add {description}")
+                task_id = next(task["id"] for task in tool.tasks.values() if task["description"] == description)
+                tool.execute(f"done {task_id}")
+        else:
+            tool.execute(f"add {description}")
+        store.add(f"topic{worker % 4}", description)
+    tool.flush()
+    seconds = time.perf_counter() - start
+    store.close()
+    
+    _, counters = metrics.snapshot()
+    merges = sum(value for name, _, value in counters if name == "storage_merges")
+    results.put({"worker": worker, "seconds": seconds, "merges": merges})
+
+def verify(workdir, procs, ops):
+    """Count lost, duplicated and wrongly completed writes"""
+    from kai.tools.note_store import NoteStore
+    
+    expected = {f"w{worker}-{i}" for worker in range(procs) for i in range(ops)}
+    
+    with open(os.path.join(workdir, "tasks.json")) as f:
+        data = json.load(f)
+    tasks = data["tasks"]
+    descriptions = [task["description"] for task in tasks]
+    ids = [task["id"] for task in tasks]
+    wrong_status = sum(
+        1 for task in tasks
+        if task["completed"] != (int(task["description"].rsplit("-", 1)[1]) % 5 == 4)
+    )
+    
+    store = NoteStore(os.path.join(workdir, "notes.db"))
+    notes = [note for _, note in store.iter_notes()]
+    counted = sum(count for _, count in store.topics())
+    store.close()
+    
+    return {
+        "lost_tasks": len(expected - set(descriptions)),
+        "duplicate_tasks": len(descriptions) - len(set(descriptions)),
+        "duplicate_ids": len(ids) - len(set(ids)),
+        "wrong_status": wrong_status,
+        "lost_notes": len(expected - set(notes)),
+        "duplicate_notes": len(notes) - len(set(notes)),
+        "topic_count_error": counted - len(notes),
+        "version": data.get("version", 0)
+    }
+
+def stress(procs, ops):
+    """Run `procs` writer processes against a fresh data directory"""
+    context = multiprocessing.get_context("spawn")
+    
+    with tempfile.TemporaryDirectory(prefix="kai-stress-") as workdir:
+        results = context.Queue()
+        workers = [context.Process(target=writer, args=(workdir, worker, ops, results)) for worker in range(procs)]
+        
+        start = time.perf_counter()
+        for process in workers:
+            process.start()
+        reports = [results.get() for _ in workers]
+        for process in workers:
+            process.join()
+        seconds = time.perf_counter() - start
+        
+        row = {"procs": procs, "ops": ops, "seconds": round(seconds, 3),
+               "writes_per_second": round(procs * ops * 2 / seconds, 1),
+               "merges": sum(report["merges"] for report in reports)}
+        row.update(verify(workdir, procs, ops))
+        row["ok"] = all(row[key] == 0 for key in ("lost_tasks", "duplicate_tasks", "duplicate_ids", "wrong_status",
+                                                   "lost_notes", "duplicate_notes", "topic_count_error"))
+        return row
+
+def main():
+    """Command-line entry point"""
+    from benchmarks.run import metadata
+    
+    parser = argparse.ArgumentParser(description="KAI multi-process storage stress test")
+    parser.add_argument("--procs", default="1,2,4,8", help="Comma-separated process counts")
+    parser.add_argument("--ops", type=int, default=200, help="Tasks and notes added per process")
+    parser.add_argument("--out", help="Write results JSON here (default: stdout)")
+    args = parser.parse_args()
+    
+    rows = []
+    for procs in (int(count) for count in args.procs.split(",")):
+        print(f"⏱️  {procs} processes...", file=sys.stderr)
+        row = stress(procs, args.ops)
+        print(f"{'✅' if row['ok'] else '❌'} {procs} processes: {row['writes_per_second']} writes/s, "
+              f"{row['merges']} merges", file=sys.stderr)
+        rows.append(row)
+    
+    report = json.dumps({"meta": metadata(), "results": rows}, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(report + "\n")
+        print(f"✅ Results written to {args.out}", file=sys.stderr)
+    else:
+        print(report)
+    
+    if not all(row["ok"] for row in rows):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
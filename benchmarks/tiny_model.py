@@ -0,0 +1,59 @@
+"""
+Tiny randomly initialized GPT-2 for offline benchmarks
+Tokenizer and weights are built locally - nothing is downloaded
+"""
+
+import os
+
+# Text the byte-level BPE tokenizer is trained on (only its merges matter)
+CORPUS = """
+User: What is a derivative? Assistant: A derivative measures the rate of change.
+User: Add a task to study biology. Assistant: Task added. Anything else?
+The quick brown fox jumps over the lazy dog. Notes about calculus, limits and integrals.
+You are KAI, a helpful local assistant. Keep answers short and friendly.
+"""
+
+def build_tiny_model(path, vocab_size=512, n_embd=64, n_layer=2, n_head=2, seed=0):
+    """
+    Save a tiny GPT-2 model and tokenizer to `path` (skipped if already there)
+    
+    Args:
+        path: Output directory, loadable with KaiLLM(model=path)
+        vocab_size: Tokenizer / embedding vocabulary size
+        n_embd, n_layer, n_head: Model size
+        seed: Weight initialization seed
+    
+    Returns:
+        path
+    """
+    if os.path.exists(os.path.join(path, "config.json")):
+        return path
+    
+    import torch
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers, trainers
+    from transformers import GPT2Config, GPT2LMHeadModel, PreTrainedTokenizerFast
+    
+    tokenizer = Tokenizer(models.BPE())
+    tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    tokenizer.decoder = decoders.ByteLevel()
+    trainer = trainers.BpeTrainer(
+        vocab_size=vocab_size,
+        special_tokens=["<|endoftext|>"],
+        initial_alphabet=pre_tokenizers.ByteLevel.alphabet()
+    )
+    tokenizer.train_from_iterator(CORPUS.splitlines() * 20, trainer)
+    
+    fast = PreTrainedTokenizerFast(tokenizer_object=tokenizer, eos_token="<|endoftext|>",
+                                   bos_token="<|endoftext|>", unk_token="<|endoftext|>")
+    
+    torch.manual_seed(seed)
+    config = GPT2Config(
+        vocab_size=fast.vocab_size, n_positions=1024, n_embd=n_embd, n_layer=n_layer,
+        n_head=n_head, bos_token_id=fast.eos_token_id, eos_token_id=fast.eos_token_id
+    )
+    model = GPT2LMHeadModel(config)
+    
+    os.makedirs(path, exist_ok=True)
+    model.save_pretrained(path)
+    fast.save_pretrained(path)
+    return path
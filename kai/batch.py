@@ -0,0 +1,222 @@
+"""
+Batch mode - run KAI non-interactively
+Reads one command or prompt per line from a file or stdin and writes one
+JSON result per line to stdout
+    
+    python main.py --batch commands.txt > results.jsonl
+    cat commands.txt | python main.py --batch - --llm-workers 4
+
+Lines starting with "#" are skipped. Consecutive commands for the same
+tool share one storage transaction / flush (at most MAX_GROUP_SIZE commands
+or MAX_GROUP_SECONDS, and closed whenever the runner waits for input;
+commands that wait on the LLM, like quizzes, run outside it). Prompts (lines without "/") are independent and can run on a
+worker pool.
+"""
+
+import json
+import queue
+import sys
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import nullcontext
+from threading import Thread
+
+# Tokens generated per prompt
+MAX_NEW_TOKENS = 100
+# Commands grouped into one transaction at most, and seconds a group keeps it open
+MAX_GROUP_SIZE = 1000
+MAX_GROUP_SECONDS = 1.0
+# Input lines read ahead of processing
+READ_AHEAD = 1024
+# Marks the end of input in the reader queue
+_END = object()
+
+class BatchRunner:
+    """Streams commands through a CommandRouter and prompts through KaiLLM"""
+    
+    def __init__(self, router, llm=None, system_prompt=None, llm_workers=0, out=None):
+        """
+        Args:
+            router: CommandRouter
+            llm: KaiLLM for prompt lines (None = prompts fail)
+            system_prompt: System context for prompts
+            llm_workers: Threads generating prompts concurrently (micro-batched);
+                         0 runs prompts one at a time
+            out: Text stream for JSONL results (default: stdout)
+        """
+        self.router = router
+        self.llm = llm
+        self.system_prompt = system_prompt
+        self.llm_workers = llm_workers
+        self.out = out or sys.stdout
+        self.stats = {"commands": 0, "prompts": 0, "errors": 0, "seconds": 0.0}
+        self._pool = None
+        self._results = deque()
+    
+    def run(self, lines):
+        """
+        Process every line, writing results in input order
+        
+        Args:
+            lines: Iterable of input lines (read lazily)
+        
+        Returns:
+            Stats dict: commands, prompts, errors, seconds
+        """
+        start = time.perf_counter()
+        if self.llm is not None and self.llm_workers > 0:
+            self.llm.enable_batching(max_batch_size=self.llm_workers)
+            self._pool = ThreadPoolExecutor(self.llm_workers, thread_name_prefix="kai-batch")
+        
+        group = None
+        group_command = None
+        group_size = 0
+        group_started = 0.0
+        # Lines are read on a thread, so an open group never waits on slow input (e.g. a pipe)
+        inbox = queue.Queue(maxsize=READ_AHEAD)
+        Thread(target=_read_lines, args=(lines, inbox), daemon=True, name="kai-batch-reader").start()
+        number = 0
+        
+        try:
+            while True:
+                try:
+                    line = inbox.get_nowait()
+                except queue.Empty:
+                    # Nothing to read right now: commit the open group before waiting
+                    self._end_group(group)
+                    group = None
+                    group_command = None
+                    line = self._wait_for_line(inbox)
+                
+                if line is _END:
+                    break
+                if isinstance(line, Exception):
+                    raise line
+                number += 1
+                text = line.strip()
+                if not text or text.startswith("#"):
+                    continue
+                
+                command = text.split(None, 1)[0].lower() if self.router.is_command(text) else None
+                # Slow commands (e.g. quizzes) run outside any group, so they never hold its write lock
+                grouped = command is None or not self.router.generates(text)
+                if (not grouped or command != group_command or group_size >= MAX_GROUP_SIZE
+                        or time.perf_counter() - group_started >= MAX_GROUP_SECONDS):
+                    self._end_group(group)
+                    group = self._begin_group(command) if grouped else None
+                    group_command = command if grouped else None
+                    group_size = 0
+                    group_started = time.perf_counter()
+                group_size += 1
+                
+                if command:
+                    self._results.append(self._run_command(number, text))
+                else:
+                    self._results.append(self._submit_prompt(number, text))
+                self._write_ready()
+            
+            self._end_group(group)
+            group = None
+        finally:
+            if group is not None:
+                self._end_group(group)
+            self._write_ready(wait=True)
+            if self._pool is not None:
+                self._pool.shutdown()
+                self.llm.disable_batching()
+        
+        self.stats["seconds"] = time.perf_counter() - start
+        return self.stats
+    
+    def report(self, stream=None):
+        """Print a throughput summary (to stderr by default, keeping stdout pure JSONL)"""
+        stream = stream or sys.stderr
+        total = self.stats["commands"] + self.stats["prompts"]
+        seconds = self.stats["seconds"]
+        rate = total / seconds if seconds else 0.0
+        print(f"✅ {total} lines ({self.stats['commands']} commands, {self.stats['prompts']} prompts, "
+              f"{self.stats['errors']} errors) in {seconds:.2f}s - {rate:.1f}/s", file=stream)
+    
+    def _begin_group(self, command):
+        """Open the tool's batch context (one transaction / flush for the group)"""
+        tool = self.router.tool(command) if command else None
+        context = tool.batch() if hasattr(tool, "batch") else nullcontext()
+        context.__enter__()
+        return context
+    
+    def _end_group(self, context):
+        """Close a group's batch context, committing its writes"""
+        if context is not None:
+            context.__exit__(None, None, None)
+    
+    def _wait_for_line(self, inbox):
+        """Block for the next input line, writing prompt results as they finish meanwhile"""
+        while True:
+            try:
+                return inbox.get(timeout=0.1)
+            except queue.Empty:
+                self._write_ready()
+    
+    def _run_command(self, number, text):
+        """Route one command now (commands depend on each other's state)"""
+        started = time.perf_counter()
+        try:
+            output = self.router.route(text)
+            if not isinstance(output, str):
+                output = "".join(output)
+            result = {"line": number, "input": text, "ok": not output.startswith("❌"), "output": output}
+        except Exception as e:
+            result = {"line": number, "input": text, "ok": False, "error": str(e)}
+        result["seconds"] = round(time.perf_counter() - started, 6)
+        self.stats["commands"] += 1
+        return result
+    
+    def _submit_prompt(self, number, text):
+        """Generate a reply for one prompt, on the pool when there is one"""
+        self.stats["prompts"] += 1
+        if self._pool is not None:
+            return self._pool.submit(self._generate, number, text)
+        
+        future = Future()
+        future.set_result(self._generate(number, text))
+        return future
+    
+    def _generate(self, number, text):
+        """Prompt -> result dict"""
+        started = time.perf_counter()
+        if self.llm is None:
+            result = {"line": number, "input": text, "ok": False, "error": "LLM not available"}
+        else:
+            try:
+                output = self.llm.generate(text, system_prompt=self.system_prompt,
+                                           max_new_tokens=MAX_NEW_TOKENS)
+                result = {"line": number, "input": text, "ok": not output.startswith("❌"), "output": output}
+            except Exception as e:
+                result = {"line": number, "input": text, "ok": False, "error": str(e)}
+        result["seconds"] = round(time.perf_counter() - started, 6)
+        return result
+    
+    def _write_ready(self, wait=False):
+        """Write finished results from the front of the queue (all of them when wait)"""
+        while self._results:
+            head = self._results[0]
+            if isinstance(head, Future):
+                if not wait and not head.done():
+                    return
+                head = head.result()
+            self._results.popleft()
+            if not head["ok"]:
+                self.stats["errors"] += 1
+            self.out.write(json.dumps(head, ensure_ascii=False) + "\n")
+            # Line by line, so a consumer of the pipe sees results as they are ready
+            self.out.flush()
+
+def _read_lines(lines, inbox):
+    """Reader thread: queue every input line, then _END (or the exception that stopped reading)"""
+    try:
+        for line in lines:
+            inbox.put(line)
+        inbox.put(_END)
+    except Exception as e:
+        inbox.put(e)
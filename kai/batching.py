@@ -0,0 +1,173 @@
+"""
+Micro-batching for KaiLLM
+Groups concurrent generate() calls into batched forward passes
+"""
+
+import queue
+import time
+from concurrent.futures import Future
+from threading import Thread
+
+class MicroBatcher:
+    """Collects generation requests and runs them through KaiLLM in batches"""
+    
+    def __init__(self, llm, max_batch_size=8, max_wait_ms=20):
+        """
+        Start the batching worker
+        
+        Args:
+            llm: KaiLLM instance used for batched generation
+            max_batch_size: Max prompts per forward pass
+            max_wait_ms: How long the first request waits for others to join
+        """
+        self.llm = llm
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.batches = 0
+        self.requests = 0
+        self.tokens = 0
+        self.busy_time = 0.0
+        self._queue = queue.Queue()
+        self._worker = Thread(target=self._run, daemon=True)
+        self._worker.start()
+    
+    def submit(self, full_prompt, max_new_tokens=100, stop=(), signal=None):
+        """
+        Queue a complete prompt for generation
+        
+        Args:
+            full_prompt: Prompt text (system context already applied)
+            max_new_tokens: Max tokens to generate
+            stop: Stop sequences ending the response
+            signal: Optional StopSignal ending this prompt's generation
+                    (also while it is still queued)
+            
+        Returns:
+            Future resolving to the generated text (what was generated
+            before the signal fired, if it did)
+        """
+        future = Future()
+        self._queue.put((full_prompt, (max_new_tokens, tuple(stop)), signal, future))
+        return future
+    
+    def close(self):
+        """Finish queued requests and stop the worker"""
+        self._queue.put(None)
+        self._worker.join()
+    
+    def stats(self):
+        """Batching counters and throughput while the worker was busy"""
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "avg_batch_size": self.requests / self.batches if self.batches else 0.0,
+            "tokens_per_sec": self.tokens / self.busy_time if self.busy_time else 0.0
+        }
+    
+    def _run(self):
+        """Worker loop: gather a batch within the wait window, then generate"""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            
+            batch = [item]
+            deadline = time.monotonic() + self.max_wait
+            stop = False
+            
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            
+            self._process(batch)
+            if stop:
+                return
+    
+    def _process(self, batch):
+        """Generate one batch per distinct token budget / stop sequences and resolve futures"""
+        groups = {}
+        for full_prompt, limits, signal, future in batch:
+            if signal is not None and signal.check():
+                # Cancelled or timed out while queued
+                future.set_result("")
+                continue
+            groups.setdefault(limits, []).append((full_prompt, signal, future))
+        
+        for (max_new_tokens, stop), items in groups.items():
+            start = time.perf_counter()
+            try:
+                results = self.llm._generate_batch([prompt for prompt, _, _ in items], max_new_tokens, stop=stop,
+                                                   signals=[signal for _, signal, _ in items])
+            except Exception as e:
+                for _, _, future in items:
+                    future.set_result(f"❌ Error generating response: {str(e)}")
+                continue
+            
+            self.busy_time += time.perf_counter() - start
+            self.batches += 1
+            self.requests += len(items)
+            for (_, _, future), (text, count) in zip(items, results):
+                self.tokens += count
+                future.set_result(text)
+
+def measure_throughput(llm, prompts, batch_sizes=(1, 2, 4, 8), max_new_tokens=32):
+    """
+    Measure generation throughput for different batch sizes
+    
+    Args:
+        llm: Loaded KaiLLM instance
+        prompts: Complete prompts to generate from
+        batch_sizes: Batch sizes to compare
+        max_new_tokens: Tokens generated per prompt
+        
+    Returns:
+        List of dicts with batch_size, seconds, prompts_per_sec, tokens_per_sec
+    """
+    results = []
+    
+    for batch_size in batch_sizes:
+        tokens = 0
+        start = time.perf_counter()
+        for i in range(0, len(prompts), batch_size):
+            for _, count in llm._generate_batch(prompts[i:i + batch_size], max_new_tokens):
+                tokens += count
+        elapsed = time.perf_counter() - start
+        
+        results.append({
+            "batch_size": batch_size,
+            "seconds": elapsed,
+            "prompts_per_sec": len(prompts) / elapsed,
+            "tokens_per_sec": tokens / elapsed
+        })
+    
+    return results
+
+if __name__ == "__main__":
+    import argparse
+    from kai.llm import KaiLLM
+    
+    parser = argparse.ArgumentParser(description="Measure KaiLLM throughput vs batch size")
+    parser.add_argument("--model", default="distilgpt2")
+    parser.add_argument("--prompts", type=int, default=16)
+    parser.add_argument("--max-new-tokens", type=int, default=32)
+    args = parser.parse_args()
+    
+    llm = KaiLLM(model=args.model)
+    if not llm.is_available():
+        raise SystemExit(1)
+    
+    prompts = [llm._build_prompt(f"Tell me fact number {i} about study habits.", "You are KAI.")
+               for i in range(args.prompts)]
+    
+    print(f"{'batch':>5}  {'seconds':>8}  {'prompts/s':>9}  {'tokens/s':>9}")
+    for row in measure_throughput(llm, prompts, max_new_tokens=args.max_new_tokens):
+        print(f"{row['batch_size']:>5}  {row['seconds']:>8.2f}  {row['prompts_per_sec']:>9.2f}  {row['tokens_per_sec']:>9.1f}")
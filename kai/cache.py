@@ -0,0 +1,173 @@
+"""
+Response cache for deterministic generation
+In-memory LRU tier backed by a size-bounded on-disk tier under data/
+"""
+
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from threading import Lock
+
+class ResponseCache:
+    """Two-tier cache of generated text keyed by model, prompt and sampling parameters"""
+    
+    def __init__(self, cache_dir="data/llm_cache", max_memory_entries=256, max_disk_bytes=50 * 1024 * 1024):
+        """
+        Initialize cache
+        
+        Args:
+            cache_dir: Directory for the on-disk tier (None for memory only)
+            max_memory_entries: Entries kept in the in-memory LRU tier
+            max_disk_bytes: Disk tier size before the oldest entries are evicted
+        """
+        self.cache_dir = cache_dir
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._disk_bytes = 0
+        self._lock = Lock()
+        
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._disk_bytes = sum(size for _, size, _ in self._disk_entries())
+    
+    @staticmethod
+    def make_key(model_name, prompt, params):
+        """
+        Build a cache key
+        
+        Args:
+            model_name: Model identifier
+            prompt: Full prompt text
+            params: Dict of sampling parameters and length limits
+        
+        Returns:
+            Hex digest string
+        """
+        payload = json.dumps([str(model_name), prompt, params], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    
+    def get(self, key):
+        """Look up a response, returns None on a miss"""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key]
+        
+        text = self._read_disk(key)
+        
+        with self._lock:
+            if text is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            self._remember(key, text)
+        return text
+    
+    def put(self, key, text):
+        """Store a response in both tiers"""
+        with self._lock:
+            self._remember(key, text)
+        self._write_disk(key, text)
+    
+    def stats(self):
+        """Hit/miss counters and tier sizes"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "disk_bytes": self._disk_bytes
+        }
+    
+    def clear(self):
+        """Drop every cached response"""
+        with self._lock:
+            self._memory.clear()
+            for path, _, _ in self._disk_entries():
+                os.remove(path)
+            self._disk_bytes = 0
+    
+    def _remember(self, key, text):
+        """Insert into the memory tier (caller holds the lock)"""
+        self._memory[key] = text
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+    
+    def _path(self, key):
+        """Disk location of a key, sharded by its first two hex digits"""
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+    
+    def _read_disk(self, key):
+        """Read a disk entry, refreshing its mtime for LRU eviction"""
+        if not self.cache_dir:
+            return None
+        
+        path = self._path(key)
+        try:
+            with open(path, 'r') as f:
+                text = json.load(f)["text"]
+            os.utime(path)
+            return text
+        except (OSError, ValueError, KeyError):
+            return None
+    
+    def _write_disk(self, key, text):
+        """Atomically write a disk entry and evict old entries if over budget"""
+        if not self.cache_dir:
+            return
+        
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        
+        try:
+            old_size = os.path.getsize(path) if os.path.exists(path) else 0
+            with open(tmp_path, 'w') as f:
+                json.dump({"text": text}, f)
+            os.replace(tmp_path, path)
+            size = os.path.getsize(path)
+        except OSError:
+            return
+        
+        with self._lock:
+            self._disk_bytes += size - old_size
+            if self._disk_bytes > self.max_disk_bytes:
+                self._evict_disk()
+    
+    def _evict_disk(self):
+        """Remove least recently used disk entries down to 90% of the budget (caller holds the lock)"""
+        target = self.max_disk_bytes * 0.9
+        
+        for path, size, _ in sorted(self._disk_entries(), key=lambda entry: entry[2]):
+            if self._disk_bytes <= target:
+                break
+            try:
+                os.remove(path)
+                self._disk_bytes -= size
+            except OSError:
+                pass
+    
+    def _disk_entries(self):
+        """List (path, size, mtime) for every disk entry"""
+        entries = []
+        if not self.cache_dir or not os.path.isdir(self.cache_dir):
+            return entries
+        
+        for shard in os.scandir(self.cache_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith(".json"):
+                    stat = entry.stat()
+                    entries.append((entry.path, stat.st_size, stat.st_mtime))
+        return entries
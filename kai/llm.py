@@ -3,13 +3,46 @@ LLM wrapper for local AI integration (using transformers)
 KAI - local AI that runs without external servers
 """
 
-import torch
-from transformers import pipeline
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
+from threading import Event, Lock, Thread, local
+
+from kai.memory import estimate_tokens
+from kai.metrics import metrics
+
+SYSTEM_PROMPT = "You are KAI (Kesh, Assistant/Automated, Intelligence), a helpful and friendly AI assistant."
+
+# New-token budget of a chat reply (quizzes and batch prompts set their own)
+CHAT_MAX_NEW_TOKENS = 100
+# Turn markers of the plain-text transcript: a model writing one has finished its reply
+ROLE_MARKERS = ("\nUser:", "\nAssistant:")
+# Transcript turns are single-spaced, so a blank line also ends a chat reply
+CHAT_STOP_SEQUENCES = ROLE_MARKERS + ("\n\n",)
+# Start of the notes appended to output that was stopped early (see split_stop_note)
+TIMEOUT_NOTE = "\n⏱️  Generation stopped"
+CANCEL_NOTE = "\n⏹️  Generation cancelled"
+
+def split_stop_note(text):
+    """
+    Separate the stop note from output that was stopped early
+    
+    Returns:
+        (text, note) - note is "" when the output ran to completion
+    """
+    for note in (TIMEOUT_NOTE, CANCEL_NOTE):
+        index = text.rfind(note)
+        if index >= 0:
+            return text[:index], text[index:]
+    return text, ""
 
 class KaiLLM:
     """Local LLM client using transformers"""
     
-    def __init__(self, model="distilgpt2"):
+    def __init__(self, model="distilgpt2", prefix_cache_size=4, greedy=False, seed=None,
+                 response_cache=None, background=False, profile=None, assistant_model=None,
+                 timeout=None):
         """
         Initialize local LLM
         
@@ -19,85 +52,918 @@ class KaiLLM:
                    - "TinyLlama/TinyLlama-1.1B-Chat-v1.0" (better responses, ~1.1B)
                    - "gpt2" (classic, ~124M)
                    - "facebook/opt-125m" (compact, ~125M)
+            prefix_cache_size: Conversations whose KV cache is kept (LRU)
+            greedy: Use greedy decoding instead of sampling (deterministic)
+            seed: Reseed the RNG before every generation (deterministic sampling)
+            response_cache: Optional ResponseCache, only used when greedy or seeded
+            background: Load and warm up the model on a background thread;
+                        generation calls wait until it is ready
+            profile: CPU performance profile name from kai.profiles
+                     (default: KAI_CPU_PROFILE or "default")
+            assistant_model: Optional small draft model ID (e.g. "distilgpt2") for
+                             assisted/speculative decoding: it proposes tokens that
+                             `model` verifies in one forward pass. Models with a
+                             different tokenizer use universal assisted decoding.
+            timeout: Default seconds a generation may run before it is stopped
+                     (per call override with timeout=; None = no limit)
         """
         self.model_name = model
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.last_timing = {}
+        self.seed = seed
+        self.response_cache = response_cache
+        if greedy:
+            self.sampling = {"do_sample": False}
+        else:
+            self.sampling = {"temperature": 0.7, "top_p": 0.95, "do_sample": True}
+        self.assistant_model_name = assistant_model
+        self.assistant = None
+        self.last_assist = {}
+        self._assist_enabled = False
+        self._passes = local()
+        self.timeout = timeout
+        self._running = set()
+        self._running_lock = Lock()
+        self.prefix_cache_size = prefix_cache_size
+        self._prefix_cache = OrderedDict()
+        self._cache_lock = Lock()
+        self._batcher = None
+        self.profile = profile
+        self.device = None
+        self.generator = None
+        self.context_window = None
+        self.available = False
+        self.ready = Future()
         
+        if background:
+            Thread(target=self._load, daemon=True, name="kai-model-loader").start()
+        else:
+            self._load()
+    
+    def _load(self):
+        """Import torch/transformers, load the model and run a warm-up pass"""
         try:
-            print(f"🤖 Loading KAI model: {model} (device: {self.device})...")
+            import torch
+            from transformers import pipeline
+            
+            self.device = "cuda" if torch.cuda.is_available() else "cpu"
+            profile = None
+            if self.device == "cpu":
+                from kai.profiles import resolve_profile, apply_threading
+                profile = resolve_profile(self.profile)
+                self.profile = profile["name"]
+                apply_threading(profile)
+            
+            print(f"🤖 Loading KAI model: {self.model_name} (device: {self.device})...")
             self.generator = pipeline(
                 "text-generation",
-                model=model,
+                model=self.model_name,
                 device=0 if self.device == "cuda" else -1,
                 torch_dtype=torch.float16 if self.device == "cuda" else torch.float32
             )
+            
+            if profile:
+                from kai.profiles import optimize_model
+                self.generator.model = optimize_model(self.generator.model, profile)
+            
+            if self.assistant_model_name:
+                self._load_assistant(profile)
+            
+            self.context_window = _context_window(self.generator.model, self.generator.tokenizer)
+            self._warm_up()
             self.available = True
             print(f"✅ KAI ready!")
         except Exception as e:
             print(f"⚠️  Warning: Could not load model: {e}")
             self.available = False
             self.generator = None
+        finally:
+            self.ready.set_result(self.available)
+    
+    def _warm_up(self):
+        """Run a one-token generation so the first real request skips lazy initialization"""
+        import torch
+        
+        tokenizer = self.generator.tokenizer
+        input_ids = tokenizer("Hello", return_tensors="pt").input_ids.to(self.generator.model.device)
+        with torch.no_grad():
+            self.generator.model.generate(
+                input_ids=input_ids,
+                attention_mask=torch.ones_like(input_ids),
+                max_new_tokens=1,
+                do_sample=False,
+                pad_token_id=tokenizer.eos_token_id
+            )
+    
+    def _load_assistant(self, profile=None):
+        """
+        Load the draft model for assisted decoding
+        
+        Failures and incompatible tokenizers only disable assistance;
+        the target model keeps working on its own.
+        """
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+        
+        name = self.assistant_model_name
+        model = self.generator.model
+        print(f"🤖 Loading draft model: {name}...")
+        try:
+            draft_tokenizer = AutoTokenizer.from_pretrained(name)
+            draft = AutoModelForCausalLM.from_pretrained(name, torch_dtype=model.dtype).to(model.device).eval()
+        except Exception as e:
+            print(f"⚠️  Warning: Could not load draft model {name}: {e}")
+            return
+        
+        mode = assisted_mode(self.generator.tokenizer, model, draft_tokenizer, draft)
+        if mode is None:
+            print(f"⚠️  Warning: {name} has the same vocabulary size as {self.model_name} but different "
+                  f"tokens; assisted decoding disabled")
+            return
+        
+        if profile:
+            from kai.profiles import optimize_model
+            draft = optimize_model(draft, profile)
+        
+        assistant = {"assistant_model": draft}
+        if mode == "universal":
+            # Different tokenizers: candidates are re-tokenized between the models
+            assistant.update(tokenizer=self.generator.tokenizer, assistant_tokenizer=draft_tokenizer)
+        
+        # Not every transformers version can assist every decoding mode; try ours once
+        try:
+            self._trial_generate(assistant)
+        except Exception as e:
+            print(f"⚠️  Warning: Assisted decoding with {name} failed ({e}); using {self.model_name} alone")
+            return
+        self.assistant = assistant
+        
+        # Forward passes per generation give the acceptance rate (see _assist_stats)
+        model.register_forward_hook(lambda *_: self._count_pass("target"))
+        draft.register_forward_hook(lambda *_: self._count_pass("draft"))
+        self.use_assistant(True)
+        print(f"✅ Draft model ready ({mode} assisted decoding)")
+    
+    def _trial_generate(self, assistant):
+        """Generate a few tokens with the configured sampling and a draft model"""
+        import torch
+        
+        tokenizer = self.generator.tokenizer
+        input_ids = tokenizer("Hello there", return_tensors="pt").input_ids.to(self.generator.model.device)
+        with torch.no_grad():
+            self.generator.model.generate(
+                input_ids=input_ids,
+                attention_mask=torch.ones_like(input_ids),
+                max_new_tokens=4,
+                pad_token_id=tokenizer.eos_token_id,
+                **self.sampling,
+                **assistant
+            )
+    
+    def use_assistant(self, enabled=True):
+        """
+        Turn assisted decoding on or off (e.g. to measure the speedup)
+        
+        Returns:
+            True if assisted decoding is now active
+        """
+        if self.assistant is None:
+            return False
+        
+        self._assist_enabled = enabled
+        # The pipeline reads these attributes on every call
+        self.generator.assistant_model = self.assistant["assistant_model"] if enabled else None
+        self.generator.assistant_tokenizer = self.assistant.get("assistant_tokenizer") if enabled else None
+        return enabled
+    
+    def _assist_kwargs(self):
+        """Extra generate() arguments for assisted decoding (empty when off)"""
+        if self.assistant is None or not self._assist_enabled:
+            return {}
+        return self.assistant
+    
+    def _count_pass(self, model):
+        """Forward hook: count a target/draft forward pass on this thread"""
+        setattr(self._passes, model, getattr(self._passes, model, 0) + 1)
+    
+    def _reset_passes(self):
+        """Start counting forward passes for a new generation on this thread"""
+        self._passes.target = 0
+        self._passes.draft = 0
+    
+    def _assist_stats(self, new_tokens):
+        """
+        Acceptance statistics of the generation that just ran on this thread
+        
+        Every target pass verifies the drafted candidates and adds one token of
+        its own, so accepted drafts = new tokens - target passes; each draft
+        pass proposes one candidate.
+        
+        Returns:
+            Dict with drafted, accepted, acceptance rate and tokens per target pass
+        """
+        target = getattr(self._passes, "target", 0)
+        drafted = getattr(self._passes, "draft", 0)
+        if not self._assist_kwargs() or not target or not new_tokens:
+            return {}
+        
+        accepted = min(max(0, new_tokens - target), drafted)
+        stats = {
+            "drafted": drafted,
+            "accepted": accepted,
+            "acceptance": accepted / drafted if drafted else 0.0,
+            "tokens_per_pass": new_tokens / target
+        }
+        metrics.observe("llm_assist_acceptance_rate", stats["acceptance"])
+        metrics.observe("llm_assist_tokens_per_pass", stats["tokens_per_pass"])
+        metrics.inc("llm_assist_drafted", drafted)
+        metrics.inc("llm_assist_accepted", accepted)
+        self.last_assist = stats
+        return stats
+    
+    def wait_ready(self, timeout=None):
+        """
+        Block until the model has finished loading
+        
+        Args:
+            timeout: Seconds to wait (None waits indefinitely)
+            
+        Returns:
+            True if the model loaded successfully
+        """
+        return self.ready.result(timeout=timeout)
     
-    def generate(self, prompt, system_prompt=None, max_length=150):
+    def generate(self, prompt, system_prompt=None, max_new_tokens=CHAT_MAX_NEW_TOKENS, timeout=None,
+                 stop=CHAT_STOP_SEQUENCES):
         """
         Generate text response
         
         Args:
             prompt: User's input text
             system_prompt: Optional system context
-            max_length: Max tokens to generate
+            max_new_tokens: Max tokens to generate (the prompt is truncated to fit the context)
+            timeout: Seconds before generation stops (default: self.timeout)
+            stop: Stop sequences; generation ends at the first one, which is not returned
             
         Returns:
-            Generated text response
+            Generated text response (ending with a note if it was stopped early)
         """
-        if not self.available:
+        if not self.wait_ready():
             return "❌ Error: KAI model not loaded. Install transformers: pip install transformers torch"
         
-        full_prompt = prompt
-        if system_prompt:
-            full_prompt = f"{system_prompt}\n\nUser: {prompt}\nAssistant:"
+        full_prompt = self._build_prompt(prompt, system_prompt)
+        start = time.perf_counter()
+        cache_key = self._response_key(full_prompt, max_new_tokens=max_new_tokens, stop=stop)
+        
+        cached = self._cached_response(cache_key, start)
+        if cached is not None:
+            return cached
+        
+        if self._batcher is not None:
+            with self._stop_signal(timeout) as signal:
+                response = self._batcher.submit(full_prompt, max_new_tokens, stop, signal).result()
+            if response.startswith("❌"):
+                return response
+            if signal.reason:
+                return response + self._stop_note(signal)
+            if cache_key is not None:
+                self.response_cache.put(cache_key, response)
+            return response
         
         try:
-            result = self.generator(
-                full_prompt,
-                max_length=max_length,
-                num_return_sequences=1,
-                temperature=0.7,
-                top_p=0.95,
-                do_sample=True
-            )
+            from kai.stopping import cut_at_stop
             
-            response = result[0]["generated_text"]
-            # Remove the prompt from response
-            if full_prompt in response:
-                response = response[len(full_prompt):].strip()
+            input_ids, max_new_tokens = self._encode(full_prompt, max_new_tokens)
+            with self._stop_signal(timeout) as signal:
+                sequences, stats = self._generate_ids(
+                    input_ids,
+                    max_new_tokens=max_new_tokens,
+                    stopping_criteria=self._stopping(signal, input_ids.shape[1], stop)
+                )
             
-            return response.strip()
+            # Decode only the reply, never the prompt
+            new_tokens = sequences[0, input_ids.shape[1]:]
+            text = self.generator.tokenizer.decode(new_tokens, skip_special_tokens=True)
+            response = cut_at_stop(text, stop).strip()
+            self.last_timing = {"ttft": None, "total": time.perf_counter() - start, **stats}
+            self._record("generate", self.last_timing["total"], tokens=len(new_tokens))
+            if signal.reason:
+                # Partial output is never cached
+                self.last_timing["stopped"] = signal.reason
+                return response + self._stop_note(signal)
+            if cache_key is not None:
+                self.response_cache.put(cache_key, response)
+            return response
         
         except Exception as e:
             return f"❌ Error generating response: {str(e)}"
     
-    def chat(self, messages):
+    def generate_batch(self, prompts, system_prompt=None, max_new_tokens=100, timeout=None, stop=ROLE_MARKERS):
+        """
+        Generate responses for several prompts in one forward pass per step
+        
+        Prompts are left-padded to a common length so every sequence
+        continues directly from its own last token.
+        
+        Args:
+            prompts: List of user input texts
+            system_prompt: Optional system context shared by all prompts
+            max_new_tokens: Max tokens to generate per prompt
+            timeout: Seconds before generation stops (default: self.timeout)
+            stop: Stop sequences ending each response (not returned)
+            
+        Returns:
+            List of generated text responses, in prompt order (timings in last_timing)
+        """
+        if not self.wait_ready():
+            return ["❌ Error: KAI model not loaded. Install transformers: pip install transformers torch"] * len(prompts)
+        
+        start = time.perf_counter()
+        full_prompts = [self._build_prompt(prompt, system_prompt) for prompt in prompts]
+        keys = [self._response_key(full_prompt, max_new_tokens=max_new_tokens, stop=stop) for full_prompt in full_prompts]
+        responses = [self.response_cache.get(key) if key is not None else None for key in keys]
+        missing = [i for i, response in enumerate(responses) if response is None]
+        looked_up = sum(1 for key in keys if key is not None)
+        if looked_up:
+            misses = sum(1 for i in missing if keys[i] is not None)
+            metrics.inc("llm_cache_hits", looked_up - misses)
+            metrics.inc("llm_cache_misses", misses)
+        
+        if not missing:
+            elapsed = time.perf_counter() - start
+            self.last_timing = {"ttft": elapsed, "total": elapsed, "cached": True}
+        else:
+            try:
+                with self._stop_signal(timeout) as signal:
+                    results = self._generate_batch([full_prompts[i] for i in missing], max_new_tokens, signal, stop)
+            except Exception as e:
+                return [f"❌ Error generating response: {str(e)}"] * len(prompts)
+            
+            self.last_timing = {**self.last_timing, "total": time.perf_counter() - start}
+            for i, (text, _) in zip(missing, results):
+                if signal.reason:
+                    self.last_timing["stopped"] = signal.reason
+                    responses[i] = text + self._stop_note(signal)
+                    continue
+                responses[i] = text
+                if keys[i] is not None:
+                    self.response_cache.put(keys[i], text)
+        
+        return responses
+    
+    def enable_batching(self, max_batch_size=8, max_wait_ms=20):
+        """
+        Route generate() calls through a micro-batching queue
+        
+        Concurrent callers (threads) are grouped into batches of up to
+        max_batch_size, waiting at most max_wait_ms for a batch to fill.
+        
+        Returns:
+            The MicroBatcher, for stats()
+        """
+        from kai.batching import MicroBatcher
+        
+        self.disable_batching()
+        self._batcher = MicroBatcher(self, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+        return self._batcher
+    
+    def disable_batching(self):
+        """Stop the micro-batching queue and go back to direct generation"""
+        if self._batcher is not None:
+            self._batcher.close()
+            self._batcher = None
+    
+    def _generate_batch(self, full_prompts, max_new_tokens, signal=None, stop=(), signals=None):
+        """
+        Run one batched generate() over complete prompts
+        
+        Assisted decoding only handles one sequence at a time, so batches
+        always run on the target model alone.
+        
+        Args:
+            full_prompts: Complete prompts
+            max_new_tokens: Max tokens to generate per prompt
+            signal: Optional StopSignal that can end the batch early
+            stop: Stop sequences; each sequence finishes at its first one
+            signals: Optional StopSignal per prompt (micro-batches); each ends
+                     only its own sequence, and the batch ends once all have
+        
+        Returns:
+            List of (text, new token count) tuples
+        """
+        import torch
+        from kai.stopping import BatchStopSignals, cut_at_stop
+        
+        tokenizer = self.generator.tokenizer
+        model = self.generator.model
+        
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        tokenizer.padding_side = "left"
+        
+        start = time.perf_counter()
+        inputs = tokenizer(full_prompts, return_tensors="pt", padding=True)
+        keep, max_new_tokens = self._fit_context(inputs.input_ids.shape[1], max_new_tokens)
+        # Left padding: cutting from the left drops padding before any prompt tokens
+        input_ids = inputs.input_ids[:, -keep:].to(model.device)
+        attention_mask = inputs.attention_mask[:, -keep:].to(model.device)
+        criteria = self._stopping(signal, keep, stop)
+        per_prompt = BatchStopSignals(signals, keep) if signals else None
+        if per_prompt is not None:
+            criteria.append(per_prompt)
+        self._seed_rng()
+        
+        with torch.no_grad():
+            sequences = model.generate(
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                max_new_tokens=max_new_tokens,
+                pad_token_id=tokenizer.pad_token_id,
+                stopping_criteria=criteria,
+                **self.sampling
+            )
+        
+        new_tokens = sequences[:, keep:]
+        texts = tokenizer.batch_decode(new_tokens, skip_special_tokens=True)
+        counts = (new_tokens != tokenizer.pad_token_id).sum(dim=1).tolist()
+        if per_prompt is not None:
+            per_prompt.settle(counts)
+        elapsed = time.perf_counter() - start
+        self.last_timing = {"ttft": None, "total": elapsed, "tokens": sum(counts), "batch": len(full_prompts)}
+        self._record("batch", elapsed, tokens=sum(counts), batch=len(full_prompts))
+        return [(cut_at_stop(text, stop).strip(), count) for text, count in zip(texts, counts)]
+    
+    def stream(self, prompt, system_prompt=None, max_new_tokens=CHAT_MAX_NEW_TOKENS, timeout=None,
+               stop=CHAT_STOP_SEQUENCES):
+        """
+        Generate text response incrementally
+        
+        Runs generation on a background thread and yields text as the
+        tokenizer decodes it. Timings are stored in last_timing once the
+        stream is exhausted ("ttft" = time to first token, "total").
+        
+        Args:
+            prompt: User's input text
+            system_prompt: Optional system context
+            max_new_tokens: Max tokens to generate
+            timeout: Seconds before generation stops (default: self.timeout)
+            stop: Stop sequences; generation ends at the first one, which is not yielded
+            
+        Returns:
+            Generator of decoded text chunks
+        """
+        full_prompt = self._build_prompt(prompt, system_prompt)
+        return self._stream_prompt(full_prompt, timeout=timeout, stop=stop, max_new_tokens=max_new_tokens)
+    
+    def chat(self, messages, stream=False, max_new_tokens=CHAT_MAX_NEW_TOKENS, cache_key="default", timeout=None):
         """
         Chat-style interface
         
+        The whole conversation is rendered into one prompt. The KV cache of
+        the previous turn is kept under cache_key, so only the part of the
+        prompt that changed since then (normally the new user message) has
+        to be prefilled. The reply ends at the next role marker or blank line.
+        
         Args:
             messages: List of message dicts with 'role' and 'content'
+            stream: Return a generator of text chunks instead of a string
+            max_new_tokens: Max tokens to generate for the reply
+            cache_key: Prefix cache slot (one per conversation), None disables
+            timeout: Seconds before generation stops (default: self.timeout)
+            
+        Returns:
+            Generated text response (or chunk generator when streaming)
+        """
+        full_prompt = self._format_messages(messages)
+        chunks = self._stream_prompt(
+            full_prompt,
+            max_new_tokens=max_new_tokens,
+            cache_key=cache_key,
+            timeout=timeout,
+            stop=CHAT_STOP_SEQUENCES
+        )
+        
+        if stream:
+            return chunks
+        return "".join(chunks).strip()
+    
+    def cancel(self):
+        """
+        Stop every running generation after its current token
+        
+        Safe to call from any thread (e.g. a Ctrl-C handler); the stopped
+        calls return what they generated so far.
+        """
+        with self._running_lock:
+            for signal in self._running:
+                signal.event.set()
+    
+    def cache_stats(self):
+        """Response cache counters and sizes (None without a cache)"""
+        if self.response_cache is None:
+            return None
+        return self.response_cache.stats()
+    
+    def close(self):
+        """Release batching threads and cached KV state (before dropping the model)"""
+        self.cancel()
+        self.disable_batching()
+        self.reset_cache()
+    
+    def weight_bytes(self):
+        """Approximate memory held by the loaded weights (target + draft model)"""
+        if self.generator is None:
+            return 0
+        models = [self.generator.model]
+        if self.assistant:
+            models.append(self.assistant["assistant_model"])
+        return sum(tensor.numel() * tensor.element_size()
+                   for model in models
+                   for tensor in list(model.parameters()) + list(model.buffers()))
+    
+    def reset_cache(self, cache_key=None):
+        """
+        Drop cached prefix KV state
+        
+        Args:
+            cache_key: Slot to drop (default: all slots)
+        """
+        with self._cache_lock:
+            if cache_key is None:
+                self._prefix_cache.clear()
+            else:
+                self._prefix_cache.pop(cache_key, None)
+    
+    def _stream_prompt(self, full_prompt, cache_key=None, timeout=None, stop=(), max_new_tokens=CHAT_MAX_NEW_TOKENS):
+        """
+        Run generation for a complete prompt on a thread, yielding decoded text
+        
+        Text that could be the start of a stop sequence is held back until
+        it is clear it is not one. Closing the generator early (e.g. the
+        reader was interrupted) stops the generation too.
+        """
+        self.last_timing = {}
+        
+        if not self.wait_ready():
+            yield "❌ Error: KAI model not loaded. Install transformers: pip install transformers torch"
+            return
+        
+        start = time.perf_counter()
+        response_key = self._response_key(full_prompt, max_new_tokens=max_new_tokens, stop=stop)
+        cached = self._cached_response(response_key, start)
+        if cached is not None:
+            yield cached
+            return
+        
+        from transformers import TextIteratorStreamer
+        from kai.stopping import cut_at_stop, find_stop, held_back
+        
+        tokenizer = self.generator.tokenizer
+        input_ids, max_new_tokens = self._encode(full_prompt, max_new_tokens)
+        streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+        errors = []
+        sequences = []
+        
+        def run():
+            try:
+                sequences.extend(self._generate_ids(input_ids, cache_key, streamer=streamer,
+                                                    max_new_tokens=max_new_tokens,
+                                                    stopping_criteria=self._stopping(signal, input_ids.shape[1], stop)))
+            except Exception as e:
+                errors.append(e)
+                streamer.end()
+        
+        first_token = None
+        text = ""
+        sent = 0
+        with self._stop_signal(timeout) as signal:
+            thread = Thread(target=run, daemon=True)
+            generate_start = time.perf_counter()
+            thread.start()
+            
+            try:
+                for chunk in streamer:
+                    if not chunk or sent is None:
+                        continue
+                    if first_token is None:
+                        first_token = time.perf_counter() - start
+                    text += chunk
+                    cut = find_stop(text, stop)
+                    # Generation ends on the same token; drain the rest without showing it
+                    end = cut if cut is not None else len(text) - held_back(text, stop)
+                    if end > sent:
+                        yield text[sent:end]
+                    sent = None if cut is not None else max(sent, end)
+                if sent is not None and sent < len(text):
+                    yield text[sent:]
+            finally:
+                if thread.is_alive():
+                    # Abandoned by the reader: stop generating for nobody
+                    signal.event.set()
+            
+            thread.join()
+        self.last_timing = {"ttft": first_token, "total": time.perf_counter() - start}
+        if sequences:
+            self.last_timing.update(sequences[1])
+        if sequences and first_token is not None:
+            self._record("stream", self.last_timing["total"], ttft=first_token,
+                         prefill=start + first_token - generate_start,
+                         tokens=sequences[0].shape[1] - input_ids.shape[1])
+        
+        if errors:
+            yield f"\n❌ Error generating response: {str(errors[0])}"
+        elif signal.reason:
+            self.last_timing["stopped"] = signal.reason
+            yield self._stop_note(signal)
+        elif response_key is not None:
+            self.response_cache.put(response_key, cut_at_stop(text, stop).strip())
+    
+    def _generate_ids(self, input_ids, cache_key=None, **kwargs):
+        """
+        Call model.generate, reusing and refreshing the prefix KV cache
+        
+        Args:
+            input_ids: Prompt token ids (batch of 1)
+            cache_key: Prefix cache slot, None to run without the cache
+            **kwargs: Extra generate() arguments (streamer, length limits)
             
         Returns:
-            Generated text response
+            (generated sequence ids including the prompt, assisted decoding stats)
+        """
+        import torch
+        
+        model = self.generator.model
+        past = self._take_prefix(cache_key, input_ids) if cache_key is not None else None
+        self._seed_rng()
+        self._reset_passes()
+        
+        with torch.no_grad():
+            output = model.generate(
+                input_ids=input_ids,
+                attention_mask=torch.ones_like(input_ids),
+                past_key_values=past,
+                use_cache=True,
+                return_dict_in_generate=True,
+                pad_token_id=self.generator.tokenizer.eos_token_id,
+                **self.sampling,
+                **self._assist_kwargs(),
+                **kwargs
+            )
+        
+        if cache_key is not None and output.past_key_values is not None:
+            # The cache covers every token except the last one sampled
+            cached = _cache_length(output.past_key_values)
+            with self._cache_lock:
+                self._prefix_cache[cache_key] = (output.sequences[0, :cached], output.past_key_values)
+                while len(self._prefix_cache) > self.prefix_cache_size:
+                    self._prefix_cache.popitem(last=False)
+        
+        return output.sequences, self._assist_stats(output.sequences.shape[1] - input_ids.shape[1])
+    
+    def _encode(self, full_prompt, max_new_tokens):
+        """
+        Tokenize a prompt, truncated to fit the context window
+        
+        Returns:
+            (input ids on the model device, max_new_tokens that fits)
+        """
+        input_ids = self.generator.tokenizer(full_prompt, return_tensors="pt").input_ids
+        keep, max_new_tokens = self._fit_context(input_ids.shape[1], max_new_tokens)
+        return input_ids[:, -keep:].to(self.generator.model.device), max_new_tokens
+    
+    def _fit_context(self, prompt_tokens, max_new_tokens):
+        """
+        Split the context window between prompt and reply
+        
+        The reply budget is kept; the oldest prompt tokens are dropped
+        (the end of the prompt carries the question and the assistant cue).
+        
+        Returns:
+            (prompt tokens to keep, max_new_tokens)
+        """
+        if self.context_window is None:
+            return prompt_tokens, max_new_tokens
+        
+        max_new_tokens = max(1, min(max_new_tokens, self.context_window - 1))
+        keep = min(prompt_tokens, self.context_window - max_new_tokens)
+        if keep < prompt_tokens:
+            metrics.inc("llm_prompt_truncated")
+            metrics.observe("llm_prompt_tokens_dropped", prompt_tokens - keep)
+        return keep, max_new_tokens
+    
+    def _stopping(self, signal, prompt_length, stop):
+        """Stopping criteria for one generate() call"""
+        from kai.stopping import StopSequences
+        
+        criteria = [signal] if signal is not None else []
+        if stop:
+            criteria.append(StopSequences(self.generator.tokenizer, prompt_length, stop))
+        return criteria
+    
+    @contextmanager
+    def _stop_signal(self, timeout=None):
+        """StopSignal for one generation, reachable by cancel() while it runs"""
+        from kai.stopping import StopSignal
+        
+        signal = StopSignal(Event(), timeout if timeout is not None else self.timeout)
+        with self._running_lock:
+            self._running.add(signal)
+        try:
+            yield signal
+        finally:
+            with self._running_lock:
+                self._running.discard(signal)
+    
+    def _stop_note(self, signal):
+        """Text appended to output that was stopped early"""
+        if signal.reason == "timeout":
+            return f"{TIMEOUT_NOTE} after {signal.timeout:g}s (timeout)"
+        return CANCEL_NOTE
+    
+    def _response_key(self, full_prompt, **limits):
+        """
+        Response cache key for a prompt, or None when caching does not apply
+        
+        Only greedy or seeded generation is repeatable, so sampled output
+        is never cached.
+        """
+        if self.response_cache is None:
+            return None
+        if self.sampling.get("do_sample") and self.seed is None:
+            return None
+        
+        params = {**self.sampling, **limits, "seed": self.seed}
+        if self._assist_kwargs():
+            # Seeded sampling draws different random numbers with a draft model
+            params["assistant"] = self.assistant_model_name
+        return self.response_cache.make_key(self.model_name, full_prompt, params)
+    
+    def _cached_response(self, response_key, start):
+        """Return a cached response (recording its timing) or None"""
+        if response_key is None:
+            return None
+        
+        response = self.response_cache.get(response_key)
+        if response is None:
+            metrics.inc("llm_cache_misses")
+            return None
+        elapsed = time.perf_counter() - start
+        self.last_timing = {"ttft": elapsed, "total": elapsed, "cached": True}
+        metrics.inc("llm_cache_hits")
+        return response
+    
+    def _record(self, path, total, ttft=None, prefill=None, tokens=None, batch=1):
+        """
+        Record one generation in the metrics registry
+        
+        Args:
+            path: "stream", "pipeline" or "batch"
+            total: Wall time of the whole call in seconds
+            ttft: Time to first token, including tokenization (streaming only)
+            prefill: Time from generate() start to the first token (streaming only)
+            tokens: New tokens generated (summed over the batch)
+            batch: Sequences generated together
+        """
+        metrics.observe("llm_generate_seconds", total, path=path)
+        if ttft is not None:
+            metrics.observe("llm_ttft_seconds", ttft, path=path)
+        if prefill is not None:
+            metrics.observe("llm_prefill_seconds", prefill, path=path)
+        if tokens:
+            metrics.observe("llm_tokens", tokens, path=path)
+            metrics.inc("llm_tokens_generated", tokens, path=path)
+            # Decode time starts at the first token where that is known
+            decode = total - (ttft or 0.0)
+            if decode > 0:
+                metrics.observe("llm_decode_seconds", decode, path=path)
+                metrics.observe("llm_decode_tokens_per_second", tokens / decode, path=path)
+        if batch > 1:
+            metrics.observe("llm_batch_size", batch, path=path)
+    
+    def _seed_rng(self):
+        """Reseed torch before a generation in seeded mode"""
+        if self.seed is not None:
+            import torch
+            torch.manual_seed(self.seed)
+    
+    def _take_prefix(self, cache_key, input_ids):
+        """
+        Claim the cached KV state for a slot, cropped to the shared prefix
+        
+        The entry is removed while in use so concurrent calls on the same
+        slot never share (and mutate) one cache object.
+        
+        Returns:
+            past_key_values covering a prefix of input_ids, or None
+        """
+        with self._cache_lock:
+            entry = self._prefix_cache.pop(cache_key, None)
+        
+        if entry is None:
+            return None
+        
+        cached_ids, past = entry
+        # At least one prompt token must be left to prefill
+        limit = min(len(cached_ids), input_ids.shape[1] - 1)
+        if limit <= 0:
+            return None
+        
+        matches = cached_ids[:limit] == input_ids[0, :limit]
+        shared = limit if bool(matches.all()) else int(matches.int().argmin())
+        
+        if shared == 0:
+            return None
+        if shared < len(cached_ids):
+            past = _crop_cache(past, shared)
+        return past
+    
+    def _format_messages(self, messages):
+        """
+        Render a message list as a plain-text transcript ending with the assistant cue
+        
+        A leading system message becomes the header; later ones (per-turn
+        context such as recalled notes) stay in place between the turns.
         """
         system_prompt = None
-        user_prompt = ""
+        turns = []
         
-        for msg in messages:
+        for position, msg in enumerate(messages):
             if msg["role"] == "system":
-                system_prompt = msg["content"]
+                if position == 0:
+                    system_prompt = msg["content"]
+                else:
+                    turns.append(msg["content"])
             elif msg["role"] == "user":
-                user_prompt = msg["content"]
+                turns.append(f"User: {msg['content']}")
+            elif msg["role"] == "assistant":
+                turns.append(f"Assistant: {msg['content']}")
+        
+        turns.append("Assistant:")
+        transcript = "\n".join(turns)
         
-        return self.generate(user_prompt, system_prompt)
+        if system_prompt:
+            return f"{system_prompt}\n\n{transcript}"
+        return transcript
+    
+    def _build_prompt(self, prompt, system_prompt=None):
+        """Combine system context and user input into a single prompt"""
+        if system_prompt:
+            return f"{system_prompt}\n\nUser: {prompt}\nAssistant:"
+        return prompt
+    
+    def count_tokens(self, text):
+        """
+        Count prompt tokens for text
+        
+        Uses the model's tokenizer once loaded, otherwise a rough estimate.
+        """
+        if self.ready.done() and self.available:
+            return len(self.generator.tokenizer(text).input_ids)
+        return estimate_tokens(text)
     
     def is_available(self):
-        """Check if model loaded successfully"""
-        return self.available
+        """Check if model loaded successfully (waits for a background load)"""
+        return self.wait_ready()
+
+def assisted_mode(target_tokenizer, target_model, draft_tokenizer, draft_model):
+    """
+    How a draft model can assist a target model
+    
+    Returns:
+        "shared" when both use the same vocabulary, "universal" when the
+        vocabularies differ in size (candidates are converted through text),
+        None when the sizes match but the tokens do not - generate() would
+        then mix up token ids
+    """
+    target_size = target_model.config.get_text_config().vocab_size
+    draft_size = draft_model.config.get_text_config().vocab_size
+    if target_size != draft_size:
+        return "universal"
+    if target_tokenizer.get_vocab() == draft_tokenizer.get_vocab():
+        return "shared"
+    return None
+
+def _context_window(model, tokenizer):
+    """Positions the model can attend to, or None when unknown"""
+    for name in ("max_position_embeddings", "n_positions", "max_sequence_length"):
+        value = getattr(model.config, name, None)
+        if isinstance(value, int) and value > 0:
+            return value
+    # Tokenizers without a limit report a huge sentinel value
+    limit = getattr(tokenizer, "model_max_length", None)
+    return limit if isinstance(limit, int) and limit < 1_000_000 else None
+
+def _cache_length(past_key_values):
+    """Number of positions held by a KV cache (Cache object or legacy tuples)"""
+    if hasattr(past_key_values, "get_seq_length"):
+        return past_key_values.get_seq_length()
+    return past_key_values[0][0].shape[-2]
+
+def _crop_cache(past_key_values, length):
+    """Truncate a KV cache to its first `length` positions"""
+    if hasattr(past_key_values, "crop"):
+        # A negative argument removes that many trailing positions
+        past_key_values.crop(length - past_key_values.get_seq_length())
+        return past_key_values
+    return tuple(
+        tuple(tensor[..., :length, :] for tensor in layer)
+        for layer in past_key_values
+    )
@@ -1,22 +1,301 @@
 """
-Memory module - for future conversation history tracking
-Not implemented yet (Phase 1 focuses on stateless interaction)
+Memory module - conversation history tracking
+Builds the chat prompt under a token budget, folding old turns into a rolling summary
+With a SessionLog every turn is persisted and only a tail window stays in RAM
 """
 
+from kai.sessions import Message
+
+def estimate_tokens(text):
+    """Rough token count when no tokenizer is available (~4 characters per token)"""
+    return len(text) // 4 + 1
+
+def summarize_messages(summary, messages, max_tokens, count_tokens=estimate_tokens):
+    """
+    Fold evicted messages into the rolling summary (extractive)
+    
+    Each message is reduced to its first few words; the oldest summary lines
+    are dropped once the summary exceeds its budget.
+    
+    Args:
+        summary: Current summary text
+        messages: Evicted message dicts, oldest first
+        max_tokens: Token budget for the summary
+        count_tokens: Token counting function
+    
+    Returns:
+        New summary text
+    """
+    lines = summary.splitlines() if summary else []
+    
+    for msg in messages:
+        words = msg["content"].split()
+        text = " ".join(words[:24]) + (" ..." if len(words) > 24 else "")
+        lines.append(f"- {msg['role']}: {text}")
+    
+    while len(lines) > 1 and count_tokens("\n".join(lines)) > max_tokens:
+        lines.pop(0)
+    
+    return "\n".join(lines)
+
 class Memory:
     """Conversation memory handler"""
     
-    def __init__(self):
+    # Tokens added per message by the "User: " / "Assistant: " transcript framing
+    MESSAGE_OVERHEAD = 4
+    
+    def __init__(self, token_counter=None, max_tokens=None, summarizer=None, index=None, recall_k=3, session=None,
+                 log=None, window=200):
+        """
+        Initialize memory (resuming the session in log, if any)
+        
+        Args:
+            token_counter: Function text -> token count (e.g. KaiLLM.count_tokens)
+            max_tokens: Prompt budget for build_messages (None = unbounded)
+            summarizer: Function (summary, messages, max_tokens, count_tokens) -> summary
+            index: Optional VectorIndex; messages are added to it and relevant
+                   snippets are recalled into the prompt (with a log, the
+                   index keeps only each message's position, not its text)
+            recall_k: Snippets recalled per turn
+            session: Session id stored with indexed messages; only this
+                     session's messages are recalled
+            log: Optional SessionLog every message is appended to
+            window: Most messages kept in RAM (older ones stay in the log;
+                    None = unlimited)
+        """
         self.history = []
+        self.summary = ""
+        self.log = log
+        self.window = window
+        # Position of history[0] in the whole conversation
+        self.start = 0
+        self.token_counter = token_counter or estimate_tokens
+        self.max_tokens = max_tokens
+        self.summarizer = summarizer or summarize_messages
+        self.index = index
+        self.recall_k = recall_k
+        self.session = session
+        self._token_counts = []
+        self._reset_callbacks = []
+        
+        if log is not None:
+            self._resume()
+    
+    def _resume(self):
+        """Load the saved summary and the window of the newest messages from the log"""
+        state = self.log.load_state()
+        self.summary = state.get("summary", "")
+        self.start = state.get("start", 0)
+        if self.window is not None:
+            self.start = max(self.start, len(self.log) - self.window)
+        self.history = self.log.read(self.start)
+        self._token_counts = [None] * len(self.history)
     
     def add_message(self, role, content):
-        """Add a message to history"""
-        self.history.append({"role": role, "content": content})
+        """Add a message to history (and the session log)"""
+        message = Message(role, content)
+        self.history.append(message)
+        self._token_counts.append(None)
+        if self.log is not None:
+            self.log.append(message)
+        if self.index is not None:
+            meta = {"source": "chat", "role": role, "session": self.session}
+            if self.log is not None:
+                # The log keeps the text; the index only needs to find it again
+                meta["message"] = len(self.log) - 1
+            self.index.add(content, meta, keep_text=self.log is None)
+        if self.window is not None and len(self.history) > self.window:
+            self.trim(self.window)
     
     def get_history(self, limit=10):
         """Get recent conversation history"""
         return self.history[-limit:]
     
+    def total_messages(self):
+        """Messages in the whole conversation, including those no longer in RAM"""
+        return len(self.log) if self.log is not None else self.start + len(self.history)
+    
+    def older(self, count=20, before=None):
+        """
+        Page in messages from before the window (read from the session log)
+        
+        Args:
+            count: Messages to return
+            before: Conversation position to page back from (default: the window start)
+        
+        Returns:
+            List of Message objects, oldest first (empty without a log)
+        """
+        if self.log is None:
+            return []
+        before = self.start if before is None else before
+        return self.log.read(max(0, before - count), before)
+    
+    def build_messages(self, system_prompt=None, max_tokens=None, query=None):
+        """
+        Assemble the chat messages for the next turn within a token budget
+        
+        When the history outgrows the budget, the oldest turns are evicted
+        (down to half the history budget, so the prompt prefix stays stable
+        for several turns) and folded into the rolling summary. With an index
+        and a query, the most relevant older messages and study notes are
+        recalled into a context message right before the newest user turn;
+        it changes every turn, so everything in front of it (system prompt,
+        summary, earlier turns) stays a reusable prefix.
+        
+        Args:
+            system_prompt: System context placed first
+            max_tokens: Budget override (default: self.max_tokens)
+            query: Text to recall relevant snippets for (usually the new message)
+        
+        Returns:
+            List of message dicts for KaiLLM.chat
+        """
+        budget = max_tokens or self.max_tokens
+        recall = self._recall(query, budget // 8 if budget else None)
+        
+        if budget:
+            system_tokens = self.count_tokens(system_prompt) if system_prompt else 0
+            recall_tokens = self.count_tokens(recall) if recall else 0
+            self._fit(budget - system_tokens - recall_tokens)
+        
+        messages = []
+        system = system_prompt or ""
+        if self.summary:
+            system = f"{system}\n\nEarlier in this conversation:\n{self.summary}".strip()
+        if system:
+            messages.append({"role": "system", "content": system})
+        
+        turns = [msg.to_dict() for msg in self.history]
+        if recall:
+            # In front of the newest user message (or at the end if the last turn is not one)
+            at = len(turns) - 1 if turns and turns[-1]["role"] == "user" else len(turns)
+            turns.insert(at, {"role": "system", "content": f"Relevant notes and earlier messages:\n{recall}"})
+        
+        return messages + turns
+    
+    def count_tokens(self, text):
+        """Count tokens with the configured counter"""
+        return self.token_counter(text)
+    
+    def history_tokens(self):
+        """Token count of the current history (per-message counts are cached)"""
+        for i, count in enumerate(self._token_counts):
+            if count is None:
+                self._token_counts[i] = self.count_tokens(self.history[i].content) + self.MESSAGE_OVERHEAD
+        return sum(self._token_counts)
+    
+    def on_reset(self, callback):
+        """
+        Register a callback run whenever history is trimmed or cleared
+        
+        Anything derived from the full history (such as KaiLLM's prefix
+        KV cache) should be dropped from here.
+        
+        Args:
+            callback: Function taking no arguments
+        """
+        self._reset_callbacks.append(callback)
+    
+    def trim(self, keep):
+        """Drop all but the most recent `keep` messages from the window (the log keeps them)"""
+        if len(self.history) <= keep:
+            return
+        drop = len(self.history) - keep
+        self.history = self.history[drop:]
+        self._token_counts = self._token_counts[drop:]
+        self.start += drop
+        self._save_state()
+        self._notify_reset()
+    
     def clear(self):
-        """Clear conversation history"""
+        """Start over with an empty window and summary (the log keeps the old turns)"""
+        self.start += len(self.history)
         self.history = []
+        self.summary = ""
+        self._token_counts = []
+        self._save_state()
+        self._notify_reset()
+    
+    def close(self):
+        """Close the session log"""
+        if self.log is not None:
+            self.log.close()
+    
+    def _recall(self, query, max_tokens=None):
+        """Top indexed snippets for a query that are not already in the window"""
+        if self.index is None or not query:
+            return ""
+        
+        window = {msg.content for msg in self.history}
+        results = self.index.search(query, k=self.recall_k + len(window), min_score=0.2)
+        lines = []
+        
+        for _, meta in results:
+            if meta.get("source") == "chat" and meta.get("session") != self.session:
+                continue
+            if "message" in meta:
+                # Indexed by position in the session log
+                if self.log is None or meta["message"] >= self.start:
+                    continue
+                messages = self.log.read(meta["message"], meta["message"] + 1)
+                if not messages:
+                    continue
+                text = messages[0].content
+            else:
+                text = meta["text"]
+            if text in window:
+                continue
+            
+            words = text.split()
+            text = " ".join(words[:40]) + (" ..." if len(words) > 40 else "")
+            if meta.get("source") == "notes":
+                line = f"- (notes: {meta.get('topic', '')}) {text}"
+            else:
+                line = f"- ({meta.get('role', 'chat')}, earlier) {text}"
+            
+            if max_tokens and self.count_tokens("\n".join(lines + [line])) > max_tokens:
+                break
+            lines.append(line)
+            if len(lines) >= self.recall_k:
+                break
+        
+        return "\n".join(lines)
+    
+    def _fit(self, budget):
+        """Evict the oldest messages into the summary until history fits the budget"""
+        summary_budget = budget // 4
+        history_budget = budget - summary_budget
+        
+        if self.history_tokens() <= history_budget:
+            return
+        
+        target = history_budget // 2
+        total = self.history_tokens()
+        drop = 0
+        
+        # Always keep the newest message; never start the window on an assistant reply
+        while drop < len(self.history) - 1 and (total > target or self.history[drop].role == "assistant"):
+            total -= self._token_counts[drop]
+            drop += 1
+        
+        if drop == 0:
+            return
+        
+        evicted = self.history[:drop]
+        self.history = self.history[drop:]
+        self._token_counts = self._token_counts[drop:]
+        self.summary = self.summarizer(self.summary, evicted, summary_budget, self.count_tokens)
+        self.start += drop
+        self._save_state()
+        self._notify_reset()
+    
+    def _save_state(self):
+        """Persist the window start and summary, so a resumed session sees the same prompt"""
+        if self.log is not None:
+            self.log.save_state({"start": self.start, "summary": self.summary})
+    
+    def _notify_reset(self):
+        """Run reset callbacks"""
+        for callback in self._reset_callbacks:
+            callback()
@@ -0,0 +1,339 @@
+"""
+Metrics - latency and throughput instrumentation
+Fixed-memory log-bucket histograms, a process-wide registry, /stats output,
+and an optional Prometheus-text or JSONL file exporter
+
+    from kai.metrics import metrics
+    with metrics.timer("route_seconds", command="/task"):
+        ...
+
+Enable the exporter with KAI_METRICS_FILE=data/metrics.prom (or .jsonl);
+KAI_METRICS_INTERVAL sets the write interval in seconds (default 15).
+"""
+
+import atexit
+import functools
+import json
+import math
+import os
+import time
+from contextlib import contextmanager
+from threading import Event, Lock, Thread
+
+class Histogram:
+    """
+    Log-scale histogram with a fixed number of buckets
+    
+    Buckets grow by 2^(1/8) (about 9% apart) from min_value to max_value,
+    so percentiles are accurate to a few percent and memory never grows.
+    """
+    
+    STEPS_PER_OCTAVE = 8
+    
+    def __init__(self, min_value=1e-6, max_value=1e6):
+        self.min_value = min_value
+        self.octaves = math.ceil(math.log2(max_value / min_value))
+        # One underflow bucket in front, one overflow bucket at the end
+        self.buckets = [0] * (self.octaves * self.STEPS_PER_OCTAVE + 2)
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+    
+    def observe(self, value):
+        """Record one value"""
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        
+        if value < self.min_value:
+            index = 0
+        else:
+            index = int(math.log2(value / self.min_value) * self.STEPS_PER_OCTAVE) + 1
+            index = min(index, len(self.buckets) - 1)
+        self.buckets[index] += 1
+    
+    def percentile(self, q):
+        """Approximate value at quantile q (0-1), None when empty"""
+        if not self.count:
+            return None
+        
+        rank = q * self.count
+        seen = 0
+        for index, bucket in enumerate(self.buckets):
+            seen += bucket
+            if seen >= rank and bucket:
+                if index == 0:
+                    return self.min
+                # Upper edge of the bucket, clipped to what was actually seen
+                upper = self.min_value * 2 ** (index / self.STEPS_PER_OCTAVE)
+                return max(self.min, min(upper, self.max))
+        return self.max
+    
+    def summary(self):
+        """Dict with count, sum, mean, p50/p90/p99 and max"""
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else None,
+            "p50": self.percentile(0.5),
+            "p90": self.percentile(0.9),
+            "p99": self.percentile(0.99),
+            "max": self.max if self.count else None
+        }
+
+class Metrics:
+    """Registry of labelled histograms and counters"""
+    
+    def __init__(self, max_series=200):
+        """
+        Args:
+            max_series: Label combinations kept per metric; further ones
+                        are folded into a single "other" series
+        """
+        self.max_series = max_series
+        self.histograms = {}
+        self.counters = {}
+        self._sources = []
+        self._lock = Lock()
+    
+    def observe(self, name, value, **labels):
+        """Record a value in the histogram for name + labels"""
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            key = self._key(series, labels)
+            if key not in series:
+                series[key] = Histogram()
+            series[key].observe(value)
+    
+    def inc(self, name, amount=1, **labels):
+        """Add to a counter"""
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            key = self._key(series, labels)
+            series[key] = series.get(key, 0) + amount
+    
+    @contextmanager
+    def timer(self, name, **labels):
+        """Record the duration of a block in seconds"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+    
+    def timed(self, name, **labels):
+        """Decorator form of timer()"""
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.timer(name, **labels):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+    
+    def add_source(self, source):
+        """
+        Include another registry's series in snapshots (e.g. a generation worker's)
+        
+        Args:
+            source: Function returning (histograms, counters) in snapshot() form
+        """
+        with self._lock:
+            self._sources.append(source)
+    
+    def remove_source(self, source):
+        """Stop including a source added with add_source()"""
+        with self._lock:
+            if source in self._sources:
+                self._sources.remove(source)
+    
+    def snapshot(self):
+        """
+        Current values, including those of added sources
+        
+        Returns:
+            (histograms, counters): lists of (name, labels dict, summary dict)
+            and (name, labels dict, value)
+        """
+        with self._lock:
+            histograms = [(name, dict(key), histogram.summary())
+                          for name, series in sorted(self.histograms.items())
+                          for key, histogram in sorted(series.items())]
+            counters = [(name, dict(key), value)
+                        for name, series in sorted(self.counters.items())
+                        for key, value in sorted(series.items())]
+            sources = list(self._sources)
+        
+        for source in sources:
+            source_histograms, source_counters = source()
+            histograms += source_histograms
+            counters += source_counters
+        
+        def order(row):
+            return row[0], sorted(row[1].items())
+        
+        return sorted(histograms, key=order), sorted(counters, key=order)
+    
+    def reset(self):
+        """Drop every recorded value"""
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+    
+    def format_stats(self):
+        """Human-readable percentile table (for /stats)"""
+        histograms, counters = self.snapshot()
+        if not histograms and not counters:
+            return "📊 No measurements yet"
+        
+        output = ["📊 KAI Stats:\n", f"  {'metric':<44} {'count':>7} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9}"]
+        for name, labels, summary in histograms:
+            seconds = name.endswith("_seconds")
+            values = [_format_value(summary[field], seconds) for field in ("p50", "p90", "p99", "max")]
+            output.append(f"  {_series_name(name, labels):<44} {summary['count']:>7} " + " ".join(f"{v:>9}" for v in values))
+        
+        if counters:
+            output.append("")
+            for name, labels, value in counters:
+                output.append(f"  {_series_name(name, labels):<44} {value:>7}")
+        
+        return "\n".join(output)
+    
+    def prometheus(self, prefix="kai_"):
+        """Prometheus text exposition format (histograms as summaries)"""
+        histograms, counters = self.snapshot()
+        lines = []
+        typed = set()
+        
+        for name, labels, summary in histograms:
+            metric = prefix + name
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} summary")
+                typed.add(metric)
+            for quantile, field in (("0.5", "p50"), ("0.9", "p90"), ("0.99", "p99")):
+                lines.append(f"{metric}{_labels({**labels, 'quantile': quantile})} {summary[field]}")
+            lines.append(f"{metric}_sum{_labels(labels)} {summary['sum']}")
+            lines.append(f"{metric}_count{_labels(labels)} {summary['count']}")
+        
+        for name, labels, value in counters:
+            metric = prefix + name + "_total"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} counter")
+                typed.add(metric)
+            lines.append(f"{metric}{_labels(labels)} {value}")
+        
+        return "\n".join(lines) + "\n"
+    
+    def jsonl(self):
+        """One JSON object per series"""
+        histograms, counters = self.snapshot()
+        now = time.time()
+        rows = [{"time": now, "name": name, "labels": labels, **summary} for name, labels, summary in histograms]
+        rows += [{"time": now, "name": name, "labels": labels, "value": value} for name, labels, value in counters]
+        return "".join(json.dumps(row) + "\n" for row in rows)
+    
+    def _key(self, series, labels):
+        """Hashable label key, folded into "other" past max_series (caller holds the lock)"""
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        if key not in series and len(series) >= self.max_series:
+            key = (("series", "other"),)
+        return key
+
+class Exporter:
+    """Periodically writes metrics to a file (Prometheus text or JSONL)"""
+    
+    def __init__(self, registry, path, format=None, interval=15.0):
+        """
+        Args:
+            registry: Metrics to export
+            path: Output file; Prometheus text is replaced atomically, JSONL is appended
+            format: "prometheus" or "jsonl" (default: from the extension)
+            interval: Seconds between writes
+        """
+        self.registry = registry
+        self.path = path
+        self.format = format or ("jsonl" if path.endswith(".jsonl") else "prometheus")
+        self.interval = interval
+        self._stop = Event()
+        self._thread = Thread(target=self._run, daemon=True, name="kai-metrics-exporter")
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    
+    def start(self):
+        """Start writing in the background (and once more at exit)"""
+        self._thread.start()
+        atexit.register(self.stop)
+        return self
+    
+    def stop(self):
+        """Stop the background thread after a final write"""
+        self._stop.set()
+        self.write()
+    
+    def write(self):
+        """Write the current snapshot"""
+        if self.format == "jsonl":
+            with open(self.path, 'a') as f:
+                f.write(self.registry.jsonl())
+        else:
+            tmp_file = f"{self.path}.tmp"
+            with open(tmp_file, 'w') as f:
+                f.write(self.registry.prometheus())
+            os.replace(tmp_file, self.path)
+    
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.write()
+            except OSError:
+                pass
+
+def start_exporter(registry=None):
+    """
+    Start an Exporter if KAI_METRICS_FILE is set
+    
+    Environment:
+        KAI_METRICS_FILE: Output path (.prom / .txt = Prometheus, .jsonl = JSONL)
+        KAI_METRICS_FORMAT: Force "prometheus" or "jsonl"
+        KAI_METRICS_INTERVAL: Seconds between writes (default 15)
+    
+    Returns:
+        The running Exporter, or None
+    """
+    path = os.environ.get("KAI_METRICS_FILE")
+    if not path:
+        return None
+    return Exporter(
+        registry or metrics,
+        path,
+        format=os.environ.get("KAI_METRICS_FORMAT"),
+        interval=float(os.environ.get("KAI_METRICS_INTERVAL", 15))
+    ).start()
+
+def _format_value(value, seconds):
+    """Milliseconds for durations, plain numbers otherwise"""
+    if value is None:
+        return "-"
+    if seconds:
+        return f"{value * 1000:.2f}ms"
+    return f"{value:.1f}"
+
+def _series_name(name, labels):
+    """name{a=b,...} for display"""
+    if not labels:
+        return name
+    return name + "{" + ",".join(f"{k}={v}" for k, v in labels.items()) + "}"
+
+def _labels(labels):
+    """Prometheus label set"""
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+def _escape(value):
+    """Escape a label value for the text format (backslash, quote, newline)"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+# Process-wide registry used by the built-in hooks
+metrics = Metrics()
@@ -0,0 +1,246 @@
+"""
+Model pool - several resident KaiLLM models with runtime switching
+Tools and chat hold ModelHandles that resolve to their routed model on every
+call, so /model use swaps models without rebuilding anything. Least recently
+used models are unloaded when KAI goes over its memory budget. Models can
+run in generation worker processes (kai.worker) instead of in-process.
+"""
+
+import gc
+import inspect
+import os
+from collections import OrderedDict
+from threading import RLock
+
+from kai.llm import KaiLLM
+
+# Route every handle falls back to
+DEFAULT_ROUTE = "chat"
+
+def process_rss(pid=None):
+    """Resident memory of this process (or another one, Linux only) in bytes; None if unknown"""
+    try:
+        with open(f"/proc/{pid or 'self'}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    if pid is not None:
+        return None
+    try:
+        import resource
+        # Peak rather than current on non-Linux systems (KB on Linux/BSD, bytes on macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if os.uname().sysname == "Darwin" else peak * 1024
+    except (ImportError, AttributeError):
+        return None
+
+class ModelHandle:
+    """
+    Stand-in for a KaiLLM that follows a pool route
+    
+    Attribute reads and method calls go to whatever model the route points
+    to at that moment; a model that was evicted is loaded again on use.
+    """
+    
+    def __init__(self, pool, route):
+        self._pool = pool
+        self._route = route
+    
+    def current(self):
+        """The KaiLLM this handle resolves to right now"""
+        return self._pool.get(self._pool.route(self._route))
+    
+    def __getattr__(self, name):
+        value = getattr(self.current(), name)
+        if inspect.ismethod(value):
+            # Bound later, so callbacks stored elsewhere (memory.on_reset) follow switches
+            return lambda *args, **kwargs: getattr(self.current(), name)(*args, **kwargs)
+        return value
+    
+    def __repr__(self):
+        return f"<ModelHandle {self._route} -> {self._pool.route(self._route)}>"
+
+class ModelPool:
+    """Loads, caches and evicts KaiLLM instances by model ID"""
+    
+    def __init__(self, default_model="distilgpt2", memory_budget_mb=None, worker=False, **llm_kwargs):
+        """
+        Args:
+            default_model: Model for the "chat" route (and every route not set)
+            memory_budget_mb: Process RSS above which unused models are unloaded
+                              (default: KAI_MODEL_MEMORY_MB, unlimited if unset);
+                              worker processes count towards it
+            worker: Run each model in its own generation worker process (WorkerLLM)
+            **llm_kwargs: KaiLLM arguments shared by every model (greedy, seed,
+                          response_cache, profile, ...); background loading is on
+        """
+        if memory_budget_mb is None and os.environ.get("KAI_MODEL_MEMORY_MB"):
+            memory_budget_mb = float(os.environ["KAI_MODEL_MEMORY_MB"])
+        self.memory_budget = memory_budget_mb * 1024 * 1024 if memory_budget_mb else None
+        self.llm_kwargs = {"background": True, **llm_kwargs}
+        self.worker = worker
+        self.routes = {DEFAULT_ROUTE: default_model}
+        self.models = OrderedDict()
+        self.sizes = {}
+        self.evictions = 0
+        self._model_kwargs = {}
+        self._lock = RLock()
+    
+    def configure(self, model_id, **kwargs):
+        """Extra KaiLLM arguments for one model (e.g. assistant_model), used on its next load"""
+        with self._lock:
+            self._model_kwargs[model_id] = kwargs
+    
+    def handle(self, route=DEFAULT_ROUTE):
+        """A KaiLLM stand-in for a route ("chat", or a tool name such as "study")"""
+        return ModelHandle(self, route)
+    
+    def route(self, route):
+        """Model ID a route currently points to"""
+        return self.routes.get(route, self.routes[DEFAULT_ROUTE])
+    
+    def use(self, model_id, route=DEFAULT_ROUTE):
+        """
+        Point a route at a model, starting its load in the background
+        
+        Returns:
+            The model's KaiLLM (possibly still loading)
+        """
+        with self._lock:
+            llm = self.models.get(model_id)
+            if llm is not None and llm.ready.done() and not llm.available:
+                # Retry a load that failed earlier
+                self.unload(model_id)
+            self.routes[route] = model_id
+            return self.get(model_id)
+    
+    def follow(self, route):
+        """Make a route use the chat model again"""
+        with self._lock:
+            if route != DEFAULT_ROUTE:
+                self.routes.pop(route, None)
+    
+    def get(self, model_id):
+        """The KaiLLM for a model ID, loading it if it is not resident"""
+        with self._lock:
+            llm = self.models.get(model_id)
+            if llm is not None:
+                self.models.move_to_end(model_id)
+                return llm
+            
+            kwargs = {**self.llm_kwargs, **self._model_kwargs.get(model_id, {})}
+            if self.worker:
+                from kai.worker import WorkerLLM
+                llm = WorkerLLM(model=model_id, **kwargs)
+            else:
+                llm = KaiLLM(model=model_id, **kwargs)
+            self.models[model_id] = llm
+        
+        llm.ready.add_done_callback(lambda _: self._loaded(model_id, llm))
+        return llm
+    
+    def unload(self, model_id):
+        """
+        Drop a resident model
+        
+        Returns:
+            True if it was resident
+        """
+        with self._lock:
+            llm = self.models.pop(model_id, None)
+            self.sizes.pop(model_id, None)
+        if llm is None:
+            return False
+        
+        llm.close()
+        del llm
+        gc.collect()
+        return True
+    
+    def status(self):
+        """
+        Resident models, most recently used last
+        
+        Returns:
+            List of (model id, state, approximate bytes, routes using it)
+        """
+        with self._lock:
+            rows = []
+            for model_id, llm in self.models.items():
+                if not llm.ready.done():
+                    state = "loading"
+                else:
+                    state = "ready" if llm.available else "failed"
+                routes = sorted(route for route in self.routes if self.route(route) == model_id)
+                rows.append((model_id, state, self.sizes.get(model_id), routes))
+            return rows
+    
+    def cache_stats(self):
+        """
+        Response cache counters of every loaded model
+        
+        Returns:
+            List of (model id, ResponseCache.stats() dict); models still
+            loading or without a cache are left out
+        """
+        with self._lock:
+            models = list(self.models.items())
+        rows = []
+        for model_id, llm in models:
+            if llm.ready.done() and llm.available:
+                stats = llm.cache_stats()
+                if stats is not None:
+                    rows.append((model_id, stats))
+        return rows
+    
+    def cancel(self):
+        """Stop running generations on every resident model"""
+        with self._lock:
+            models = list(self.models.values())
+        for llm in models:
+            llm.cancel()
+    
+    def memory_used(self):
+        """RSS of this process and its workers in bytes, or the resident model sizes when RSS is unavailable"""
+        rss = process_rss()
+        if rss is None:
+            with self._lock:
+                return sum(self.sizes.values())
+        
+        with self._lock:
+            pids = [getattr(llm, "pid", None) for llm in self.models.values()]
+        return rss + sum(process_rss(pid) or 0 for pid in pids if pid is not None)
+    
+    def _loaded(self, model_id, llm):
+        """Record a finished load's weight size and enforce the memory budget"""
+        if not llm.available:
+            # Stays resident as "failed" so handles report it; /model use retries
+            return
+        
+        # RSS growth would also count torch itself on the first load
+        with self._lock:
+            self.sizes[model_id] = llm.weight_bytes()
+        self._enforce_budget()
+    
+    def _enforce_budget(self):
+        """Unload least recently used models no route points to until under budget"""
+        if self.memory_budget is None:
+            return
+        
+        used = self.memory_used()
+        while used > self.memory_budget:
+            with self._lock:
+                routed = {self.route(route) for route in self.routes}
+                victim = next((model_id for model_id, llm in self.models.items()
+                               if model_id not in routed and llm.ready.done()), None)
+                size = self.sizes.get(victim, 0)
+            if victim is None:
+                print(f"⚠️  KAI uses {used / 2**20:.0f}MB, over the {self.memory_budget / 2**20:.0f}MB budget, "
+                      f"but every loaded model is in use")
+                return
+            
+            print(f"🗑️  Unloading {victim} to stay within the model memory budget")
+            self.unload(victim)
+            self.evictions += 1
+            # Freed heap is not always returned to the OS, so count the model's size as released
+            used = min(self.memory_used(), used - size) if size else self.memory_used()
@@ -0,0 +1,187 @@
+"""
+CPU performance profiles for KaiLLM
+Thread tuning, dynamic int8 quantization and optional torch.compile
+
+Select a profile with KaiLLM(profile="int8") or KAI_CPU_PROFILE=int8.
+Compare profiles on this machine with: python -m kai.profiles --model distilgpt2
+"""
+
+import os
+
+PROFILES = {
+    # torch defaults, full float32
+    "default": {},
+    # One intra-op thread per usable core, no inter-op oversubscription
+    "tuned": {"threads": "auto", "interop_threads": 1},
+    # tuned + int8 weights for every linear layer (smaller, usually faster)
+    "int8": {"threads": "auto", "interop_threads": 1, "quantize": True},
+    # tuned + torch.compile (slow first call, faster steady state)
+    "compiled": {"threads": "auto", "interop_threads": 1, "compile": True}
+}
+
+def resolve_profile(name=None):
+    """
+    Build profile settings from a name and environment overrides
+    
+    Args:
+        name: Profile name (default: KAI_CPU_PROFILE or "default")
+    
+    Environment:
+        KAI_CPU_PROFILE: Profile name
+        KAI_NUM_THREADS: Intra-op thread count override
+        KAI_INTEROP_THREADS: Inter-op thread count override
+    
+    Returns:
+        Dict of profile settings (includes "name")
+    """
+    name = name or os.environ.get("KAI_CPU_PROFILE", "default")
+    if name not in PROFILES:
+        raise ValueError(f"Unknown CPU profile '{name}'. Choose from: {', '.join(PROFILES)}")
+    
+    profile = {"name": name, **PROFILES[name]}
+    if os.environ.get("KAI_NUM_THREADS"):
+        profile["threads"] = int(os.environ["KAI_NUM_THREADS"])
+    if os.environ.get("KAI_INTEROP_THREADS"):
+        profile["interop_threads"] = int(os.environ["KAI_INTEROP_THREADS"])
+    return profile
+
+def apply_threading(profile):
+    """Apply thread settings (call before the model runs anything)"""
+    import torch
+    
+    threads = profile.get("threads")
+    if threads == "auto":
+        threads = _usable_cores()
+    if threads:
+        torch.set_num_threads(threads)
+    
+    interop = profile.get("interop_threads")
+    if interop:
+        try:
+            torch.set_num_interop_threads(interop)
+        except RuntimeError:
+            # Only allowed once, before any inter-op work has started
+            pass
+
+def optimize_model(model, profile):
+    """
+    Apply quantization / compilation from a profile
+    
+    Args:
+        model: Loaded transformers model (CPU)
+        profile: Settings from resolve_profile()
+    
+    Returns:
+        Optimized model (may be the same object)
+    """
+    import torch
+    
+    if profile.get("quantize"):
+        _conv1d_to_linear(model)
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    
+    if profile.get("compile"):
+        model.forward = torch.compile(model.forward, dynamic=True)
+    
+    return model
+
+def _usable_cores():
+    """CPU cores this process may run on"""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def _conv1d_to_linear(module):
+    """
+    Swap GPT-2 style Conv1D layers for equivalent nn.Linear layers
+    
+    distilgpt2/gpt2 implement their projections as Conv1D, which dynamic
+    quantization would otherwise skip.
+    """
+    import torch
+    from transformers.pytorch_utils import Conv1D
+    
+    for name, child in module.named_children():
+        if isinstance(child, Conv1D):
+            in_features, out_features = child.weight.shape
+            linear = torch.nn.Linear(in_features, out_features)
+            linear.weight.data = child.weight.data.t().contiguous()
+            linear.bias.data = child.bias.data
+            setattr(module, name, linear)
+        else:
+            _conv1d_to_linear(child)
+
+def _profile_worker(model_name, profile_name, prompt, max_new_tokens, results):
+    """Load one profile in a fresh process and measure it"""
+    import resource
+    import sys
+    import time
+    from kai.llm import KaiLLM
+    
+    llm = KaiLLM(model=model_name, greedy=True, profile=profile_name)
+    if not llm.is_available():
+        results.put({"profile": profile_name, "error": "model failed to load"})
+        return
+    
+    # One untimed run so compile/allocator warm-up doesn't skew the numbers
+    llm._generate_batch([prompt], 4)
+    
+    start = time.perf_counter()
+    _, tokens = llm._generate_batch([prompt], max_new_tokens)[0]
+    elapsed = time.perf_counter() - start
+    
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_mb = peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    
+    results.put({
+        "profile": profile_name,
+        "tokens": tokens,
+        "seconds": elapsed,
+        "tokens_per_sec": tokens / elapsed if elapsed else 0.0,
+        "peak_rss_mb": peak_mb
+    })
+
+def benchmark_profiles(model_name="distilgpt2", profiles=None, max_new_tokens=64,
+                       prompt="User: Explain what a derivative is.\nAssistant:"):
+    """
+    Measure tokens/sec and peak RSS for each profile
+    
+    Every profile runs in its own process so peak RSS is not shared.
+    
+    Returns:
+        List of result dicts, one per profile
+    """
+    import multiprocessing
+    
+    context = multiprocessing.get_context("spawn")
+    results = []
+    
+    for profile_name in profiles or list(PROFILES):
+        queue = context.Queue()
+        process = context.Process(
+            target=_profile_worker,
+            args=(model_name, profile_name, prompt, max_new_tokens, queue)
+        )
+        process.start()
+        process.join()
+        results.append(queue.get() if not queue.empty() else
+                       {"profile": profile_name, "error": f"exit code {process.exitcode}"})
+    
+    return results
+
+if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Compare KaiLLM CPU profiles")
+    parser.add_argument("--model", default="distilgpt2")
+    parser.add_argument("--profiles", default=",".join(PROFILES))
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    args = parser.parse_args()
+    
+    print(f"{'profile':<10}  {'tokens/s':>9}  {'peak RSS':>10}")
+    for row in benchmark_profiles(args.model, args.profiles.split(","), args.max_new_tokens):
+        if "error" in row:
+            print(f"{row['profile']:<10}  ❌ {row['error']}")
+        else:
+            print(f"{row['profile']:<10}  {row['tokens_per_sec']:>9.1f}  {row['peak_rss_mb']:>7.0f} MB")
@@ -1,30 +1,104 @@
 """
 Command router - parses and dispatches commands to appropriate tools
 No LLM calls here - pure routing logic
+Tools are registered by dotted path and only imported/built on first use
 """
 
-from kai.tools.task_tool import TaskTool
-from kai.tools.study_tool import StudyTool
-from kai.tools.calendar_tool import CalendarTool
+import importlib
+import time
+from threading import Lock, Thread
+
+from kai.metrics import metrics
+
+def resolve(path):
+    """Import an object from a dotted path, e.g. kai.tools.task_tool.TaskTool"""
+    module, _, name = path.rpartition(".")
+    return getattr(importlib.import_module(module), name)
 
 class CommandRouter:
     """Routes commands to appropriate tools"""
     
-    def __init__(self, llm=None):
-        self.task_tool = TaskTool()
-        self.study_tool = StudyTool(llm)
-        self.calendar_tool = CalendarTool()
-        self.commands = {
-            "/task": self.task_tool,
-            "/study": self.study_tool,
-            "/calendar": self.calendar_tool,
-            "/help": self._show_help
-        }
+    def __init__(self, llm=None, stream=False, index=None, prefetch=True, pool=None):
+        """
+        Args:
+            llm: KaiLLM passed to tools that generate text (ignored when pool is given)
+            stream: Let tools return text chunk generators
+            index: VectorIndex shared with StudyTool
+            prefetch: Run tool prefetch hooks (e.g. calendar token refresh)
+                      on background threads right away
+            pool: ModelPool; tools get a handle on their own route and
+                  /model switches models at runtime
+        """
+        self.prefetch = prefetch
+        self.pool = pool
+        self.commands = {"/help": self._show_help, "/stats": self._show_stats}
+        self._factories = {}
+        self._lock = Lock()
+        
+        self.register("/task", "kai.tools.task_tool.TaskTool")
+        self.register("/study", "kai.tools.study_tool.StudyTool",
+                      llm=pool.handle("study") if pool else llm, stream=stream, index=index)
+        self.register("/calendar", "kai.tools.calendar_tool.CalendarTool",
+                      prefetch="kai.tools.calendar_tool.prefetch_credentials", stream=stream)
+        if pool is not None:
+            self.register("/model", "kai.tools.model_tool.ModelTool", pool=pool)
+    
+    def register(self, command, factory, prefetch=None, **kwargs):
+        """
+        Register a tool without importing or building it
+        
+        Args:
+            command: Command word, e.g. "/task"
+            factory: Dotted path (or callable) returning the tool; called
+                     with kwargs on the command's first use
+            prefetch: Optional dotted path (or callable) of a no-argument
+                      function run on a background thread now, for slow,
+                      non-interactive setup such as credential refresh
+        """
+        with self._lock:
+            self.commands.pop(command, None)
+            self._factories[command] = (factory, kwargs)
+        
+        if prefetch and self.prefetch:
+            def run():
+                try:
+                    (resolve(prefetch) if isinstance(prefetch, str) else prefetch)()
+                except Exception:
+                    # Prefetching is an optimization; the tool retries on use
+                    pass
+            Thread(target=run, daemon=True, name=f"kai-prefetch{command.replace('/', '-')}").start()
+    
+    def tool(self, command):
+        """The tool for a command, building it on first use (None if unknown)"""
+        if command in self.commands:
+            return self.commands[command]
+        
+        with self._lock:
+            if command not in self.commands:
+                if command not in self._factories:
+                    return None
+                factory, kwargs = self._factories[command]
+                if isinstance(factory, str):
+                    factory = resolve(factory)
+                self.commands[command] = factory(**kwargs)
+            return self.commands[command]
     
     def is_command(self, text):
         """Check if input starts with a command"""
         return text.strip().startswith("/")
     
+    def generates(self, command_text):
+        """
+        Whether a command waits on the LLM (e.g. /study quiz)
+        
+        Tools tell through a generates(args) method; tools without one never generate.
+        """
+        parts = command_text.strip().split(None, 1)
+        tool = self.tool(parts[0].lower()) if parts else None
+        if not hasattr(tool, "generates"):
+            return False
+        return tool.generates(parts[1] if len(parts) > 1 else "")
+    
     def route(self, command_text):
         """
         Parse and execute command
@@ -33,7 +107,8 @@ class CommandRouter:
             command_text: Full command string (e.g., "/task add Do homework")
             
         Returns:
-            Command output as string
+            Command output as string (or text chunk generator for
+            streamed LLM output)
         """
         parts = command_text.strip().split(None, 1)
         
@@ -43,14 +118,41 @@ class CommandRouter:
         command = parts[0].lower()
         args = parts[1] if len(parts) > 1 else ""
         
-        if command in self.commands:
-            tool = self.commands[command]
-            if callable(tool):
-                return tool()
-            else:
-                return tool.execute(args)
-        else:
+        start = time.perf_counter()
+        tool = self.tool(command)
+        if tool is None:
+            metrics.inc("route_unknown")
             return f"❌ Unknown command: {command}\nType /help for available commands"
+        
+        if callable(tool):
+            output = tool()
+        else:
+            output = tool.execute(args)
+        
+        labels = {"command": command, "action": args.split(None, 1)[0].lower() if args else ""}
+        if isinstance(output, str):
+            metrics.observe("route_seconds", time.perf_counter() - start, **labels)
+            return output
+        # Streamed output does its work while being consumed; time it to the end
+        return self._timed_chunks(output, start, labels)
+    
+    def _timed_chunks(self, chunks, start, labels):
+        """Pass chunks through, recording route time once they are exhausted"""
+        try:
+            yield from chunks
+        finally:
+            metrics.observe("route_seconds", time.perf_counter() - start, **labels)
+    
+    def _show_stats(self):
+        """Show latency percentiles gathered since startup, and response cache counters"""
+        output = [metrics.format_stats()]
+        
+        for model_id, stats in self.pool.cache_stats() if self.pool is not None else []:
+            output.append(f"\n  Response cache ({model_id}): {stats['hits']} hits ({stats['disk_hits']} from disk), "
+                          f"{stats['misses']} misses, {stats['hit_rate']:.0%} hit rate, "
+                          f"{stats['memory_entries']} in memory, {stats['disk_bytes'] / 1024:.0f} KB on disk")
+        
+        return "\n".join(output)
     
     def _show_help(self):
         """Show available commands"""
@@ -60,22 +162,32 @@ class CommandRouter:
 Task Management:
   /task add <description>    - Add a new task
   /task list                 - Show all tasks
-  /task done <number>        - Mark task as complete
+  /task done <n[,n,a-b]>     - Mark task(s) as complete
   /task clear                - Clear all tasks
 
 Study Tools:
   /study save <topic> <note> - Save study note
   /study show <topic>        - Show notes for topic
   /study list                - List all topics
+  /study search <query>      - Search all notes
   /study quiz <topic>        - Get AI-generated quiz
 
 Calendar (Google Calendar):
   /calendar add <title> [description] - Add event to calendar
   /calendar list [days]               - Show upcoming events (default: 7 days)
   /calendar remove <title>            - Delete event from calendar
+  /calendar remove --match <pattern>  - Delete all matching events (next 30 days)
+  /calendar import <file.ics>         - Add every event from an .ics file
+  /calendar sync                      - Refresh the local copy of your calendar
+
+Models:
+  /model use <id> [--for study]       - Switch chat (or a tool) to another model
+  /model list                         - Show loaded models and memory use
+  /model unload <id>                  - Free a model nothing is using
 
 General:
   /help                      - Show this help message
+  /stats                     - Show latency/throughput percentiles
   exit, quit, bye            - Exit KAI
 
 💡 Anything without / will be sent to the LLM for conversation.
@@ -0,0 +1,348 @@
+"""
+KAI server - asyncio front end for several concurrent users
+Line-delimited JSON over a local TCP or Unix socket
+
+Request:  {"id": 1, "session": "alice", "input": "/task list", "stream": false}
+Response: {"id": 1, "session": "alice", "ok": true, "output": "..."}
+Streamed chat replies send {"id": 1, "chunk": "..."} lines before the final response.
+"""
+
+import asyncio
+import json
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from kai.llm import SYSTEM_PROMPT
+from kai.memory import Memory
+from kai.sessions import SessionLog
+
+class KaiServer:
+    """Serves chat and commands to many sessions without head-of-line blocking"""
+    
+    def __init__(self, llm, router, llm_workers=1, command_workers=4,
+                 max_pending=32, max_inflight_per_connection=4,
+                 max_sessions=100, max_prompt_tokens=768, index=None, sessions_dir=None):
+        """
+        Initialize server state
+        
+        Args:
+            llm: KaiLLM instance shared by all sessions
+            router: CommandRouter shared by all sessions
+            llm_workers: Threads running LLM generation
+            command_workers: Threads running tool commands
+            max_pending: Requests queued or running before new ones are rejected
+            max_inflight_per_connection: Requests per connection before reading pauses
+            max_sessions: Conversation memories kept in RAM (least recently used
+                          dropped; persisted sessions are resumed on their next request)
+            max_prompt_tokens: Token budget for each session's chat prompt
+            index: Optional VectorIndex for recall (shared by all sessions)
+            sessions_dir: Directory to persist sessions in (None = in memory only)
+        """
+        self.llm = llm
+        self.router = router
+        self.max_pending = max_pending
+        self.max_inflight_per_connection = max_inflight_per_connection
+        self.max_sessions = max_sessions
+        self.max_prompt_tokens = max_prompt_tokens
+        self.index = index
+        self.sessions_dir = sessions_dir
+        self.llm_executor = ThreadPoolExecutor(llm_workers, thread_name_prefix="kai-llm")
+        self.command_executor = ThreadPoolExecutor(command_workers, thread_name_prefix="kai-cmd")
+        self.sessions = OrderedDict()
+        self.pending = 0
+        self._session_locks = {}
+        # Requests using or waiting for each session (only idle sessions are evicted)
+        self._session_users = {}
+    
+    async def handle_request(self, request, send_chunk=None):
+        """
+        Execute one request
+        
+        Args:
+            request: Parsed request dict
+            send_chunk: Optional coroutine function receiving streamed text
+        
+        Returns:
+            Response dict
+        """
+        request_id = request.get("id")
+        session_id = str(request.get("session") or "default")
+        text = str(request.get("input", "")).strip()
+        response = {"id": request_id, "session": session_id}
+        
+        if not text:
+            return {**response, "ok": False, "error": "empty input"}
+        
+        if self.pending >= self.max_pending:
+            return {**response, "ok": False, "error": "busy"}
+        
+        self.pending += 1
+        try:
+            if self.router.is_command(text):
+                output = await self._run_command(text)
+            else:
+                stream = send_chunk if request.get("stream") else None
+                output = await self._chat(session_id, text, stream)
+            return {**response, "ok": True, "output": output}
+        except Exception as e:
+            return {**response, "ok": False, "error": str(e)}
+        finally:
+            self.pending -= 1
+    
+    async def _run_command(self, text):
+        """
+        Route a command on a worker pool
+        
+        Tools lock their own state, so commands run concurrently. Commands
+        that wait on the LLM (quizzes) run on the LLM pool, bounded by llm_workers.
+        """
+        loop = asyncio.get_running_loop()
+        # Off the loop: the first use of a tool builds it (opens its storage)
+        generates = await loop.run_in_executor(self.command_executor, self.router.generates, text)
+        executor = self.llm_executor if generates else self.command_executor
+        return await loop.run_in_executor(executor, self.router.route, text)
+    
+    async def _chat(self, session_id, text, send_chunk=None):
+        """Run one chat turn for a session on the LLM pool"""
+        lock = self._session_locks.setdefault(session_id, asyncio.Lock())
+        self._session_users[session_id] = self._session_users.get(session_id, 0) + 1
+        loop = asyncio.get_running_loop()
+        
+        try:
+            # Turns of one session are sequential; sessions run in parallel
+            async with lock:
+                memory = await self._get_memory(session_id)
+                # Log writes, token counting and recall search stay off the event loop
+                messages = await loop.run_in_executor(self.command_executor, self._prepare_turn, memory, text)
+                
+                if send_chunk is None:
+                    reply = await loop.run_in_executor(
+                        self.llm_executor,
+                        lambda: self.llm.chat(messages, cache_key=session_id)
+                    )
+                else:
+                    reply = await self._stream_chat(messages, session_id, send_chunk)
+                
+                await loop.run_in_executor(self.command_executor, memory.add_message, "assistant", reply)
+        finally:
+            self._session_users[session_id] -= 1
+            if not self._session_users[session_id]:
+                del self._session_users[session_id]
+        
+        # Sessions that were busy when others arrived can go now
+        await self._evict_idle()
+        return reply
+    
+    def _prepare_turn(self, memory, text):
+        """Record the user's message and build the prompt messages (blocking)"""
+        memory.add_message("user", text)
+        return memory.build_messages(SYSTEM_PROMPT, query=text)
+    
+    async def _stream_chat(self, messages, session_id, send_chunk):
+        """Drive a streaming chat on the LLM pool, forwarding chunks to the client"""
+        loop = asyncio.get_running_loop()
+        chunks = asyncio.Queue()
+        
+        def produce():
+            try:
+                for chunk in self.llm.chat(messages, stream=True, cache_key=session_id):
+                    loop.call_soon_threadsafe(chunks.put_nowait, chunk)
+            finally:
+                loop.call_soon_threadsafe(chunks.put_nowait, None)
+        
+        task = loop.run_in_executor(self.llm_executor, produce)
+        parts = []
+        
+        while True:
+            chunk = await chunks.get()
+            if chunk is None:
+                break
+            parts.append(chunk)
+            await send_chunk(chunk)
+        
+        await task
+        return "".join(parts).strip()
+    
+    async def _get_memory(self, session_id):
+        """Get (or create) a session's memory, evicting the least recently used idle ones"""
+        if session_id in self.sessions:
+            self.sessions.move_to_end(session_id)
+            return self.sessions[session_id]
+        
+        loop = asyncio.get_running_loop()
+        memory = await loop.run_in_executor(self.command_executor, self._open_memory, session_id)
+        self.sessions[session_id] = memory
+        await self._evict_idle()
+        return memory
+    
+    async def _evict_idle(self):
+        """
+        Close the least recently used sessions over max_sessions
+        
+        A session with a turn running or waiting keeps its memory and lock
+        (so no second SessionLog is ever opened on its files); it is evicted
+        after its last turn instead.
+        """
+        loop = asyncio.get_running_loop()
+        for old_id in list(self.sessions):
+            if len(self.sessions) <= self.max_sessions:
+                break
+            if old_id not in self.sessions or old_id in self._session_users:
+                continue
+            old_memory = self.sessions.pop(old_id)
+            old_lock = self._session_locks.setdefault(old_id, asyncio.Lock())
+            # A request arriving meanwhile waits until the log is closed
+            async with old_lock:
+                await loop.run_in_executor(self.command_executor, self._close_memory, old_id, old_memory)
+            if old_id not in self._session_users:
+                self._session_locks.pop(old_id, None)
+    
+    def _open_memory(self, session_id):
+        """Create a session's memory, resuming its log if persisted (blocking)"""
+        log = SessionLog(session_id, self.sessions_dir) if self.sessions_dir else None
+        memory = Memory(token_counter=self.llm.count_tokens, max_tokens=self.max_prompt_tokens,
+                        index=self.index, session=session_id, log=log)
+        memory.on_reset(lambda: self.llm.reset_cache(session_id))
+        return memory
+    
+    def _close_memory(self, session_id, memory):
+        """Drop an evicted session's cache and close its log (blocking)"""
+        self.llm.reset_cache(session_id)
+        memory.close()
+    
+    async def handle_connection(self, reader, writer):
+        """Read requests from one client and answer them as they complete"""
+        connection_session = uuid.uuid4().hex[:8]
+        inflight = asyncio.Semaphore(self.max_inflight_per_connection)
+        write_lock = asyncio.Lock()
+        tasks = set()
+        
+        async def send(message):
+            async with write_lock:
+                writer.write((json.dumps(message) + "\n").encode())
+                await writer.drain()
+        
+        async def process(request):
+            try:
+                request_id = request.get("id")
+                
+                async def send_chunk(chunk):
+                    await send({"id": request_id, "chunk": chunk})
+                
+                await send(await self.handle_request(request, send_chunk))
+            finally:
+                inflight.release()
+        
+        try:
+            while True:
+                # Stop reading (and let the socket buffer fill) while saturated
+                await inflight.acquire()
+                line = await reader.readline()
+                if not line:
+                    inflight.release()
+                    break
+                
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("request must be a JSON object")
+                except ValueError as e:
+                    inflight.release()
+                    await send({"ok": False, "error": f"invalid request: {e}"})
+                    continue
+                
+                request.setdefault("session", connection_session)
+                task = asyncio.create_task(process(request))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            writer.close()
+    
+    async def serve(self, host="127.0.0.1", port=8765, socket_path=None):
+        """
+        Accept connections until cancelled
+        
+        Args:
+            host: TCP host (ignored when socket_path is set)
+            port: TCP port
+            socket_path: Unix socket path to listen on instead of TCP
+        """
+        if socket_path:
+            server = await asyncio.start_unix_server(self.handle_connection, path=socket_path)
+            print(f"🛰️  KAI server listening on {socket_path}")
+        else:
+            server = await asyncio.start_server(self.handle_connection, host, port)
+            print(f"🛰️  KAI server listening on {host}:{port}")
+        
+        async with server:
+            await server.serve_forever()
+    
+    def close(self):
+        """Shut down worker pools and close session logs"""
+        self.llm_executor.shutdown(wait=False, cancel_futures=True)
+        self.command_executor.shutdown(wait=False, cancel_futures=True)
+        for memory in self.sessions.values():
+            memory.close()
+
+def main():
+    """Command-line entry point: python -m kai.server"""
+    import argparse
+    from kai.llm import KaiLLM
+    from kai.metrics import start_exporter
+    from kai.router import CommandRouter
+    from kai.vector_index import VectorIndex
+    
+    parser = argparse.ArgumentParser(description="Run KAI as a local multi-session service")
+    parser.add_argument("--model", default="distilgpt2")
+    parser.add_argument("--assistant-model", help="Draft model for assisted decoding, e.g. distilgpt2")
+    parser.add_argument("--worker", action="store_true",
+                        help="Generate in a separate worker process (keeps the event loop off the model's GIL)")
+    parser.add_argument("--timeout", type=float, help="Seconds a generation may run before it is stopped")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--socket", help="Unix socket path (instead of TCP)")
+    parser.add_argument("--llm-workers", type=int, default=1)
+    parser.add_argument("--command-workers", type=int, default=4)
+    parser.add_argument("--max-pending", type=int, default=32)
+    parser.add_argument("--max-inflight", type=int, default=4,
+                        help="Requests per connection before reading pauses")
+    parser.add_argument("--sessions-dir", default="data/sessions",
+                        help="Where conversations are saved ('' keeps them in memory only)")
+    args = parser.parse_args()
+    
+    start_exporter()
+    if args.worker:
+        from kai.worker import WorkerLLM
+        llm = WorkerLLM(model=args.model, timeout=args.timeout, assistant_model=args.assistant_model)
+    else:
+        llm = KaiLLM(model=args.model, background=True, assistant_model=args.assistant_model,
+                     timeout=args.timeout)
+    index = VectorIndex("data/index/recall")
+    server = KaiServer(
+        llm,
+        CommandRouter(llm=llm, index=index),
+        llm_workers=args.llm_workers,
+        command_workers=args.command_workers,
+        max_pending=args.max_pending,
+        max_inflight_per_connection=args.max_inflight,
+        index=index,
+        sessions_dir=args.sessions_dir or None
+    )
+    
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.socket))
+    except KeyboardInterrupt:
+        print("\n👋 KAI server stopped\n")
+    finally:
+        server.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""
+Sessions - persistent, append-only conversation logs
+Each session is a JSON-lines log under data/sessions/ with a fixed-width
+offset index next to it, so resuming reads only the tail of a long
+conversation and older turns are paged in on demand
+"""
+
+import hashlib
+import json
+import os
+import re
+import struct
+import time
+from threading import Lock
+
+from kai.metrics import metrics
+
+# Byte offset of each message in the log (little-endian uint64)
+OFFSET = struct.Struct("<Q")
+
+class Message:
+    """One conversation turn (slots keep a long tail window small in RAM)"""
+    
+    __slots__ = ("role", "content", "created")
+    
+    def __init__(self, role, content, created=None):
+        self.role = role
+        self.content = content
+        self.created = created if created is not None else time.time()
+    
+    def __getitem__(self, key):
+        """Dict-style access (msg["content"]) for code written against message dicts"""
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+    
+    def to_dict(self):
+        """Message dict for KaiLLM.chat"""
+        return {"role": self.role, "content": self.content}
+    
+    def __repr__(self):
+        return f"<Message {self.role}: {self.content[:40]!r}>"
+
+def session_file_name(session_id):
+    """File name stem for a session id (ids that are not safe file names are hashed)"""
+    if re.fullmatch(r"[A-Za-z0-9_-][A-Za-z0-9_.-]{0,63}", session_id):
+        return session_id
+    return "s-" + hashlib.sha1(session_id.encode("utf-8")).hexdigest()[:16]
+
+class SessionLog:
+    """Append-only message log with an offset index for random access"""
+    
+    def __init__(self, session_id, directory="data/sessions"):
+        """
+        Open (or create) a session's log
+        
+        Creates <directory>/<id>.jsonl (messages), <id>.idx (offsets) and
+        <id>.state.json (summary and window position). A message written
+        without its offset (crash between the two writes) is re-indexed, and
+        a torn last line is cut off.
+        
+        Args:
+            session_id: Session name
+            directory: Directory holding session files
+        """
+        self.session_id = session_id
+        stem = os.path.join(directory, session_file_name(session_id))
+        self.log_file = f"{stem}.jsonl"
+        self.offset_file = f"{stem}.idx"
+        self.state_file = f"{stem}.state.json"
+        self._lock = Lock()
+        
+        os.makedirs(directory, exist_ok=True)
+        self._log = open(self.log_file, 'ab')
+        self._offsets = open(self.offset_file, 'a+b')
+        self._reader = open(self.log_file, 'rb')
+        self.count = self._recover()
+    
+    def __len__(self):
+        return self.count
+    
+    def _recover(self):
+        """Check the offset index against the log; returns the message count"""
+        log_size = os.path.getsize(self.log_file)
+        count = os.path.getsize(self.offset_file) // OFFSET.size
+        
+        # Drop offsets past the end of the log (the log lost its tail)
+        while count:
+            self._offsets.seek((count - 1) * OFFSET.size)
+            last, = OFFSET.unpack(self._offsets.read(OFFSET.size))
+            if last < log_size:
+                break
+            count -= 1
+        self._offsets.truncate(count * OFFSET.size)
+        
+        # Index complete lines written after the last indexed one
+        self._reader.seek(last if count else 0)
+        if count:
+            self._reader.readline()
+        position = self._reader.tell()
+        for line in iter(self._reader.readline, b""):
+            if not line.endswith(b"\n"):
+                break
+            self._offsets.write(OFFSET.pack(position))
+            position += len(line)
+            count += 1
+        
+        if position < log_size:
+            # Torn write at the end
+            self._log.truncate(position)
+            self._log.seek(0, os.SEEK_END)
+        self._offsets.flush()
+        return count
+    
+    @metrics.timed("storage_seconds", store="sessions", op="append")
+    def append(self, message):
+        """Write a message to the end of the log"""
+        line = json.dumps({"role": message.role, "content": message.content, "created": message.created},
+                          ensure_ascii=False).encode("utf-8") + b"\n"
+        with self._lock:
+            offset = self._log.tell()
+            self._log.write(line)
+            self._log.flush()
+            self._offsets.write(OFFSET.pack(offset))
+            self._offsets.flush()
+            self.count += 1
+    
+    @metrics.timed("storage_seconds", store="sessions", op="read")
+    def read(self, start, stop=None):
+        """
+        Messages start..stop-1 (only that part of the log is read)
+        
+        Args:
+            start: Index of the first message
+            stop: Index after the last message (default: end of the log)
+        
+        Returns:
+            List of Message objects, oldest first
+        """
+        with self._lock:
+            stop = self.count if stop is None else min(stop, self.count)
+            start = max(0, start)
+            if start >= stop:
+                return []
+            
+            self._offsets.seek(start * OFFSET.size)
+            first, = OFFSET.unpack(self._offsets.read(OFFSET.size))
+            if stop < self.count:
+                self._offsets.seek(stop * OFFSET.size)
+                end, = OFFSET.unpack(self._offsets.read(OFFSET.size))
+            else:
+                end = self._log.tell()
+            
+            self._reader.seek(first)
+            data = self._reader.read(end - first)
+        
+        rows = (json.loads(line) for line in data.splitlines())
+        return [Message(row["role"], row["content"], row.get("created")) for row in rows]
+    
+    def tail(self, count):
+        """The newest `count` messages"""
+        return self.read(self.count - count)
+    
+    def load_state(self):
+        """Saved window position and summary ({} for a new session)"""
+        try:
+            with open(self.state_file, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
+    def save_state(self, state):
+        """Replace the saved state atomically"""
+        tmp_file = f"{self.state_file}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_file, self.state_file)
+    
+    def close(self):
+        """Close the log files"""
+        with self._lock:
+            for f in (self._log, self._offsets, self._reader):
+                f.close()
@@ -0,0 +1,111 @@
+"""
+Stopping criteria for KaiLLM generation
+Imported lazily (needs torch/transformers) from inside generation calls
+"""
+
+import time
+
+import torch
+from transformers import StoppingCriteria
+
+class StopSignal(StoppingCriteria):
+    """Ends generation after the current token when cancelled or past a deadline"""
+    
+    def __init__(self, event, timeout=None):
+        """
+        Args:
+            event: threading.Event set by KaiLLM.cancel()
+            timeout: Seconds from now after which generation stops (None = no limit)
+        """
+        self.event = event
+        self.timeout = timeout
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self.reason = None
+    
+    def check(self):
+        """Whether generation should stop (records the reason the first time)"""
+        if self.reason is None:
+            if self.event.is_set():
+                self.reason = "cancelled"
+            elif self.deadline is not None and time.monotonic() >= self.deadline:
+                self.reason = "timeout"
+        return self.reason is not None
+    
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.full((input_ids.shape[0],), self.check(), dtype=torch.bool, device=input_ids.device)
+
+class BatchStopSignals(StoppingCriteria):
+    """One StopSignal per sequence of a micro-batch: each sequence ends when its own signal fires"""
+    
+    def __init__(self, signals, prompt_length):
+        """
+        Args:
+            signals: StopSignal (or None) per sequence, in batch order
+            prompt_length: Prompt tokens in front of every sequence (incl. left padding)
+        """
+        self.signals = signals
+        self.prompt_length = prompt_length
+        # New tokens generated when each signal fired (None = never)
+        self.fired_at = [None] * len(signals)
+    
+    def __call__(self, input_ids, scores, **kwargs):
+        step = input_ids.shape[1] - self.prompt_length
+        for i, signal in enumerate(self.signals):
+            if signal is not None and self.fired_at[i] is None and signal.check():
+                self.fired_at[i] = step
+        return torch.tensor([fired is not None for fired in self.fired_at], dtype=torch.bool, device=input_ids.device)
+    
+    def settle(self, counts):
+        """
+        Clear the signals of sequences that had already finished when they fired
+        
+        Finished sequences are still checked every step, so a late timeout
+        or cancel must not mark their complete reply as stopped.
+        
+        Args:
+            counts: New (non-padding) tokens per sequence
+        """
+        for signal, fired, count in zip(self.signals, self.fired_at, counts):
+            if fired is not None and count < fired:
+                signal.reason = None
+
+class StopSequences(StoppingCriteria):
+    """Ends each sequence once its reply contains a stop sequence (e.g. the next "User:" turn)"""
+    
+    def __init__(self, tokenizer, prompt_length, stop):
+        """
+        Args:
+            tokenizer: Tokenizer used to decode the reply
+            prompt_length: Prompt tokens in front of every sequence (incl. left padding)
+            stop: Stop strings; matches inside leading whitespace are ignored
+        """
+        self.tokenizer = tokenizer
+        self.prompt_length = prompt_length
+        self.stop = tuple(stop)
+    
+    def __call__(self, input_ids, scores, **kwargs):
+        # Replies are a few hundred tokens at most, so decoding them whole each step is cheap
+        texts = self.tokenizer.batch_decode(input_ids[:, self.prompt_length:], skip_special_tokens=True)
+        done = [find_stop(text, self.stop) is not None for text in texts]
+        return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
+
+def find_stop(text, stop):
+    """Index where the first stop sequence starts in text (after leading whitespace), or None"""
+    start = len(text) - len(text.lstrip())
+    hits = [index for index in (text.find(sequence, start) for sequence in stop) if index >= 0]
+    return min(hits) if hits else None
+
+def cut_at_stop(text, stop):
+    """Text up to its first stop sequence"""
+    index = find_stop(text, stop)
+    return text if index is None else text[:index]
+
+def held_back(text, stop):
+    """Length of the longest end of text that could still grow into a stop sequence"""
+    longest = 0
+    for sequence in stop:
+        for size in range(min(len(sequence) - 1, len(text)), longest, -1):
+            if sequence.startswith(text[-size:]):
+                longest = size
+                break
+    return longest
@@ -0,0 +1,128 @@
+"""
+Storage helpers shared by KAI's data stores
+Cross-process file locks, crash-safe atomic file replacement and SQLite
+connections and transactions for several KAI processes working on one data/ directory
+(e.g. an interactive session and a cron batch job)
+"""
+
+import os
+import sqlite3
+import tempfile
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+# Seconds SQLite waits for another process's write lock before failing
+BUSY_TIMEOUT = 30.0
+
+@contextmanager
+def file_lock(path):
+    """
+    Exclusive lock on <path>.lock shared by every process (blocks until free)
+    
+    The lock file is never removed, so every process always locks the same inode.
+    """
+    fd = os.open(f"{path}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        else:
+            msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+    finally:
+        os.close(fd)
+
+def atomic_write(path, data):
+    """
+    Replace a file so readers (and a crash) see either the old or the new content
+    
+    Each writer uses its own temp file, which is fsynced before the rename;
+    the directory is fsynced after it so the rename itself is durable.
+    
+    Args:
+        path: Target file
+        data: str (UTF-8) or bytes
+    """
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    
+    directory = os.path.dirname(path) or "."
+    fd, tmp_file = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, path)
+    except BaseException:
+        if os.path.exists(tmp_file):
+            os.unlink(tmp_file)
+        raise
+    
+    if fcntl is not None:
+        dir_fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+def file_signature(path):
+    """Cheap change marker for a file replaced atomically (None if it does not exist)"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+def connect_sqlite(db_file):
+    """
+    SQLite connection for a store shared by threads and processes
+    
+    WAL lets readers run next to a writer; writers queue on the busy
+    timeout instead of failing with "database is locked". Autocommit mode,
+    so stores open their own BEGIN IMMEDIATE transactions.
+    """
+    conn = sqlite3.connect(db_file, timeout=BUSY_TIMEOUT, check_same_thread=False, isolation_level=None)
+    conn.execute(f"PRAGMA busy_timeout = {int(BUSY_TIMEOUT * 1000)}")
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+@contextmanager
+def sqlite_transaction(conn, lock):
+    """
+    One atomic commit for the writes in the block (nested calls join the outer one)
+    
+    Args:
+        conn: Connection from connect_sqlite()
+        lock: RLock guarding conn, held for the whole transaction
+    
+    Yields:
+        conn
+    """
+    with lock:
+        # Only the outermost call opens, commits or rolls back the transaction
+        outer = not conn.in_transaction
+        if outer:
+            conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            if outer and conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        else:
+            if outer:
+                conn.execute("COMMIT")
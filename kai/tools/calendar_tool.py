@@ -2,68 +2,186 @@
 Google Calendar integration tool
 Handles calendar events - add, list, update, delete
 Requires Google Calendar API setup
+Google client libraries are imported on first use to keep startup fast
+Events are mirrored locally (incremental sync) so list/remove work offline
+Bulk writes (import, remove --match) go out as batch requests of up to 50 calls
+
+Set KAI_CALENDAR_API_URL (e.g. http://127.0.0.1:8080/) to talk to a local
+stand-in server instead of Google; without a saved token no auth is sent.
 """
 
+import fnmatch
 import os
 import json
+import re
+import time
+from concurrent.futures import Future
 from datetime import datetime, timedelta
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google.auth.oauthlib.flow import InstalledAppFlow
-from google_auth_httplib2 import AuthorizedHttp
-from googleapiclient.discovery import build
-import httplib2
+from threading import Lock, Thread
+
+from kai.tools.event_store import EventStore
 
 SCOPES = ['https://www.googleapis.com/auth/calendar']
 TOKEN_FILE = 'data/google_token.json'
 CREDENTIALS_FILE = 'data/credentials.json'
+# Calls per batch request (the Calendar API allows up to 50)
+BATCH_SIZE = 50
+# Attempts for calls that fail with rate limits, server or connection errors
+MAX_RETRIES = 3
+# Seconds before retrying after a failed automatic sync (doubles per failure, up to the max)
+SYNC_BACKOFF = 30
+SYNC_BACKOFF_MAX = 600
+
+# Credentials shared by every CalendarTool in the process (a Future, see prefetch_credentials)
+_credentials = None
+_credentials_lock = Lock()
+
+def prefetch_credentials():
+    """
+    Load and refresh the saved token on a background thread
+    
+    Never starts the interactive browser flow. The result (credentials or
+    None when there is no usable token) is cached for CalendarTool.
+    
+    Returns:
+        Future for the credentials
+    """
+    global _credentials
+    with _credentials_lock:
+        if _credentials is None:
+            _credentials = Future()
+            Thread(target=_load_credentials, args=(_credentials,), daemon=True,
+                   name="kai-calendar-auth").start()
+        return _credentials
+
+def _load_credentials(future):
+    """Resolve a credentials Future from the saved token (non-interactive)"""
+    try:
+        future.set_result(_saved_credentials())
+    except Exception as e:
+        future.set_exception(e)
+
+def _saved_credentials():
+    """Saved token, refreshed if expired; None if there is none or it is unusable"""
+    if not os.path.exists(TOKEN_FILE):
+        if os.environ.get("KAI_CALENDAR_API_URL"):
+            from google.auth.credentials import AnonymousCredentials
+            return AnonymousCredentials()
+        return None
+    
+    from google.auth.transport.requests import Request
+    from google.oauth2.credentials import Credentials
+    
+    creds = Credentials.from_authorized_user_file(TOKEN_FILE, SCOPES)
+    if creds.valid:
+        return creds
+    if not (creds.expired and creds.refresh_token):
+        return None
+    
+    creds.refresh(Request())
+    _save_credentials(creds)
+    return creds
+
+def _save_credentials(creds):
+    """Save token for next run"""
+    os.makedirs(os.path.dirname(TOKEN_FILE), exist_ok=True)
+    with open(TOKEN_FILE, 'w') as token:
+        token.write(creds.to_json())
 
 class CalendarTool:
     """Manages Google Calendar events"""
     
-    def __init__(self):
-        self.service = None
+    def __init__(self, service=None, store=None, max_staleness=None, stream=False):
+        """
+        Args:
+            service: Calendar API client (default: authenticate on first use);
+                     any object with the same events() interface works, e.g. a local fake
+            store: EventStore for the local copy (default: data/calendar.db)
+            max_staleness: Seconds a local copy is served before re-syncing
+                           (default: KAI_CALENDAR_MAX_STALENESS or 60)
+            stream: Return bulk command progress as a line generator
+        """
+        self._service = service
+        self._authenticated = service is not None
         self.calendar_id = 'primary'
-        self._authenticate()
+        self.store = store or EventStore()
+        if max_staleness is None:
+            max_staleness = float(os.environ.get("KAI_CALENDAR_MAX_STALENESS", 60))
+        self.max_staleness = max_staleness
+        self.stream = stream
+        self.api_url = os.environ.get("KAI_CALENDAR_API_URL")
+        # Last failed automatic sync: (time, consecutive failures, error)
+        self._sync_failure = None
+    
+    @property
+    def service(self):
+        """Google Calendar client, authenticated on first use"""
+        if not self._authenticated:
+            self._authenticated = True
+            try:
+                self._authenticate()
+            except Exception:
+                # e.g. token refresh while offline; try again next time
+                self._authenticated = False
+                raise
+        return self._service
     
     def _authenticate(self):
         """Authenticate with Google Calendar API"""
-        creds = None
+        global _credentials
         
-        # Load existing token
-        if os.path.exists(TOKEN_FILE):
-            creds = Credentials.from_authorized_user_file(TOKEN_FILE, SCOPES)
+        try:
+            import httplib2
+            from google_auth_httplib2 import AuthorizedHttp
+            from google_auth_oauthlib.flow import InstalledAppFlow
+            from googleapiclient.discovery import build
+        except ImportError:
+            return False
         
-        # Refresh or create new token
-        if not creds or not creds.valid:
-            if creds and creds.expired and creds.refresh_token:
-                creds.refresh(Request())
-            else:
-                # Need credentials.json from Google Cloud Console
-                if not os.path.exists(CREDENTIALS_FILE):
-                    return False
-                
-                flow = InstalledAppFlow.from_client_secrets_file(
-                    CREDENTIALS_FILE, SCOPES)
-                creds = flow.run_local_server(port=0)
+        # Usually already loaded by the router's background prefetch
+        try:
+            creds = prefetch_credentials().result()
+        except Exception:
+            # e.g. refresh failed while offline: forget it so the next use retries
+            with _credentials_lock:
+                _credentials = None
+            raise
+        
+        if not creds:
+            # Need credentials.json from Google Cloud Console
+            if not os.path.exists(CREDENTIALS_FILE):
+                return False
+            
+            flow = InstalledAppFlow.from_client_secrets_file(
+                CREDENTIALS_FILE, SCOPES)
+            creds = flow.run_local_server(port=0)
+            _save_credentials(creds)
             
-            # Save token for next run
-            os.makedirs('data', exist_ok=True)
-            with open(TOKEN_FILE, 'w') as token:
-                token.write(creds.to_json())
+            with _credentials_lock:
+                _credentials = Future()
+                _credentials.set_result(creds)
         
-        self.service = build('calendar', 'v3', credentials=creds)
+        # One authorized connection, reused by every call and batch
+        http = AuthorizedHttp(creds, http=httplib2.Http(timeout=30))
+        options = {"api_endpoint": self.api_url.rstrip("/") + "/calendar/v3/"} if self.api_url else None
+        self._service = build('calendar', 'v3', http=http, client_options=options)
         return True
     
     def execute(self, args):
         """Execute calendar command"""
-        if not self.service:
-            return "❌ Google Calendar not configured. See /help for setup instructions."
+        # A previously synced local copy is enough to list and remove offline
+        _, synced_at = self.store.sync_state(self.calendar_id)
+        if synced_at is None:
+            try:
+                if not self.service:
+                    return "❌ Google Calendar not configured. See /help for setup instructions."
+            except Exception as e:
+                return f"❌ Could not connect to Google Calendar: {str(e)}"
         
         parts = args.strip().split(None, 2)
         
         if not parts:
-            return "❌ Usage: /calendar <add|list|remove> [args]"
+            return "❌ Usage: /calendar <add|list|remove|import|sync> [args]"
         
         action = parts[0].lower()
         params = parts[1] if len(parts) > 1 else ""
@@ -74,9 +192,331 @@ class CalendarTool:
         elif action == "list":
             return self._list_events(params)
         elif action == "remove":
-            return self._remove_event(params)
+            rest = args.strip()[len(parts[0]):].strip()
+            if rest.startswith("--match"):
+                return self._output(self._remove_matching(rest[len("--match"):].strip()))
+            return self._remove_event(rest)
+        elif action == "import":
+            return self._output(self._import_ics(args.strip()[len(parts[0]):].strip()))
+        elif action == "sync":
+            return self._sync_command()
         else:
-            return f"❌ Unknown action: {action}\nUse: add, list, remove"
+            return f"❌ Unknown action: {action}\nUse: add, list, remove, import, sync"
+    
+    def sync(self, full=False, retry=True):
+        """
+        Bring the local copy up to date
+        
+        Uses the stored sync token to fetch only changes; without one (or
+        when the server answers 410 Gone) all events are fetched again.
+        Pending offline deletions are sent first. The local copy is only
+        replaced once every page has arrived, so a failed sync changes nothing.
+        
+        Args:
+            full: Ignore the sync token and fetch everything
+            retry: Retry pending deletions that fail transiently (with backoff)
+        
+        Returns:
+            Number of changed events received
+        
+        Raises:
+            Whatever the Calendar client raises (e.g. when offline)
+        """
+        if not self.service:
+            raise RuntimeError("Google Calendar not configured")
+        
+        pending = self.store.pending_deletes(self.calendar_id)
+        calls = [(event_id, self._delete_request(event_id)) for event_id in pending]
+        for event_id, _, error in self._execute_batch(calls, retries=MAX_RETRIES if retry else 0):
+            if error is not None and _http_status(error) not in (404, 410):
+                raise error
+            self.store.remove(self.calendar_id, event_id)
+        
+        sync_token = None if full else self.store.sync_state(self.calendar_id)[0]
+        
+        try:
+            items, next_token = self._fetch_changes(sync_token)
+        except Exception as e:
+            if sync_token is None or _http_status(e) != 410:
+                raise
+            # Token expired or invalidated by the server: start over
+            sync_token = None
+            items, next_token = self._fetch_changes(None)
+        
+        with self.store.transaction():
+            if sync_token is None:
+                self.store.reset(self.calendar_id)
+            self.store.apply(self.calendar_id, items)
+            self.store.set_sync_state(self.calendar_id, next_token)
+        
+        return len(items)
+    
+    def _fetch_changes(self, sync_token):
+        """Page through events().list; returns (items, nextSyncToken)"""
+        items = []
+        page_token = None
+        
+        while True:
+            params = {"calendarId": self.calendar_id, "singleEvents": True, "maxResults": 2500}
+            if sync_token:
+                params["syncToken"] = sync_token
+            if page_token:
+                params["pageToken"] = page_token
+            
+            page = self.service.events().list(**params).execute()
+            items.extend(page.get("items", []))
+            page_token = page.get("nextPageToken")
+            if not page_token:
+                return items, page.get("nextSyncToken")
+    
+    def _refresh(self):
+        """
+        Sync if the local copy is older than max_staleness
+        
+        After a failed sync the local copy is served without touching the
+        network for SYNC_BACKOFF seconds (doubling with each further failure),
+        so working offline does not wait on a connection timeout every time.
+        
+        Returns:
+            Warning text when the copy could not be refreshed, else ""
+        """
+        _, synced_at = self.store.sync_state(self.calendar_id)
+        if synced_at is not None and time.time() - synced_at <= self.max_staleness:
+            return ""
+        
+        if self._sync_failure is not None:
+            failed_at, failures, error = self._sync_failure
+            if time.time() - failed_at < min(SYNC_BACKOFF * 2 ** (failures - 1), SYNC_BACKOFF_MAX):
+                return self._offline_warning(synced_at, error)
+        
+        try:
+            # No retry sleeps here: a command is waiting, and the next refresh tries again
+            self.sync(retry=False)
+        except Exception as e:
+            failures = self._sync_failure[1] + 1 if self._sync_failure else 1
+            self._sync_failure = (time.time(), failures, e)
+            return self._offline_warning(synced_at, e)
+        
+        self._sync_failure = None
+        return ""
+    
+    def _offline_warning(self, synced_at, error):
+        """Warning for a local copy that could not be refreshed (raises error if there is none)"""
+        if synced_at is None:
+            raise error
+        age = datetime.fromtimestamp(synced_at).strftime("%Y-%m-%d %H:%M")
+        return f"⚠️ Offline ({error}); showing events as of {age}\n"
+    
+    def _sync_command(self):
+        """Force a sync and report what changed"""
+        try:
+            changed = self.sync()
+        except Exception as e:
+            return f"❌ Error syncing calendar: {str(e)}"
+        self._sync_failure = None
+        return f"✅ Calendar synced ({changed} changes)"
+    
+    def _output(self, lines):
+        """Stream progress lines, or join them when not streaming"""
+        if self.stream:
+            return (f"{line}\n" for line in lines)
+        return "\n".join(lines)
+    
+    def _delete_request(self, event_id):
+        """Factory for a delete call (a fresh request object per attempt)"""
+        return lambda: self.service.events().delete(calendarId=self.calendar_id, eventId=event_id)
+    
+    def _execute_batch(self, calls, retries=MAX_RETRIES):
+        """
+        Run API calls in batch requests, retrying transient failures
+        
+        Calls go out BATCH_SIZE at a time over the service's connection.
+        Rate limits (429, 403 rateLimitExceeded), 5xx and connection errors
+        are retried up to `retries` times with backoff; other errors are
+        final. Clients without batch support (e.g. a fake) run calls one by one.
+        
+        Args:
+            calls: List of (key, factory) where factory() returns an API request
+            retries: Retries for transient failures (0 = fail fast)
+        
+        Yields:
+            (key, response, error) as each call finishes; error is None on success
+        """
+        pending = list(calls)
+        
+        for attempt in range(retries + 1):
+            retry = []
+            
+            for start in range(0, len(pending), BATCH_SIZE):
+                chunk = pending[start:start + BATCH_SIZE]
+                for (key, factory), (response, error) in zip(chunk, self._send_batch(chunk)):
+                    if error is not None and attempt < retries and _retryable(error):
+                        retry.append((key, factory))
+                    else:
+                        yield key, response, error
+            
+            if not retry:
+                return
+            time.sleep(0.5 * 2 ** attempt)
+            pending = retry
+    
+    def _send_batch(self, chunk):
+        """Send one batch; returns [(response, error)] in chunk order"""
+        results = [(None, None)] * len(chunk)
+        
+        if not hasattr(self.service, "new_batch_http_request"):
+            for i, (_, factory) in enumerate(chunk):
+                try:
+                    results[i] = (factory().execute(), None)
+                except Exception as e:
+                    results[i] = (None, e)
+            return results
+        
+        def collect(request_id, response, exception):
+            results[int(request_id)] = (response, exception)
+        
+        batch = self._new_batch(collect)
+        for i, (_, factory) in enumerate(chunk):
+            batch.add(factory(), request_id=str(i))
+        
+        try:
+            batch.execute()
+        except Exception as e:
+            # The batch itself failed (e.g. connection lost): every call is retryable
+            return [(None, e)] * len(chunk)
+        return results
+    
+    def _new_batch(self, callback):
+        """Batch request object, pointed at the stand-in server when configured"""
+        if self.api_url:
+            from googleapiclient.http import BatchHttpRequest
+            return BatchHttpRequest(callback=callback, batch_uri=self.api_url.rstrip("/") + "/batch/calendar/v3")
+        return self.service.new_batch_http_request(callback=callback)
+    
+    def _import_ics(self, path):
+        """
+        Create every event of an .ics file with batched inserts
+        
+        Yields:
+            Progress lines, one per event, then a summary
+        """
+        if not path:
+            yield "❌ Usage: /calendar import <file.ics>"
+            return
+        
+        try:
+            with open(os.path.expanduser(path), 'r', encoding='utf-8') as f:
+                events = parse_ics(f.read())
+        except OSError as e:
+            yield f"❌ Cannot read {path}: {e.strerror}"
+            return
+        
+        if not events:
+            yield f"❌ No events found in {path}"
+            return
+        if not self.service:
+            yield "❌ Google Calendar not configured. See /help for setup instructions."
+            return
+        
+        yield f"📅 Importing {len(events)} events..."
+        calls = [
+            (i, lambda event=event: self.service.events().insert(calendarId=self.calendar_id, body=event))
+            for i, event in enumerate(events)
+        ]
+        created = []
+        failed = 0
+        
+        for i, response, error in self._execute_batch(calls):
+            summary = events[i].get('summary', 'Untitled')
+            if error is None:
+                created.append(response)
+                yield f"  ✓ {summary}"
+            else:
+                failed += 1
+                yield f"  ✗ {summary}: {error}"
+        
+        # Recurring events appear as instances, which only a sync fetches
+        self.store.apply(self.calendar_id, [event for event in created if not event.get("recurrence")])
+        if any(event.get("recurrence") for event in created):
+            try:
+                self.sync()
+            except Exception:
+                pass
+        
+        status = "✅" if not failed else "⚠️"
+        yield f"{status} Imported {len(created)}/{len(events)} events" + (f" ({failed} failed)" if failed else "")
+    
+    def _remove_matching(self, args):
+        """
+        Delete every upcoming event whose title matches a pattern, in batches
+        
+        Args:
+            args: "<pattern> [--days N]"; pattern may use * and ?, plain text
+                  matches anywhere in the title (case-insensitive)
+        
+        Yields:
+            Progress lines, one per event, then a summary
+        """
+        days = 30
+        match = re.search(r"\s*--days\s+(\d+)\s*$", args)
+        if match:
+            days = int(match.group(1))
+            args = args[:match.start()]
+        pattern = args.strip().lower()
+        
+        if not pattern:
+            yield "❌ Usage: /calendar remove --match <pattern> [--days N]"
+            return
+        if not any(char in pattern for char in "*?["):
+            pattern = f"*{pattern}*"
+        
+        try:
+            warning = self._refresh()
+        except Exception as e:
+            yield f"❌ Error removing events: {str(e)}"
+            return
+        
+        now = time.time()
+        events = [event for event in self.store.between(self.calendar_id, now, now + days * 86400)
+                  if fnmatch.fnmatchcase(event.get('summary', '').lower(), pattern)]
+        
+        if warning:
+            yield warning.rstrip("\n")
+        if not events:
+            yield f"❌ No events matching '{args.strip()}' in the next {days} days"
+            return
+        if not self.service:
+            yield "❌ Google Calendar not configured. See /help for setup instructions."
+            return
+        
+        yield f"🗑️ Removing {len(events)} events..."
+        by_id = {event['id']: event for event in events}
+        removed = 0
+        failed = 0
+        
+        for event_id, _, error in self._execute_batch([(event_id, self._delete_request(event_id)) for event_id in by_id]):
+            summary = by_id[event_id].get('summary', 'Untitled')
+            if error is None or _http_status(error) in (404, 410):
+                self.store.remove(self.calendar_id, event_id)
+                removed += 1
+                yield f"  ✓ {summary}"
+            else:
+                failed += 1
+                yield f"  ✗ {summary}: {error}"
+        
+        status = "✅" if not failed else "⚠️"
+        yield f"{status} Removed {removed}/{len(events)} events" + (f" ({failed} failed)" if failed else "")
+    
+    def _delete_remote(self, event_id):
+        """Delete an event on the server (already gone counts as deleted)"""
+        try:
+            self.service.events().delete(
+                calendarId=self.calendar_id,
+                eventId=event_id
+            ).execute()
+        except Exception as e:
+            if _http_status(e) not in (404, 410):
+                raise
     
     def _add_event(self, title, description=""):
         """Add event to Google Calendar"""
@@ -101,6 +541,7 @@ class CalendarTool:
                 calendarId=self.calendar_id,
                 body=event
             ).execute()
+            self.store.apply(self.calendar_id, [result])
             
             return f"✅ Event added to Google Calendar: {title}"
         
@@ -115,23 +556,14 @@ class CalendarTool:
             num_days = 7
         
         try:
-            now = datetime.utcnow().isoformat() + 'Z'
-            end = (datetime.utcnow() + timedelta(days=num_days)).isoformat() + 'Z'
-            
-            events_result = self.service.events().list(
-                calendarId=self.calendar_id,
-                timeMin=now,
-                timeMax=end,
-                singleEvents=True,
-                orderBy='startTime'
-            ).execute()
-            
-            events = events_result.get('items', [])
+            warning = self._refresh()
+            now = time.time()
+            events = self.store.between(self.calendar_id, now, now + num_days * 86400)
             
             if not events:
-                return f"📅 No events in the next {num_days} days"
+                return f"{warning}📅 No events in the next {num_days} days"
             
-            output = [f"📅 Events (Next {num_days} days):\n"]
+            output = [f"{warning}📅 Events (Next {num_days} days):\n"]
             for event in events:
                 start = event['start'].get('dateTime', event['start'].get('date'))
                 summary = event.get('summary', 'Untitled')
@@ -148,30 +580,105 @@ class CalendarTool:
             return "❌ Usage: /calendar remove <event_title>"
         
         try:
-            now = datetime.utcnow().isoformat() + 'Z'
-            end = (datetime.utcnow() + timedelta(days=30)).isoformat() + 'Z'
-            
-            events_result = self.service.events().list(
-                calendarId=self.calendar_id,
-                timeMin=now,
-                timeMax=end,
-                singleEvents=True,
-                q=event_title
-            ).execute()
-            
-            events = events_result.get('items', [])
+            warning = self._refresh()
+            now = time.time()
+            events = self.store.find(self.calendar_id, event_title, now, now + 30 * 86400)
             
             if not events:
-                return f"❌ Event '{event_title}' not found"
+                return f"{warning}❌ Event '{event_title}' not found"
             
             # Delete first matching event
             event_id = events[0]['id']
-            self.service.events().delete(
-                calendarId=self.calendar_id,
-                eventId=event_id
-            ).execute()
+            summary = events[0].get('summary', 'Untitled')
+            
+            try:
+                if not self.service:
+                    raise RuntimeError("not connected")
+                self._delete_remote(event_id)
+            except Exception as e:
+                if _http_status(e) is not None:
+                    raise
+                # No connection: hide it now, delete on the next successful sync
+                self.store.mark_deleted(self.calendar_id, event_id)
+                return f"{warning}✅ Event deleted locally (will sync when online): {summary}"
             
-            return f"✅ Event deleted: {events[0].get('summary', 'Untitled')}"
+            self.store.remove(self.calendar_id, event_id)
+            return f"{warning}✅ Event deleted: {summary}"
         
         except Exception as e:
             return f"❌ Error removing event: {str(e)}"
+
+def _http_status(error):
+    """HTTP status of a Calendar API error, None for connection errors"""
+    return getattr(getattr(error, "resp", None), "status", None)
+
+def _retryable(error):
+    """Whether a failed call is worth retrying"""
+    status = _http_status(error)
+    if status is None:
+        return True
+    return status == 429 or status >= 500 or (status == 403 and "rateLimitExceeded" in str(error))
+
+def parse_ics(text):
+    """
+    Parse the VEVENTs of an iCalendar file into Calendar API event bodies
+    
+    Supports SUMMARY, DESCRIPTION, LOCATION, DTSTART/DTEND (UTC, TZID or
+    all-day dates) and RRULE. Events without DTEND last one hour (one day
+    for all-day events).
+    
+    Returns:
+        List of event dicts
+    """
+    # Unfold continuation lines (RFC 5545: a line starting with a space or tab)
+    lines = re.sub(r"\r?\n[ \t]", "", text).splitlines()
+    events = []
+    fields = None
+    
+    for line in lines:
+        if line == "BEGIN:VEVENT":
+            fields = {}
+        elif line == "END:VEVENT" and fields is not None:
+            if "DTSTART" in fields:
+                events.append(_ics_event(fields))
+            fields = None
+        elif fields is not None and ":" in line:
+            name, value = line.split(":", 1)
+            key, *params = name.split(";")
+            fields[key.upper()] = (dict(param.split("=", 1) for param in params if "=" in param), value)
+    
+    return events
+
+def _ics_event(fields):
+    """Calendar API event body for one VEVENT's fields"""
+    def text(key):
+        value = fields.get(key, ({}, ""))[1]
+        return re.sub(r"\\([nN,;\\])", lambda m: "\n" if m.group(1) in "nN" else m.group(1), value)
+    
+    start = _ics_time(*fields["DTSTART"])
+    if "DTEND" in fields:
+        end = _ics_time(*fields["DTEND"])
+    elif "date" in start:
+        end = {"date": (datetime.fromisoformat(start["date"]) + timedelta(days=1)).date().isoformat()}
+    else:
+        end = dict(start, dateTime=(datetime.fromisoformat(start["dateTime"].rstrip("Z")) + timedelta(hours=1)).isoformat()
+                   + ("Z" if start["dateTime"].endswith("Z") else ""))
+    
+    event = {"summary": text("SUMMARY") or "Untitled", "start": start, "end": end}
+    if text("DESCRIPTION"):
+        event["description"] = text("DESCRIPTION")
+    if text("LOCATION"):
+        event["location"] = text("LOCATION")
+    if "RRULE" in fields:
+        event["recurrence"] = [f"RRULE:{fields['RRULE'][1]}"]
+    return event
+
+def _ics_time(params, value):
+    """Calendar API start/end for an iCalendar date or date-time"""
+    if params.get("VALUE") == "DATE" or len(value) == 8:
+        return {"date": f"{value[:4]}-{value[4:6]}-{value[6:8]}"}
+    
+    stamp = datetime.strptime(value.rstrip("Z"), "%Y%m%dT%H%M%S").isoformat()
+    if value.endswith("Z"):
+        return {"dateTime": stamp + "Z"}
+    return {"dateTime": stamp, "timeZone": params.get("TZID", "UTC")}
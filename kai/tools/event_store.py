@@ -0,0 +1,164 @@
+"""
+Calendar event storage - local SQLite copy of Google Calendar events
+Kept current with incremental sync tokens; serves range and title lookups offline
+"""
+
+import json
+import os
+import time
+from datetime import datetime, timezone
+from threading import RLock
+
+from kai.metrics import metrics
+from kai.storage import connect_sqlite, sqlite_transaction
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    calendar_id TEXT NOT NULL,
+    id TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    start TEXT NOT NULL,
+    start_ts REAL NOT NULL,
+    end_ts REAL NOT NULL,
+    pending_delete INTEGER NOT NULL DEFAULT 0,
+    raw TEXT NOT NULL,
+    PRIMARY KEY (calendar_id, id)
+);
+CREATE INDEX IF NOT EXISTS events_by_start ON events(calendar_id, start_ts);
+CREATE TABLE IF NOT EXISTS sync_state (
+    calendar_id TEXT PRIMARY KEY,
+    sync_token TEXT,
+    synced_at REAL NOT NULL
+);
+"""
+
+def event_time(value):
+    """
+    Unix timestamp for a Calendar API start/end field
+    
+    Args:
+        value: {"dateTime": "..."} or {"date": "YYYY-MM-DD"} (all-day, local midnight)
+    """
+    if value.get("dateTime"):
+        parsed = datetime.fromisoformat(value["dateTime"].replace("Z", "+00:00"))
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed.timestamp()
+    return datetime.fromisoformat(value["date"]).timestamp()
+
+class EventStore:
+    """Local copy of calendar events with sync tokens per calendar"""
+    
+    def __init__(self, db_file="data/calendar.db"):
+        """
+        Open (or create) the event database
+        
+        Args:
+            db_file: SQLite database path
+        """
+        self.db_file = db_file
+        os.makedirs(os.path.dirname(db_file) or ".", exist_ok=True)
+        
+        self._lock = RLock()
+        self.conn = connect_sqlite(db_file)
+        self.conn.executescript(SCHEMA)
+    
+    def transaction(self):
+        """Group writes into one atomic commit (nested calls join the outer one)"""
+        return sqlite_transaction(self.conn, self._lock)
+    
+    @metrics.timed("storage_seconds", store="events", op="apply")
+    def apply(self, calendar_id, items):
+        """
+        Apply events from a list/sync response
+        
+        Cancelled events are deleted, everything else is inserted or replaced.
+        """
+        with self.transaction() as conn:
+            for event in items:
+                if event.get("status") == "cancelled":
+                    conn.execute("DELETE FROM events WHERE calendar_id = ? AND id = ?",
+                                 (calendar_id, event["id"]))
+                    continue
+                conn.execute(
+                    "INSERT OR REPLACE INTO events "
+                    "(calendar_id, id, summary, start, start_ts, end_ts, pending_delete, raw) "
+                    "VALUES (?, ?, ?, ?, ?, ?, 0, ?)",
+                    (calendar_id, event["id"], event.get("summary", "Untitled"),
+                     event["start"].get("dateTime", event["start"].get("date")),
+                     event_time(event["start"]), event_time(event.get("end", event["start"])),
+                     json.dumps(event))
+                )
+    
+    @metrics.timed("storage_seconds", store="events", op="between")
+    def between(self, calendar_id, start_ts, end_ts):
+        """Events overlapping [start_ts, end_ts), earliest first"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT raw FROM events WHERE calendar_id = ? AND start_ts < ? AND end_ts > ? "
+                "AND pending_delete = 0 ORDER BY start_ts",
+                (calendar_id, end_ts, start_ts)
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+    
+    @metrics.timed("storage_seconds", store="events", op="find")
+    def find(self, calendar_id, title, start_ts, end_ts):
+        """
+        Events in a window whose title contains `title` (case-insensitive)
+        
+        Exact title matches come first, then earliest first.
+        """
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT raw FROM events WHERE calendar_id = ? AND start_ts < ? AND end_ts > ? "
+                "AND pending_delete = 0 AND instr(lower(summary), lower(?)) > 0 "
+                "ORDER BY lower(summary) = lower(?) DESC, start_ts",
+                (calendar_id, end_ts, start_ts, title, title)
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+    
+    def mark_deleted(self, calendar_id, event_id):
+        """Hide an event until its deletion reaches the server"""
+        with self.transaction() as conn:
+            conn.execute("UPDATE events SET pending_delete = 1 WHERE calendar_id = ? AND id = ?",
+                         (calendar_id, event_id))
+    
+    def pending_deletes(self, calendar_id):
+        """Ids of events deleted locally but not yet on the server"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT id FROM events WHERE calendar_id = ? AND pending_delete = 1", (calendar_id,)
+            ).fetchall()
+        return [row[0] for row in rows]
+    
+    def remove(self, calendar_id, event_id):
+        """Drop an event from the local copy"""
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM events WHERE calendar_id = ? AND id = ?", (calendar_id, event_id))
+    
+    def sync_state(self, calendar_id):
+        """(sync token, time of last successful sync) or (None, None) if never synced"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT sync_token, synced_at FROM sync_state WHERE calendar_id = ?", (calendar_id,)
+            ).fetchone()
+        return tuple(row) if row else (None, None)
+    
+    def set_sync_state(self, calendar_id, sync_token, synced_at=None):
+        """Record the token for the next incremental sync"""
+        with self.transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sync_state (calendar_id, sync_token, synced_at) VALUES (?, ?, ?)",
+                (calendar_id, sync_token, synced_at or time.time())
+            )
+    
+    def reset(self, calendar_id):
+        """Forget a calendar's events and token (before a full resync); keeps pending deletes"""
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM events WHERE calendar_id = ? AND pending_delete = 0", (calendar_id,))
+            conn.execute("DELETE FROM sync_state WHERE calendar_id = ?", (calendar_id,))
+    
+    def close(self):
+        """Close the database connection"""
+        with self._lock:
+            self.conn.close()
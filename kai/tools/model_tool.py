@@ -0,0 +1,97 @@
+"""
+Model tool - switch and inspect models in the ModelPool
+Models load in the background; commands never wait for them
+"""
+
+from kai.model_pool import DEFAULT_ROUTE
+
+class ModelTool:
+    """Handles /model commands"""
+    
+    def __init__(self, pool):
+        """
+        Args:
+            pool: ModelPool shared with chat and tools
+        """
+        self.pool = pool
+    
+    def execute(self, args):
+        """Execute model command"""
+        parts = args.strip().split()
+        
+        if not parts:
+            return "❌ Usage: /model <use|list|unload> [args]"
+        
+        action = parts[0].lower()
+        params = parts[1:]
+        
+        if action == "use":
+            return self._use(params)
+        elif action == "list":
+            return self._list()
+        elif action == "unload":
+            return self._unload(params)
+        else:
+            return f"❌ Unknown action: {action}\nUse: use, list, unload"
+    
+    def _use(self, params):
+        """Point chat (or one tool with --for <tool>) at a model"""
+        route = DEFAULT_ROUTE
+        if "--for" in params:
+            at = params.index("--for")
+            if at + 1 >= len(params):
+                return "❌ Usage: /model use <model id> [--for <tool>]"
+            route = params[at + 1].lstrip("/").lower()
+            params = params[:at] + params[at + 2:]
+        
+        if len(params) != 1:
+            return "❌ Usage: /model use <model id> [--for <tool>]"
+        
+        model_id = params[0]
+        if model_id == DEFAULT_ROUTE and route != DEFAULT_ROUTE:
+            self.pool.follow(route)
+            return f"✅ {route} now uses the chat model ({self.pool.route(DEFAULT_ROUTE)})"
+        
+        llm = self.pool.use(model_id, route)
+        if llm.ready.done():
+            if not llm.available:
+                return f"❌ Could not load {model_id}"
+            return f"✅ {route} now uses {model_id}"
+        return f"⏳ {route} now uses {model_id} (loading in the background)"
+    
+    def _list(self):
+        """Show resident models, their routes and memory use"""
+        rows = self.pool.status()
+        used = self.pool.memory_used()
+        budget = self.pool.memory_budget
+        
+        header = f"🤖 Models (memory: {_mb(used)}"
+        header += f" / budget {_mb(budget)})" if budget else ")"
+        output = [header + ":\n"]
+        
+        if not rows:
+            output.append(f"  No models loaded yet (chat: {self.pool.route(DEFAULT_ROUTE)})")
+        for model_id, state, size, routes in reversed(rows):
+            used_by = f" ← {', '.join(routes)}" if routes else ""
+            output.append(f"  • {model_id:<40} {state:<8} {_mb(size) if size else '-':>8}{used_by}")
+        
+        if self.pool.evictions:
+            output.append(f"\n🗑️  {self.pool.evictions} models unloaded to stay within budget")
+        return "\n".join(output)
+    
+    def _unload(self, params):
+        """Unload a model no route uses"""
+        if len(params) != 1:
+            return "❌ Usage: /model unload <model id>"
+        
+        model_id = params[0]
+        routes = [route for route in self.pool.routes if self.pool.route(route) == model_id]
+        if routes:
+            return f"❌ {model_id} is in use by {', '.join(routes)}; switch with /model use first"
+        if not self.pool.unload(model_id):
+            return f"❌ {model_id} is not loaded"
+        return f"✅ Unloaded {model_id}"
+
+def _mb(value):
+    """Bytes as a short MB string"""
+    return f"{value / 2**20:.0f}MB" if value is not None else "?"
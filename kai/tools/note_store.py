@@ -0,0 +1,240 @@
+"""
+Note storage - SQLite backend for StudyTool
+Per-topic index, O(1) appends and topic counts, atomic writes
+Full-text search with BM25 ranking (SQLite FTS5)
+Migrates the old data/notes.json format automatically
+"""
+
+import json
+import os
+import re
+from datetime import datetime
+from threading import RLock
+
+from kai.metrics import metrics
+from kai.storage import connect_sqlite, sqlite_transaction
+from kai.vector_index import STOPWORDS
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS notes (
+    id INTEGER PRIMARY KEY,
+    topic TEXT NOT NULL,
+    note TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS notes_by_topic ON notes(topic, id);
+CREATE TABLE IF NOT EXISTS topics (
+    topic TEXT PRIMARY KEY,
+    note_count INTEGER NOT NULL,
+    first_id INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS quiz_cache (
+    key TEXT PRIMARY KEY,
+    questions TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5(
+    note, topic UNINDEXED,
+    content='notes', content_rowid='id', tokenize='porter unicode61'
+);
+"""
+
+class NoteStore:
+    """Stores study notes in SQLite with a per-topic index and maintained counts"""
+    
+    def __init__(self, db_file="data/notes.db", legacy_file=None):
+        """
+        Open (or create) the note database
+        
+        Args:
+            db_file: SQLite database path
+            legacy_file: Old notes.json to migrate on first open
+        """
+        self.db_file = db_file
+        os.makedirs(os.path.dirname(db_file) or ".", exist_ok=True)
+        
+        self._lock = RLock()
+        self.conn = connect_sqlite(db_file)
+        self.conn.executescript(SCHEMA)
+        self._build_search_index()
+        
+        if legacy_file:
+            self._migrate(legacy_file)
+    
+    def transaction(self):
+        """
+        Group writes into one atomic commit (nested calls join the outer one)
+        
+        Usage:
+            with store.transaction():
+                store.add(...)
+                store.add(...)
+        """
+        return sqlite_transaction(self.conn, self._lock)
+    
+    @metrics.timed("storage_seconds", store="notes", op="add")
+    def add(self, topic, note):
+        """
+        Append a note to a topic
+        
+        Returns:
+            New note id
+        """
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                "INSERT INTO notes (topic, note, created_at) VALUES (?, ?, ?)",
+                (topic, note, datetime.now().isoformat())
+            )
+            note_id = cursor.lastrowid
+            conn.execute(
+                "INSERT INTO notes_fts (rowid, note, topic) VALUES (?, ?, ?)",
+                (note_id, note, topic)
+            )
+            conn.execute(
+                "INSERT INTO topics (topic, note_count, first_id) VALUES (?, 1, ?) "
+                "ON CONFLICT(topic) DO UPDATE SET note_count = note_count + 1",
+                (topic, note_id)
+            )
+            return note_id
+    
+    @metrics.timed("storage_seconds", store="notes", op="get")
+    def get(self, topic):
+        """All notes for a topic, oldest first"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT note FROM notes WHERE topic = ? ORDER BY id", (topic,)
+            ).fetchall()
+        return [row[0] for row in rows]
+    
+    @metrics.timed("storage_seconds", store="notes", op="search")
+    def search(self, query, k=10, topic=None):
+        """
+        Rank notes against a query with BM25
+        
+        Args:
+            query: Free text; any word may match (stemmed, case-insensitive)
+            k: Maximum results
+            topic: Only search this topic's notes
+        
+        Returns:
+            List of (topic, note, score) tuples, best first (higher score = better)
+        """
+        words = re.findall(r"\w+", query.lower())
+        if not words:
+            return []
+        # Every OR term is ranked over all notes containing it; function words would match nearly all
+        words = [word for word in words if word not in STOPWORDS] or words
+        
+        match = " OR ".join(f'"{word}"' for word in dict.fromkeys(words))
+        sql = "SELECT topic, note, bm25(notes_fts) AS rank FROM notes_fts WHERE notes_fts MATCH ?"
+        params = [match]
+        if topic is not None:
+            sql += " AND topic = ?"
+            params.append(topic)
+        sql += " ORDER BY rank LIMIT ?"
+        params.append(k)
+        
+        with self._lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        # FTS5 reports BM25 negated so that ascending order is best first
+        return [(row_topic, note, -rank) for row_topic, note, rank in rows]
+    
+    def has_topic(self, topic):
+        """Check whether a topic has any notes"""
+        with self._lock:
+            return self.conn.execute(
+                "SELECT 1 FROM topics WHERE topic = ?", (topic,)
+            ).fetchone() is not None
+    
+    @metrics.timed("storage_seconds", store="notes", op="topics")
+    def topics(self):
+        """List of (topic, note count) in the order topics were created"""
+        with self._lock:
+            return self.conn.execute(
+                "SELECT topic, note_count FROM topics ORDER BY first_id"
+            ).fetchall()
+    
+    def count(self):
+        """Total number of notes"""
+        with self._lock:
+            row = self.conn.execute("SELECT COALESCE(SUM(note_count), 0) FROM topics").fetchone()
+        return row[0]
+    
+    def iter_notes(self, batch_size=1000):
+        """Yield (topic, note) for every note, oldest first, in batches"""
+        last_id = 0
+        while True:
+            with self._lock:
+                rows = self.conn.execute(
+                    "SELECT id, topic, note FROM notes WHERE id > ? ORDER BY id LIMIT ?",
+                    (last_id, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            for note_id, topic, note in rows:
+                yield topic, note
+            last_id = rows[-1][0]
+    
+    def cached_questions(self, key):
+        """Quiz questions stored for a chunk key, or None"""
+        with self._lock:
+            row = self.conn.execute("SELECT questions FROM quiz_cache WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+    
+    def cache_questions(self, key, questions, max_entries=500):
+        """Store quiz questions for a chunk key, keeping the newest max_entries"""
+        with self.transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO quiz_cache (key, questions, created_at) VALUES (?, ?, ?)",
+                (key, json.dumps(questions), datetime.now().isoformat())
+            )
+            conn.execute(
+                "DELETE FROM quiz_cache WHERE key NOT IN "
+                "(SELECT key FROM quiz_cache ORDER BY created_at DESC LIMIT ?)",
+                (max_entries,)
+            )
+    
+    def close(self):
+        """Close the database connection"""
+        with self._lock:
+            self.conn.close()
+    
+    def _build_search_index(self):
+        """Index notes stored before full-text search existed (runs once)"""
+        with self.transaction() as conn:
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'fts_built'").fetchone():
+                return
+            conn.execute("INSERT INTO notes_fts (notes_fts) VALUES ('rebuild')")
+            conn.execute("INSERT INTO meta (key, value) VALUES ('fts_built', ?)", (datetime.now().isoformat(),))
+    
+    def _migrate(self, legacy_file):
+        """Import notes from the old JSON file once, then rename it"""
+        if not os.path.exists(legacy_file):
+            return
+        
+        with self.transaction() as conn:
+            done = conn.execute(
+                "SELECT value FROM meta WHERE key = 'migrated_json'"
+            ).fetchone()
+            
+            if not done:
+                with open(legacy_file, 'r') as f:
+                    topics = json.load(f).get("topics", {})
+                for topic, notes in topics.items():
+                    for note in notes:
+                        self.add(topic, note)
+                # Recorded in the same transaction, so a crash never imports twice
+                conn.execute(
+                    "INSERT INTO meta (key, value) VALUES ('migrated_json', ?)",
+                    (datetime.now().isoformat(),)
+                )
+        
+        try:
+            os.replace(legacy_file, f"{legacy_file}.migrated")
+        except FileNotFoundError:
+            # Another process migrated it at the same time
+            pass
@@ -1,43 +1,144 @@
 """
 Study tool - note taking and AI-powered quiz generation
 Uses LLM for quiz creation based on saved notes
+Large topics are quizzed map-reduce style: questions per chunk of notes, then merged
 """
 
-import json
+import hashlib
 import os
+import re
+
+from kai.llm import ROLE_MARKERS, split_stop_note
+from kai.tools.note_store import NoteStore
+
+QUIZ_SYSTEM_PROMPT = "You are a helpful study assistant creating quiz questions."
+
+def chunk_notes(notes, max_tokens, count_tokens):
+    """
+    Split notes into consecutive chunks of at most max_tokens
+    
+    A note longer than the budget gets a chunk of its own. Chunks only
+    depend on the notes before them, so appending a note changes the
+    last chunk and leaves the others (and their cached questions) alone.
+    
+    Args:
+        notes: List of note strings, in saved order
+        max_tokens: Token budget per chunk
+        count_tokens: Token counting function
+    
+    Returns:
+        List of note lists
+    """
+    chunks = []
+    current = []
+    used = 0
+    
+    for note in notes:
+        tokens = count_tokens(note) + 2
+        if current and used + tokens > max_tokens:
+            chunks.append(current)
+            current = []
+            used = 0
+        current.append(note)
+        used += tokens
+    
+    if current:
+        chunks.append(current)
+    return chunks
+
+def parse_questions(text):
+    """
+    Pull individual questions out of generated text
+    
+    Strips numbering and bullets. Lines containing "?" are preferred; if
+    there are none, every non-empty line is kept.
+    """
+    lines = []
+    for line in text.splitlines():
+        line = re.sub(r"^\s*(?:[-*•]\s*)?(?:(?:Q(?:uestion)?\s*)?\d+\s*[.):]\s*)?", "", line, flags=re.IGNORECASE).strip()
+        if line:
+            lines.append(line)
+    
+    questions = [line for line in lines if "?" in line]
+    return questions or lines
+
+def merge_questions(question_lists, limit):
+    """
+    Merge per-chunk questions, dropping near-duplicates
+    
+    Chunks are visited round-robin so the quiz covers the whole topic.
+    Two questions are duplicates when their word sets overlap by 80% or more.
+    
+    Args:
+        question_lists: One list of questions per chunk
+        limit: Maximum questions returned
+    
+    Returns:
+        List of questions
+    """
+    merged = []
+    seen = []
+    
+    for rank in range(max((len(questions) for questions in question_lists), default=0)):
+        for questions in question_lists:
+            if rank >= len(questions) or len(merged) >= limit:
+                continue
+            words = set(re.findall(r"\w+", questions[rank].lower()))
+            if not words or any(len(words & other) / len(words | other) >= 0.8 for other in seen):
+                continue
+            seen.append(words)
+            merged.append(questions[rank])
+    
+    return merged
 
 class StudyTool:
     """Manages study notes and generates quizzes using LLM"""
     
-    def __init__(self, llm=None, data_file="data/notes.json"):
+    # Most notes a quiz is built from (the most relevant are chosen)
+    QUIZ_NOTE_LIMIT = 200
+    # Prompt tokens of notes per chunk, and generated tokens per chunk
+    QUIZ_CHUNK_TOKENS = 384
+    QUIZ_CHUNK_NEW_TOKENS = 120
+    # A chunk's questions end at the next transcript turn or a run of blank lines
+    QUIZ_STOP_SEQUENCES = ROLE_MARKERS + ("\n\n\n",)
+    # Chunks generated together in one batch
+    QUIZ_BATCH_SIZE = 4
+    # Questions in the final quiz
+    QUIZ_MAX_QUESTIONS = 10
+    
+    def __init__(self, llm=None, data_file="data/notes.json", stream=False, index=None):
         self.llm = llm
         self.data_file = data_file
-        self._ensure_data_file()
-    
-    def _ensure_data_file(self):
-        """Create data file if it doesn't exist"""
-        os.makedirs(os.path.dirname(self.data_file), exist_ok=True)
-        if not os.path.exists(self.data_file):
-            with open(self.data_file, 'w') as f:
-                json.dump({"topics": {}}, f)
-    
-    def _load_notes(self):
-        """Load notes from JSON file"""
-        with open(self.data_file, 'r') as f:
-            data = json.load(f)
-            return data.get("topics", {})
-    
-    def _save_notes(self, topics):
-        """Save notes to JSON file"""
-        with open(self.data_file, 'w') as f:
-            json.dump({"topics": topics}, f, indent=2)
+        self.stream = stream
+        self.index = index
+        # Notes live in SQLite next to the old JSON file, which is migrated once
+        self.store = NoteStore(os.path.splitext(data_file)[0] + ".db", legacy_file=data_file)
+        self._index_existing_notes()
+    
+    def batch(self):
+        """Context manager grouping a run of commands into one transaction"""
+        return self.store.transaction()
+    
+    def generates(self, args):
+        """Whether a command waits on the LLM (quizzes do; they never run inside batch())"""
+        parts = args.split(None, 1)
+        return bool(parts) and parts[0].lower() == "quiz"
+    
+    def _index_existing_notes(self):
+        """Add notes saved before the vector index existed"""
+        if self.index is None or self.index.count(source="notes") > 0:
+            return
+        
+        for topic, note in self.store.iter_notes():
+            self.index.add(note, {"source": "notes", "topic": topic})
+        self.index.flush()
     
     def execute(self, args):
         """Execute study command"""
         parts = args.strip().split(None, 2)
         
         if not parts:
-            return "❌ Usage: /study <save|show|list|quiz> [topic] [note]"
+            return "❌ Usage: /study <save|show|list|search|quiz> [topic] [note]"
         
         action = parts[0].lower()
         
@@ -57,6 +158,12 @@ class StudyTool:
         elif action == "list":
             return self._list_topics()
         
+        elif action == "search":
+            query = args.strip()[len(parts[0]):].strip()
+            if not query:
+                return "❌ Usage: /study search <query>"
+            return self._search_notes(query)
+        
         elif action == "quiz":
             if len(parts) < 2:
                 return "❌ Usage: /study quiz <topic>"
@@ -64,28 +171,24 @@ class StudyTool:
             return self._generate_quiz(topic)
         
         else:
-            return f"❌ Unknown action: {action}\nUse: save, show, list, quiz"
+            return f"❌ Unknown action: {action}\nUse: save, show, list, search, quiz"
     
     def _save_note(self, topic, note):
         """Save a note under a topic"""
-        topics = self._load_notes()
+        self.store.add(topic, note)
         
-        if topic not in topics:
-            topics[topic] = []
-        
-        topics[topic].append(note)
-        self._save_notes(topics)
+        if self.index is not None:
+            self.index.add(note, {"source": "notes", "topic": topic})
         
         return f"✅ Note saved under '{topic}'"
     
     def _show_notes(self, topic):
         """Show all notes for a topic"""
-        topics = self._load_notes()
+        notes = self.store.get(topic)
         
-        if topic not in topics:
+        if not notes:
             return f"❌ No notes found for '{topic}'"
         
-        notes = topics[topic]
         output = [f"📚 Notes for '{topic}':\n"]
         
         for i, note in enumerate(notes, 1):
@@ -95,41 +198,183 @@ class StudyTool:
     
     def _list_topics(self):
         """List all topics"""
-        topics = self._load_notes()
+        topics = self.store.topics()
         
         if not topics:
             return "📚 No study topics yet. Create one with: /study save <topic> <note>"
         
         output = ["📚 Study Topics:\n"]
-        for topic, notes in topics.items():
-            output.append(f"  • {topic} ({len(notes)} notes)")
+        for topic, count in topics:
+            output.append(f"  • {topic} ({count} notes)")
         
         return "\n".join(output)
     
+    def _search_notes(self, query, k=10):
+        """Full-text search across all notes (BM25 ranked)"""
+        results = self.store.search(query, k=k)
+        
+        if not results:
+            return f"❌ No notes match '{query}'"
+        
+        output = [f"🔎 Notes matching '{query}':\n"]
+        for i, (topic, note, _) in enumerate(results, 1):
+            output.append(f"  {i}. [{topic}] {note}")
+        
+        return "\n".join(output)
+    
+    def _quiz_notes(self, topic):
+        """
+        Pick the notes a quiz is built from
+        
+        Small topics use every note. Large topics use the notes that rank
+        best for the topic name, topped up with the most recent ones. A
+        topic with no notes of its own falls back to a search of all notes.
+        
+        Returns:
+            List of notes in the order they were saved
+        """
+        notes = self.store.get(topic)
+        limit = self.QUIZ_NOTE_LIMIT
+        
+        if not notes:
+            return [note for _, note, _ in self.store.search(topic, k=limit)]
+        if len(notes) <= limit:
+            return notes
+        
+        chosen = {note for _, note, _ in self.store.search(topic, k=limit, topic=topic)}
+        for note in reversed(notes):
+            if len(chosen) >= limit:
+                break
+            chosen.add(note)
+        return [note for note in notes if note in chosen]
+    
     def _generate_quiz(self, topic):
         """Generate quiz questions using LLM"""
-        topics = self._load_notes()
+        notes = self._quiz_notes(topic)
         
-        if topic not in topics:
+        if not notes:
             return f"❌ No notes found for '{topic}'. Save notes first."
         
         if not self.llm:
             return "❌ LLM not available. Cannot generate quiz."
         
-        notes = topics[topic]
+        if self.stream:
+            return self._stream_quiz(topic, notes)
+        
+        return f"🎯 Quiz for '{topic}':\n\n{self._build_quiz(topic, notes)}"
+    
+    def _build_quiz(self, topic, notes):
+        """
+        Map: generate candidate questions per chunk of notes (batched,
+        cached by chunk content). Reduce: merge and deduplicate.
+        
+        Chunks cut short by a timeout or cancel are not cached; the quiz is
+        built from what they produced and ends with the stop note.
+        
+        Returns:
+            Numbered quiz text (or an error message)
+        """
+        results = []
+        stop_note = ""
+        
+        for part in self._quiz_chunks(topic, notes):
+            if isinstance(part, str):
+                if part.startswith("❌"):
+                    return part
+                stop_note = part
+            else:
+                results.append(part)
+        
+        # Round-robin over chunks in note order, whatever order they finished in
+        results.sort(key=lambda part: part[0])
+        questions = merge_questions([questions for _, questions in results], self.QUIZ_MAX_QUESTIONS)
+        if not questions:
+            return "❌ No questions were generated. Try again." + stop_note
+        
+        return "\n".join(f"{i}. {question}" for i, question in enumerate(questions, 1)) + stop_note
+    
+    def _quiz_chunks(self, topic, notes):
+        """
+        Map step: questions per chunk of notes, as soon as each is available
+        
+        Cached chunks come first, then generated ones batch by batch.
+        
+        Yields:
+            (chunk index, questions); the last item is a str instead when
+            generation failed (error message) or was stopped (stop note)
+        """
+        self.llm.wait_ready()
+        chunks = chunk_notes(notes, self.QUIZ_CHUNK_TOKENS, self.llm.count_tokens)
+        prompts = [self._chunk_prompt(topic, chunk) for chunk in chunks]
+        keys = [self._chunk_key(prompt) for prompt in prompts]
+        missing = []
+        
+        for i, key in enumerate(keys):
+            questions = self.store.cached_questions(key)
+            if questions is None:
+                missing.append(i)
+            else:
+                yield i, questions
+        
+        for start in range(0, len(missing), self.QUIZ_BATCH_SIZE):
+            batch = missing[start:start + self.QUIZ_BATCH_SIZE]
+            responses = self.llm.generate_batch(
+                [prompts[i] for i in batch],
+                system_prompt=QUIZ_SYSTEM_PROMPT,
+                max_new_tokens=self.QUIZ_CHUNK_NEW_TOKENS,
+                stop=self.QUIZ_STOP_SEQUENCES
+            )
+            stop_note = ""
+            for i, response in zip(batch, responses):
+                if response.startswith("❌"):
+                    yield response
+                    return
+                response, note = split_stop_note(response)
+                stop_note = stop_note or note
+                questions = parse_questions(response)
+                if questions and not note:
+                    self.store.cache_questions(keys[i], questions)
+                yield i, questions
+            if stop_note:
+                # Stopped: the remaining chunks would be stopped as well
+                yield stop_note
+                return
+    
+    def _chunk_prompt(self, topic, notes):
+        """Quiz prompt for one chunk of notes"""
         notes_text = "\n".join(f"- {note}" for note in notes)
         
-        prompt = f"""Based on these study notes about {topic}:
+        return f"""Based on these study notes about {topic}:
 
 {notes_text}
 
 Generate 3 quiz questions to test understanding of this material.
-Format each question clearly with the question number.
+Write one question per line, numbered.
 Keep questions focused and relevant to the notes provided."""
-
-        response = self.llm.generate(
-            prompt=prompt,
-            system_prompt="You are a helpful study assistant creating quiz questions."
-        )
+    
+    def _chunk_key(self, prompt):
+        """Cache key for a chunk: model, generation limits and prompt content"""
+        content = f"{self.llm.model_name}\0{self.QUIZ_CHUNK_NEW_TOKENS}\0{self.QUIZ_STOP_SEQUENCES}\0{prompt}"
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+    
+    def _stream_quiz(self, topic, notes):
+        """Yield the quiz header right away, then each new question as its chunk is answered"""
+        yield f"🎯 Quiz for '{topic}':\n\n"
+        shown = []
+        
+        for part in self._quiz_chunks(topic, notes):
+            if isinstance(part, str):
+                if not shown and not part.startswith("❌"):
+                    part = "❌ No questions were generated. Try again." + part
+                yield part
+                return
+            # Skip questions that duplicate one already shown
+            for question in merge_questions([shown + part[1]], self.QUIZ_MAX_QUESTIONS)[len(shown):]:
+                separator = "\n" if shown else ""
+                shown.append(question)
+                yield f"{separator}{len(shown)}. {question}"
+            if len(shown) >= self.QUIZ_MAX_QUESTIONS:
+                return
         
-        return f"🎯 Quiz for '{topic}':\n\n{response}"
+        if not shown:
+            yield "❌ No questions were generated. Try again."
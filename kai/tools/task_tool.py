@@ -1,36 +1,188 @@
 """
 Task management tool
-Handles task CRUD operations with JSON storage
+Handles task CRUD operations in memory with write-behind JSON storage
+Several KAI processes can share data/tasks.json: changes are kept as an
+operation log and replayed onto the newest file version under a file lock
 """
 
+import atexit
 import json
 import os
+from contextlib import contextmanager
 from datetime import datetime
+from threading import RLock, Timer
+
+from kai.metrics import metrics
+from kai.storage import atomic_write, file_lock, file_signature
 
 class TaskTool:
-    """Manages tasks with local JSON storage"""
+    """Manages tasks in memory, persisted to local JSON storage"""
     
-    def __init__(self, data_file="data/tasks.json"):
+    def __init__(self, data_file="data/tasks.json", flush_delay=0.5):
+        """
+        Load tasks once and keep them in memory
+        
+        Args:
+            data_file: JSON storage path
+            flush_delay: Seconds to coalesce changes before writing to disk
+        """
         self.data_file = data_file
-        self._ensure_data_file()
-    
-    def _ensure_data_file(self):
-        """Create data file if it doesn't exist"""
-        os.makedirs(os.path.dirname(self.data_file), exist_ok=True)
-        if not os.path.exists(self.data_file):
-            with open(self.data_file, 'w') as f:
-                json.dump({"tasks": []}, f)
+        self.flush_delay = flush_delay
+        self.tasks = {}
+        self.next_id = 1
+        self.version = 0
+        self._ops = []
+        self._signature = None
+        self._lock = RLock()
+        self._timer = None
+        self._batching = 0
+        os.makedirs(os.path.dirname(self.data_file) or ".", exist_ok=True)
+        self._load_tasks()
+        atexit.register(self.flush)
     
+    @metrics.timed("storage_seconds", store="tasks", op="load")
     def _load_tasks(self):
-        """Load tasks from JSON file"""
+        """Load the newest file version, keeping local changes not written yet on top"""
+        signature = file_signature(self.data_file)
+        if signature is None:
+            return
+        
         with open(self.data_file, 'r') as f:
             data = json.load(f)
-            return data.get("tasks", [])
+        self._signature = signature
+        self.version = data.get("version", 0)
+        self.tasks, self.next_id, self._ops = self._replay(data, self._ops)
+    
+    def _refresh(self):
+        """
+        Pick up changes other processes wrote since the last load (a stat call when there are none)
+        
+        Skipped while local changes are pending: their ids stay as shown
+        until the next flush merges everything.
+        """
+        with self._lock:
+            if not self._ops and file_signature(self.data_file) != self._signature:
+                self._load_tasks()
+    
+    def _replay(self, data, ops):
+        """
+        Apply pending operations to a stored version
+        
+        Tasks added locally get their final ids here (the file's next_id may
+        have moved on), and later operations are renumbered to match.
+        
+        Returns:
+            (tasks dict, next_id, renumbered ops)
+        """
+        tasks = {}
+        for task in data.get("tasks", []):
+            # Files written before next_id existed can repeat ids after a clear
+            if task["id"] in tasks:
+                task["id"] = max(tasks) + 1
+            tasks[task["id"]] = task
+        next_id = max(data.get("next_id", 1), max(tasks, default=0) + 1)
+        
+        ids = {}
+        replayed = []
+        for op in ops:
+            op = self._renumber(op, ids)
+            if op[0] == "add":
+                ids[op[1]] = next_id
+                op = ("add", next_id) + op[2:]
+            next_id = self._apply(tasks, next_id, op)
+            replayed.append(op)
+        return tasks, next_id, replayed
+    
+    def _renumber(self, op, ids):
+        """Map the task ids an operation refers to after a replay"""
+        if op[0] == "done":
+            return ("done", ids.get(op[1], op[1])) + op[2:]
+        if op[0] == "clear":
+            return ("clear", [ids.get(task_id, task_id) for task_id in op[1]])
+        return op
+    
+    def _apply(self, tasks, next_id, op):
+        """
+        Apply one operation to a tasks dict
+        
+        Operations: ("add", id, description, created_at), ("done", id, completed_at),
+        ("clear", [ids]) - a clear only removes the tasks it saw, not ones
+        another process added meanwhile
+        
+        Returns:
+            next_id after the operation
+        """
+        kind = op[0]
+        if kind == "add":
+            _, task_id, description, created_at = op
+            tasks[task_id] = {
+                "id": task_id,
+                "description": description,
+                "completed": False,
+                "created_at": created_at
+            }
+            return max(next_id, task_id + 1)
+        if kind == "done":
+            _, task_id, completed_at = op
+            task = tasks.get(task_id)
+            if task is not None:
+                task["completed"] = True
+                task["completed_at"] = completed_at
+        elif kind == "clear":
+            for task_id in op[1]:
+                tasks.pop(task_id, None)
+        return next_id
+    
+    def _record(self, op):
+        """Apply an operation locally and schedule a write (caller holds the lock)"""
+        self.next_id = self._apply(self.tasks, self.next_id, op)
+        self._ops.append(op)
+        if self._timer is None and not self._batching:
+            self._timer = Timer(self.flush_delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
     
-    def _save_tasks(self, tasks):
-        """Save tasks to JSON file"""
-        with open(self.data_file, 'w') as f:
-            json.dump({"tasks": tasks}, f, indent=2)
+    def flush(self):
+        """
+        Write pending changes to disk now
+        
+        Under the file lock: if another process wrote a newer version since
+        we loaded (optimistic check), our operations are replayed onto it
+        first; the result replaces the file atomically.
+        """
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._ops:
+                return
+            
+            with metrics.timer("storage_seconds", store="tasks", op="flush"), file_lock(self.data_file):
+                if file_signature(self.data_file) != self._signature:
+                    metrics.inc("storage_merges", store="tasks")
+                    self._load_tasks()
+                
+                payload = json.dumps({
+                    "version": self.version + 1,
+                    "tasks": list(self.tasks.values()),
+                    "next_id": self.next_id
+                }, indent=2)
+                atomic_write(self.data_file, payload)
+                self.version += 1
+                self._signature = file_signature(self.data_file)
+                self._ops = []
+    
+    @contextmanager
+    def batch(self):
+        """Hold back writes for a group of commands, then write once"""
+        with self._lock:
+            self._batching += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._batching -= 1
+            self.flush()
     
     def execute(self, args):
         """Execute task command"""
@@ -41,6 +193,7 @@ class TaskTool:
         
         action = parts[0].lower()
         params = parts[1] if len(parts) > 1 else ""
+        self._refresh()
         
         if action == "add":
             return self._add_task(params)
@@ -54,25 +207,25 @@ class TaskTool:
             return f"❌ Unknown action: {action}\nUse: add, list, done, clear"
     
     def _add_task(self, description):
-        """Add a new task"""
-        if not description:
+        """Add a new task (one per line when several lines are given)"""
+        descriptions = [line.strip() for line in description.splitlines() if line.strip()]
+        if not descriptions:
             return "❌ Task description cannot be empty"
         
-        tasks = self._load_tasks()
-        task = {
-            "id": len(tasks) + 1,
-            "description": description,
-            "completed": False,
-            "created_at": datetime.now().isoformat()
-        }
-        tasks.append(task)
-        self._save_tasks(tasks)
-        
-        return f"✅ Task added: {description}"
+        with self._lock:
+            for text in descriptions:
+                self._record(("add", self.next_id, text, datetime.now().isoformat()))
+        
+        if len(descriptions) == 1:
+            return f"✅ Task added: {descriptions[0]}"
+        return f"✅ Added {len(descriptions)} tasks:\n" + "\n".join(f"  • {text}" for text in descriptions)
     
     def _list_tasks(self):
         """List all tasks"""
-        tasks = self._load_tasks()
+        # Write pending adds first, so the ids shown are final
+        self.flush()
+        with self._lock:
+            tasks = list(self.tasks.values())
         
         if not tasks:
             return "📋 No tasks yet. Add one with: /task add <description>"
@@ -85,27 +238,68 @@ class TaskTool:
         return "\n".join(output)
     
     def _complete_task(self, task_id_str):
-        """Mark a task as complete"""
+        """Mark tasks as complete (accepts lists and ranges, e.g. 3,5,9-20)"""
         if not task_id_str:
             return "❌ Specify task number: /task done <number>"
         
-        try:
-            task_id = int(task_id_str)
-        except ValueError:
-            return "❌ Task number must be an integer"
+        completed = []
+        missing = []
         
-        tasks = self._load_tasks()
+        with self._lock:
+            try:
+                task_ids = self._parse_ids(task_id_str)
+            except ValueError:
+                return "❌ Task number must be an integer (or a list like 3,5,9-20; ranges go low to high)"
+            if not task_ids:
+                return f"❌ No tasks in {task_id_str.strip()}"
+            
+            for task_id in task_ids:
+                task = self.tasks.get(task_id)
+                if task is None:
+                    missing.append(task_id)
+                    continue
+                self._record(("done", task_id, datetime.now().isoformat()))
+                completed.append(task)
         
-        for task in tasks:
-            if task["id"] == task_id:
-                task["completed"] = True
-                task["completed_at"] = datetime.now().isoformat()
-                self._save_tasks(tasks)
-                return f"✅ Task completed: {task['description']}"
+        if len(task_ids) == 1:
+            if completed:
+                return f"✅ Task completed: {completed[0]['description']}"
+            return f"❌ Task {task_ids[0]} not found"
+        
+        output = [f"✅ Completed {len(completed)} tasks"]
+        output.extend(f"  ✓ {task['id']}. {task['description']}" for task in completed)
+        if missing:
+            output.append(f"❌ Not found: {', '.join(str(task_id) for task_id in missing)}")
+        return "\n".join(output)
+    
+    def _parse_ids(self, text):
+        """
+        Parse a task id list (caller holds the lock)
+        
+        Args:
+            text: Ids separated by commas or spaces; "a-b" is an inclusive
+                  range and stands for the existing tasks in it, so a huge
+                  range costs no more than the task list itself
+        
+        Returns:
+            List of unique ids in the order given
         
-        return f"❌ Task {task_id} not found"
+        Raises:
+            ValueError: A part is not an id or a range, or a range ends before it starts
+        """
+        task_ids = []
+        for part in text.replace(",", " ").split():
+            if "-" in part.strip("-"):
+                start, end = (int(bound) for bound in part.split("-", 1))
+                if end < start:
+                    raise ValueError(f"range {part} ends before it starts")
+                task_ids.extend(sorted(task_id for task_id in self.tasks if start <= task_id <= end))
+            else:
+                task_ids.append(int(part))
+        return list(dict.fromkeys(task_ids))
     
     def _clear_tasks(self):
-        """Clear all tasks"""
-        self._save_tasks([])
+        """Clear all tasks (ids keep counting up)"""
+        with self._lock:
+            self._record(("clear", list(self.tasks)))
         return "✅ All tasks cleared"
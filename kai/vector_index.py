@@ -0,0 +1,206 @@
+"""
+Vector index - semantic recall over conversation messages and study notes
+NumPy matrix persisted as a memory-mapped .npy file, metadata as JSON lines
+"""
+
+import atexit
+import json
+import os
+import re
+import zlib
+from threading import Lock
+
+import numpy as np
+
+from kai.metrics import metrics
+
+# Function words that would otherwise dominate short texts
+STOPWORDS = frozenset("""
+a an and are as at be but by can do does for from had has have he her his how i if in is it its
+me my of on or our she so that the their them then there these they this to was we were what
+when where which who why will with you your
+""".split())
+
+class HashingEmbedder:
+    """Deterministic bag-of-words embedding (signed feature hashing of words and bigrams)"""
+    
+    def __init__(self, dim=256):
+        self.dim = dim
+    
+    def embed(self, texts):
+        """
+        Embed a batch of texts
+        
+        Args:
+            texts: List of strings
+        
+        Returns:
+            float32 array of shape (len(texts), dim), rows L2-normalized
+        """
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        
+        for row, text in enumerate(texts):
+            words = [word for word in re.findall(r"\w+", text.lower()) if word not in STOPWORDS]
+            features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+            for feature in features:
+                digest = zlib.crc32(feature.encode("utf-8"))
+                sign = 1.0 if digest & 0x80000000 else -1.0
+                vectors[row, digest % self.dim] += sign
+        
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+class VectorIndex:
+    """Append-only embedding index with batched inserts and top-k cosine search"""
+    
+    def __init__(self, path="data/index/recall", embedder=None, batch_size=32, initial_capacity=1024):
+        """
+        Open (or create) an index
+        
+        Args:
+            path: File prefix; creates <path>.npy and <path>.jsonl
+            embedder: Object with .dim and .embed(texts) (default: HashingEmbedder)
+            batch_size: Pending inserts embedded together
+            initial_capacity: Rows allocated for a new matrix
+        """
+        self.embedder = embedder or HashingEmbedder()
+        self.batch_size = batch_size
+        self.matrix_file = f"{path}.npy"
+        self.meta_file = f"{path}.jsonl"
+        self.metadata = []
+        self._pending = []
+        self._lock = Lock()
+        
+        os.makedirs(os.path.dirname(self.matrix_file) or ".", exist_ok=True)
+        
+        if os.path.exists(self.meta_file):
+            with open(self.meta_file, 'r') as f:
+                self.metadata = [json.loads(line) for line in f if line.strip()]
+        
+        if os.path.exists(self.matrix_file):
+            self.matrix = np.load(self.matrix_file, mmap_mode="r+")
+            if self.matrix.shape[1] != self.embedder.dim:
+                raise ValueError(f"Index {path} has dim {self.matrix.shape[1]}, embedder has {self.embedder.dim}")
+            # Rows are written before their metadata, so an interrupted flush only leaves unused rows
+        else:
+            self.matrix = np.lib.format.open_memmap(
+                self.matrix_file, mode="w+", dtype=np.float32,
+                shape=(initial_capacity, self.embedder.dim)
+            )
+        
+        atexit.register(self.flush)
+    
+    def __len__(self):
+        return len(self.metadata) + len(self._pending)
+    
+    def add(self, text, meta=None, keep_text=True):
+        """
+        Queue a text for indexing (embedded in batches)
+        
+        Args:
+            text: Text to index
+            meta: Optional dict stored alongside (e.g. source, topic)
+            keep_text: Store the text in the metadata (loaded into RAM on
+                       every start); pass False when meta already points to
+                       where the text can be read back (e.g. a session log offset)
+        """
+        if not text or not text.strip():
+            return
+        
+        with self._lock:
+            self._pending.append((text, {**(meta or {}), "text": text} if keep_text else dict(meta or {})))
+            ready = len(self._pending) >= self.batch_size
+        
+        if ready:
+            self.flush()
+    
+    def add_many(self, texts, metas=None):
+        """Queue several texts at once"""
+        metas = metas or [None] * len(texts)
+        for text, meta in zip(texts, metas):
+            self.add(text, meta)
+    
+    def flush(self):
+        """Embed pending texts and append them to the matrix and metadata log"""
+        with self._lock:
+            if not self._pending:
+                return
+            
+            pending, self._pending = self._pending, []
+            with metrics.timer("storage_seconds", store="index", op="flush"):
+                vectors = self.embedder.embed([text for text, _ in pending])
+                start = len(self.metadata)
+                self._ensure_capacity(start + len(pending))
+                
+                self.matrix[start:start + len(pending)] = vectors
+                self.matrix.flush()
+                
+                with open(self.meta_file, 'a') as f:
+                    for _, item in pending:
+                        f.write(json.dumps(item) + "\n")
+                self.metadata.extend(item for _, item in pending)
+    
+    @metrics.timed("storage_seconds", store="index", op="search")
+    def search(self, query, k=3, where=None, min_score=0.0):
+        """
+        Find the most similar indexed texts
+        
+        Args:
+            query: Query text
+            k: Number of results
+            where: Optional dict of metadata fields that must match
+            min_score: Minimum cosine similarity
+        
+        Returns:
+            List of (score, metadata dict) tuples, best first
+        """
+        self.flush()
+        
+        with self._lock:
+            count = len(self.metadata)
+            if count == 0:
+                return []
+            
+            scores = self.matrix[:count] @ self.embedder.embed([query])[0]
+            
+            if where:
+                mask = np.array([
+                    all(meta.get(key) == value for key, value in where.items())
+                    for meta in self.metadata
+                ])
+                scores = np.where(mask, scores, -np.inf)
+            
+            k = min(k, count)
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            
+            return [(float(scores[i]), self.metadata[i]) for i in top
+                    if scores[i] > min_score and np.isfinite(scores[i])]
+    
+    def count(self, **where):
+        """Number of indexed (or pending) entries whose metadata matches"""
+        with self._lock:
+            entries = self.metadata + [item for _, item in self._pending]
+            return sum(1 for meta in entries if all(meta.get(key) == value for key, value in where.items()))
+    
+    def _ensure_capacity(self, rows):
+        """Grow the memory-mapped matrix by doubling (caller holds the lock)"""
+        capacity = self.matrix.shape[0]
+        if rows <= capacity:
+            return
+        
+        while capacity < rows:
+            capacity *= 2
+        
+        tmp_file = f"{self.matrix_file}.tmp"
+        grown = np.lib.format.open_memmap(tmp_file, mode="w+", dtype=np.float32,
+                                          shape=(capacity, self.embedder.dim))
+        used = len(self.metadata)
+        grown[:used] = self.matrix[:used]
+        grown.flush()
+        
+        del grown
+        del self.matrix
+        os.replace(tmp_file, self.matrix_file)
+        self.matrix = np.load(self.matrix_file, mmap_mode="r+")
@@ -0,0 +1,386 @@
+"""
+Generation worker - runs KaiLLM in a separate process
+The model stays resident in the worker; the REPL talks to it through a
+request/response queue pair, so tools and input handling never wait on the
+model's GIL-heavy forward passes. Generations can be cancelled (Ctrl-C)
+and time out, both cooperatively through stopping criteria.
+"""
+
+import atexit
+import inspect
+import itertools
+import multiprocessing
+import queue
+import signal
+import sys
+from concurrent.futures import Future
+from threading import Lock, Thread
+
+from kai.llm import CHAT_MAX_NEW_TOKENS, CHAT_STOP_SEQUENCES, ROLE_MARKERS
+from kai.memory import estimate_tokens
+from kai.metrics import metrics
+
+# Seconds past a request's timeout before an unresponsive worker is restarted
+TIMEOUT_GRACE = 10.0
+# Methods a client may call in the worker
+WORKER_METHODS = {"generate", "generate_batch", "chat", "stream", "reset_cache",
+                  "enable_batching", "disable_batching", "cache_stats"}
+
+def serve(requests, responses, model, llm_kwargs, cache_config):
+    """
+    Worker process entry point: load the model, then answer requests
+    
+    Messages in:  ("call", id, (method, args, kwargs)), ("cancel", None, None), None to stop
+    Messages out: ("ready", None, info), ("chunk", id, text),
+                  ("done", id, {"result", "timing", "assist", "metrics"}), ("error", id, message)
+    
+    "ready" and "done" carry the worker's metrics snapshot, so the parent's
+    /stats and exporter see generation metrics without asking for them.
+    """
+    # Ctrl-C in the terminal reaches the whole process group; the REPL decides what it means
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Status messages must not mix into the parent's stdout (batch mode JSONL)
+    sys.stdout = sys.stderr
+    
+    from kai.llm import KaiLLM
+    
+    if cache_config is not None:
+        from kai.cache import ResponseCache
+        llm_kwargs["response_cache"] = ResponseCache(**cache_config)
+    
+    llm = KaiLLM(model=model, **llm_kwargs)
+    responses.put(("ready", None, {
+        "available": llm.available,
+        "weight_bytes": llm.weight_bytes(),
+        "assistant": llm.assistant is not None,
+        "metrics": metrics.snapshot()
+    }))
+    
+    while True:
+        message = requests.get()
+        if message is None:
+            break
+        
+        kind, request_id, payload = message
+        if kind == "cancel":
+            llm.cancel()
+        else:
+            # One thread per request, so queued calls can be micro-batched and cancels get through
+            Thread(target=_handle, args=(llm, responses, request_id, payload), daemon=True).start()
+    
+    llm.close()
+
+def _handle(llm, responses, request_id, payload):
+    """Run one call in the worker, streaming chunks of generator results"""
+    method, args, kwargs = payload
+    try:
+        if method not in WORKER_METHODS:
+            raise ValueError(f"Unknown worker method: {method}")
+        
+        result = getattr(llm, method)(*args, **kwargs)
+        if inspect.isgenerator(result):
+            for chunk in result:
+                responses.put(("chunk", request_id, chunk))
+            result = None
+        elif method == "enable_batching":
+            # The MicroBatcher stays in the worker
+            result = None
+        
+        responses.put(("done", request_id, {"result": result, "timing": llm.last_timing,
+                                            "assist": llm.last_assist, "metrics": metrics.snapshot()}))
+    except Exception as e:
+        responses.put(("error", request_id, str(e)))
+
+class WorkerLLM:
+    """KaiLLM-compatible client for a model running in a worker process"""
+    
+    def __init__(self, model="distilgpt2", timeout=None, background=True, **llm_kwargs):
+        """
+        Start the worker process
+        
+        Args:
+            model: Hugging Face model ID loaded in the worker
+            timeout: Default seconds a generation may run (None = no limit)
+            background: Return while the worker loads (False waits until ready)
+            **llm_kwargs: KaiLLM arguments (greedy, seed, profile, assistant_model,
+                          response_cache - recreated inside the worker)
+        """
+        self.model_name = model
+        self.timeout = timeout
+        self.last_timing = {}
+        self.last_assist = {}
+        self.available = False
+        self.assistant = None
+        self.process = None
+        self.ready = Future()
+        self._weight_bytes = 0
+        self._tokenizer = None
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._lock = Lock()
+        # Latest metrics snapshot sent by the worker, merged into this process's /stats
+        self._metrics = ([], [])
+        metrics.add_source(self._worker_metrics)
+        
+        cache = llm_kwargs.pop("response_cache", None)
+        self._cache_config = None if cache is None else {
+            "cache_dir": cache.cache_dir,
+            "max_memory_entries": cache.max_memory_entries,
+            "max_disk_bytes": cache.max_disk_bytes
+        }
+        self._llm_kwargs = {**llm_kwargs, "timeout": timeout}
+        
+        self._start()
+        atexit.register(self.close)
+        if not background:
+            self.wait_ready()
+    
+    @property
+    def pid(self):
+        """Worker process id"""
+        return self.process.pid if self.process else None
+    
+    def _start(self):
+        """Spawn the worker and its response reader"""
+        context = multiprocessing.get_context("spawn")
+        self._requests = context.Queue()
+        self._responses = context.Queue()
+        self.process = context.Process(
+            target=serve,
+            args=(self._requests, self._responses, self.model_name, self._llm_kwargs, self._cache_config),
+            daemon=True,
+            name="kai-generation-worker"
+        )
+        self.process.start()
+        Thread(target=self._read, args=(self.process, self._responses, self.ready),
+               daemon=True, name="kai-worker-reader").start()
+    
+    def _read(self, process, responses, ready):
+        """Deliver worker messages to waiting calls; fail them if the worker dies"""
+        while True:
+            try:
+                kind, request_id, payload = responses.get(timeout=1.0)
+            except queue.Empty:
+                if process.is_alive():
+                    continue
+                break
+            except (EOFError, OSError):
+                break
+            
+            # Concurrent calls may finish out of order: keep the newest snapshot (a fresh worker starts over)
+            if kind == "ready" or (kind == "done" and _observations(payload["metrics"]) >= _observations(self._metrics)):
+                self._metrics = payload["metrics"]
+            
+            if kind == "ready":
+                if payload["available"]:
+                    self._load_tokenizer()
+                self.available = payload["available"]
+                self.assistant = payload["assistant"] or None
+                self._weight_bytes = payload["weight_bytes"]
+                ready.set_result(self.available)
+                continue
+            
+            with self._lock:
+                inbox = self._pending.get(request_id)
+            if inbox is not None:
+                inbox.put((kind, payload))
+        
+        # Worker gone (crashed or restarted)
+        if not ready.done():
+            ready.set_result(False)
+        if process is self.process:
+            self.available = False
+            self._fail_pending("generation worker stopped")
+    
+    def _load_tokenizer(self):
+        """Local tokenizer copy so count_tokens() needs no round trip"""
+        try:
+            from transformers import AutoTokenizer
+            self._tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        except Exception:
+            self._tokenizer = None
+    
+    def _fail_pending(self, message):
+        """End every waiting call with an error"""
+        with self._lock:
+            inboxes = list(self._pending.values())
+        for inbox in inboxes:
+            inbox.put(("error", message))
+    
+    def _call(self, method, *args, timeout=None, **kwargs):
+        """
+        Send a call to the worker
+        
+        Returns:
+            (request id, inbox queue of (kind, payload) messages, hard deadline in seconds or None)
+        """
+        # Deadlines start once the model is loaded
+        self.wait_ready()
+        if not self.process.is_alive():
+            raise RuntimeError("generation worker stopped")
+        request_id = next(self._ids)
+        inbox = queue.Queue()
+        with self._lock:
+            self._pending[request_id] = inbox
+        
+        limit = timeout if timeout is not None else self.timeout
+        if method in ("generate", "generate_batch", "chat", "stream"):
+            kwargs["timeout"] = limit
+        self._requests.put(("call", request_id, (method, args, kwargs)))
+        return request_id, inbox, limit + TIMEOUT_GRACE if limit else None
+    
+    def _receive(self, request_id, inbox, deadline):
+        """
+        Yield ("chunk", text) messages, then return the final payload
+        
+        A worker that misses its deadline by TIMEOUT_GRACE is restarted.
+        """
+        try:
+            while True:
+                try:
+                    kind, payload = inbox.get(timeout=deadline)
+                except queue.Empty:
+                    self.restart()
+                    raise TimeoutError(f"generation worker did not answer within {deadline:g}s; restarted")
+                
+                if kind == "chunk":
+                    yield payload
+                elif kind == "error":
+                    raise RuntimeError(payload)
+                else:
+                    self.last_timing = payload["timing"]
+                    self.last_assist = payload["assist"]
+                    return payload["result"]
+        finally:
+            with self._lock:
+                self._pending.pop(request_id, None)
+    
+    def _invoke(self, method, *args, timeout=None, **kwargs):
+        """Call a method in the worker and wait for its result"""
+        receiver = self._receive(*self._call(method, *args, timeout=timeout, **kwargs))
+        try:
+            while True:
+                next(receiver)
+        except StopIteration as done:
+            return done.value
+    
+    def _stream(self, method, *args, timeout=None, **kwargs):
+        """Call a generator method in the worker, yielding its chunks as they arrive"""
+        try:
+            yield from self._receive(*self._call(method, *args, timeout=timeout, **kwargs))
+        except GeneratorExit:
+            # The reader stopped listening (e.g. Ctrl-C); stop the worker too
+            self.cancel()
+            raise
+        except (RuntimeError, TimeoutError) as e:
+            yield f"\n❌ Error generating response: {e}"
+    
+    def generate(self, prompt, system_prompt=None, max_new_tokens=CHAT_MAX_NEW_TOKENS, timeout=None,
+                 stop=CHAT_STOP_SEQUENCES):
+        """Generate text response in the worker (see KaiLLM.generate)"""
+        try:
+            return self._invoke("generate", prompt, system_prompt=system_prompt,
+                                max_new_tokens=max_new_tokens, timeout=timeout, stop=stop)
+        except (RuntimeError, TimeoutError) as e:
+            return f"❌ Error generating response: {e}"
+    
+    def generate_batch(self, prompts, system_prompt=None, max_new_tokens=100, timeout=None, stop=ROLE_MARKERS):
+        """Generate responses for several prompts in the worker (see KaiLLM.generate_batch)"""
+        try:
+            return self._invoke("generate_batch", prompts, system_prompt=system_prompt,
+                                max_new_tokens=max_new_tokens, timeout=timeout, stop=stop)
+        except (RuntimeError, TimeoutError) as e:
+            return [f"❌ Error generating response: {e}"] * len(prompts)
+    
+    def stream(self, prompt, system_prompt=None, max_new_tokens=CHAT_MAX_NEW_TOKENS, timeout=None,
+               stop=CHAT_STOP_SEQUENCES):
+        """Generator of text chunks produced in the worker (see KaiLLM.stream)"""
+        return self._stream("stream", prompt, system_prompt=system_prompt,
+                            max_new_tokens=max_new_tokens, timeout=timeout, stop=stop)
+    
+    def chat(self, messages, stream=False, max_new_tokens=CHAT_MAX_NEW_TOKENS, cache_key="default", timeout=None):
+        """Chat-style interface (see KaiLLM.chat)"""
+        chunks = self._stream("chat", messages, stream=True, max_new_tokens=max_new_tokens,
+                              cache_key=cache_key, timeout=timeout)
+        if stream:
+            return chunks
+        return "".join(chunks).strip()
+    
+    def reset_cache(self, cache_key=None):
+        """Drop cached prefix KV state in the worker"""
+        self._invoke("reset_cache", cache_key)
+    
+    def cache_stats(self):
+        """Response cache counters of the worker's cache (None without one or when it is unreachable)"""
+        if self._cache_config is None:
+            return None
+        try:
+            return self._invoke("cache_stats")
+        except (RuntimeError, TimeoutError):
+            return None
+    
+    def enable_batching(self, max_batch_size=8, max_wait_ms=20):
+        """Micro-batch concurrent calls inside the worker"""
+        self._invoke("enable_batching", max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+    
+    def disable_batching(self):
+        """Stop micro-batching inside the worker"""
+        if self.process is not None and self.process.is_alive():
+            self._invoke("disable_batching")
+    
+    def cancel(self):
+        """Stop every running generation in the worker after its current token"""
+        if self.process is not None and self.process.is_alive():
+            self._requests.put(("cancel", None, None))
+    
+    def restart(self):
+        """Kill the worker and start a fresh one (the model is loaded again)"""
+        old = self.process
+        self.ready = Future()
+        self.available = False
+        self._start()
+        self._fail_pending("generation worker restarted")
+        old.kill()
+        old.join()
+    
+    def close(self):
+        """Stop the worker process"""
+        metrics.remove_source(self._worker_metrics)
+        if self.process is None:
+            return
+        if self.process.is_alive():
+            self._requests.put(None)
+            self.process.join(timeout=5)
+            if self.process.is_alive():
+                self.process.kill()
+                self.process.join()
+        self._fail_pending("generation worker stopped")
+    
+    def _worker_metrics(self):
+        """The worker's latest metrics, labelled with its model (a metrics source)"""
+        histograms, counters = self._metrics
+        return ([(name, {**labels, "model": self.model_name}, summary) for name, labels, summary in histograms],
+                [(name, {**labels, "model": self.model_name}, value) for name, labels, value in counters])
+    
+    def weight_bytes(self):
+        """Memory held by the worker's model weights"""
+        return self._weight_bytes
+    
+    def wait_ready(self, timeout=None):
+        """Block until the worker has loaded the model; True if it is available"""
+        return self.ready.result(timeout=timeout)
+    
+    def count_tokens(self, text):
+        """Count prompt tokens (local tokenizer once the worker is ready, else an estimate)"""
+        if self._tokenizer is not None:
+            return len(self._tokenizer(text).input_ids)
+        return estimate_tokens(text)
+    
+    def is_available(self):
+        """Check if the worker loaded its model (waits for it)"""
+        return self.wait_ready()
+
+def _observations(snapshot):
+    """Values recorded in a metrics snapshot (grows with every observation)"""
+    histograms, counters = snapshot
+    return sum(summary["count"] for _, _, summary in histograms) + sum(value for _, _, value in counters)
@@ -5,10 +5,21 @@ Main entry point for the KAI assistant
 100% Local AI - No external servers required
 """
 
+import argparse
+import os
 import sys
-from kai.llm import KaiLLM
+from kai.batch import BatchRunner
+from kai.cache import ResponseCache
+from kai.llm import SYSTEM_PROMPT
 from kai.router import CommandRouter
 from kai.memory import Memory
+from kai.metrics import start_exporter
+from kai.model_pool import ModelPool
+from kai.sessions import SessionLog
+from kai.vector_index import VectorIndex
+
+# Prompt budget for system prompt + conversation (leaves room for the reply)
+MAX_PROMPT_TOKENS = 768
 
 def print_banner():
     """Display welcome banner"""
@@ -19,25 +30,153 @@ def print_banner():
     print("\n💡 Type /help for commands or just chat naturally")
     print("   Type 'exit', 'quit', or 'bye' to exit\n")
 
+def print_response(response, cancel=None):
+    """
+    Display a response, rendering streamed chunks as they arrive
+    
+    Args:
+        response: Response string or iterable of text chunks
+        cancel: Called when Ctrl-C interrupts a streamed response
+                (the generation stops, KAI keeps running)
+        
+    Returns:
+        Full response text (what was shown before an interruption)
+    """
+    if isinstance(response, str):
+        print(f"\nKAI: {response}\n")
+        return response
+    
+    print("\nKAI: ", end="", flush=True)
+    chunks = []
+    try:
+        for chunk in response:
+            print(chunk, end="", flush=True)
+            chunks.append(chunk)
+    except KeyboardInterrupt:
+        if cancel is not None:
+            cancel()
+        response.close()
+        print("\n⏹️  Cancelled", end="")
+    print("\n")
+    return "".join(chunks).strip()
+
+def print_timing(timing):
+    """Display time-to-first-token and total latency of the last generation"""
+    if not timing:
+        return
+    
+    ttft = timing.get("ttft")
+    first = f"{ttft:.2f}s" if ttft is not None else "n/a"
+    cached = " (cached)" if timing.get("cached") else ""
+    print(f"⏱️  First token: {first} | Total: {timing['total']:.2f}s{cached}\n")
+
+def wait_for_model(llm):
+    """
+    Block until the model is loaded, explaining why if it takes a while
+    
+    Returns:
+        True if the model is available for chat
+    """
+    if not llm.ready.done():
+        print("\n⏳ KAI model is still loading, one moment...")
+    
+    if llm.wait_ready():
+        return True
+    
+    print("\n⚠️  WARNING: KAI model failed to load!")
+    print("   Install required packages:")
+    print("   pip install torch transformers")
+    print("\n   Commands still work, chat doesn't.\n")
+    return False
+
+def parse_args():
+    """Command-line options"""
+    parser = argparse.ArgumentParser(description="KAI - local AI assistant")
+    parser.add_argument("--batch", metavar="FILE",
+                        help="Run commands/prompts from FILE ('-' for stdin), one per line; "
+                             "JSONL results go to stdout")
+    parser.add_argument("--llm-workers", type=int, default=0,
+                        help="Batch mode: prompts generated concurrently (default: one at a time)")
+    parser.add_argument("--no-model", action="store_true",
+                        help="Batch mode: don't load the model (commands only)")
+    parser.add_argument("--in-process", action="store_true",
+                        help="Run models inside this process instead of a generation worker")
+    parser.add_argument("--session", default="default",
+                        help="Conversation to resume (saved under data/sessions/)")
+    return parser.parse_args()
+
+def run_batch(args, llm, index, out, pool=None):
+    """Non-interactive mode: stream lines through the router, results as JSONL to out"""
+    router = CommandRouter(llm=llm, index=index, prefetch=False, pool=pool)
+    runner = BatchRunner(router, llm=llm, system_prompt=SYSTEM_PROMPT,
+                         llm_workers=args.llm_workers, out=out)
+    
+    if args.batch == "-":
+        runner.run(sys.stdin)
+    else:
+        with open(args.batch, 'r', encoding='utf-8') as f:
+            runner.run(f)
+    
+    runner.report()
+    index.flush()
+
 def main():
     """Main conversation loop"""
+    args = parse_args()
+    
+    # Batch mode owns stdout for JSONL; status messages go to stderr
+    out = sys.stdout
+    if args.batch:
+        sys.stdout = sys.stderr
+    
+    # KAI_METRICS_FILE=data/metrics.prom writes /stats numbers for scraping
+    start_exporter()
+    
+    # Initialize Local KAI (KAI_GREEDY=1 or KAI_SEED=<n> make replies repeatable and cacheable)
+    # KAI_MODEL picks the chat model, KAI_STUDY_MODEL an optional separate model for quizzes,
+    # KAI_ASSISTANT_MODEL a draft model for assisted decoding of KAI_MODEL, and
+    # KAI_MODEL_MEMORY_MB the RSS budget above which unused models are unloaded, and
+    # KAI_GENERATION_TIMEOUT the seconds a reply may take before it is cut off.
+    # Models load in worker processes; commands work while they warm up and generate
+    pool = None
+    llm = None
+    if not args.no_model:
+        model = os.environ.get("KAI_MODEL", "distilgpt2")
+        pool = ModelPool(
+            default_model=model,
+            worker=not args.in_process,
+            timeout=float(os.environ["KAI_GENERATION_TIMEOUT"]) if os.environ.get("KAI_GENERATION_TIMEOUT") else None,
+            greedy=os.environ.get("KAI_GREEDY") == "1",
+            seed=int(os.environ["KAI_SEED"]) if os.environ.get("KAI_SEED") else None,
+            response_cache=ResponseCache()
+        )
+        if os.environ.get("KAI_ASSISTANT_MODEL"):
+            pool.configure(model, assistant_model=os.environ["KAI_ASSISTANT_MODEL"])
+        if os.environ.get("KAI_STUDY_MODEL"):
+            pool.use(os.environ["KAI_STUDY_MODEL"], route="study")
+        pool.get(model)
+        llm = pool.handle("chat")
+    
+    # Initialize router and memory (sharing one recall index over chat and notes)
+    index = VectorIndex("data/index/recall")
     
-    # Initialize Local KAI
-    llm = KaiLLM(model="distilgpt2")
+    if args.batch:
+        run_batch(args, llm, index, out, pool)
+        return
     
-    # Check if model loaded
-    if not llm.is_available():
-        print("⚠️  WARNING: KAI model failed to load!")
-        print("   Install required packages:")
-        print("   pip install torch transformers")
-        print("\n   Continuing anyway (commands will work, chat won't)...\n")
+    if llm is None:
+        print("❌ --no-model only applies to --batch mode")
+        return
     
-    # Initialize router and memory
-    router = CommandRouter(llm=llm)
-    memory = Memory()
+    router = CommandRouter(stream=True, index=index, pool=pool)
+    memory = Memory(token_counter=llm.count_tokens, max_tokens=MAX_PROMPT_TOKENS, index=index,
+                    session=args.session, log=SessionLog(args.session))
+    memory.on_reset(llm.reset_cache)
     
     # Display banner
     print_banner()
+    if memory.total_messages():
+        print(f"📂 Resumed session '{args.session}' ({memory.total_messages()} messages)\n")
     
     # Main loop
     while True:
@@ -56,29 +195,34 @@ def main():
             
             # Route command or send to LLM
             if router.is_command(user_input):
+                # Quizzes run on the study route's model; timing is shown only if it generated
+                study = pool.handle("study") if user_input.split(None, 1)[0].lower() == "/study" else None
+                before = study.last_timing if study is not None else None
+                
                 # Execute command
                 response = router.route(user_input)
+                print_response(response, cancel=pool.cancel)
+                
+                if study is not None and study.last_timing is not before:
+                    print_timing(study.last_timing)
             else:
+                # Wait for the background model load before the first chat
+                if not wait_for_model(llm):
+                    continue
+                
                 # Store user message in memory
                 memory.add_message("user", user_input)
                 
-                # Build conversation context from memory
-                messages = [
-                    {"role": "system", "content": "You are KAI (Kesh, Assistant/Automated, Intelligence), a helpful and friendly AI assistant."}
-                ]
+                # Build conversation context from memory (within the prompt token budget)
+                messages = memory.build_messages(SYSTEM_PROMPT, query=user_input)
                 
-                # Add conversation history
-                for msg in memory.get_history(limit=10):
-                    messages.append({"role": msg["role"], "content": msg["content"]})
-                
-                # Send to LLM for conversation
-                response = llm.chat(messages)
+                # Send to LLM for conversation and render as it streams
+                # Ctrl-C stops the reply; the partial reply is kept
+                response = print_response(llm.chat(messages, stream=True), cancel=pool.cancel)
+                print_timing(llm.last_timing)
                 
                 # Store assistant response in memory
                 memory.add_message("assistant", response)
-            
-            # Display response
-            print(f"\nKAI: {response}\n")
         
         except KeyboardInterrupt:
             print("\n\n👋 Goodbye!\n")
@@ -90,6 +234,8 @@ def main():
         
         except Exception as e:
             print(f"\n❌ Error: {e}\n")
+    
+    memory.close()
 
 if __name__ == "__main__":
     main()